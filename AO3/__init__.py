@@ -1,14 +1,47 @@
-from . import extra, utils
-from .tags import Tag
-from .chapters import Chapter
-from .comments import Comment
-from .search import Search
-from .tag_search import TagSearch
-from .quote_search import QuoteSearch
-from .series import Series
-from .session import GuestSession, Session
-from .users import User
-from .works import Work
-from .workgroup import Workgroup
+import importlib
+
+# Public classes are imported the first time they're used, so 'import AO3' doesn't pull in
+# bs4, requests, etc. until something needs them (see benchmarks/import_time.py)
+_EXPORTS = {
+    "Tag": "tags",
+    "Chapter": "chapters",
+    "Comment": "comments",
+    "BulkExporter": "bulk",
+    "BulkLoader": "bulk",
+    "CommentSync": "comment_sync",
+    "ParsePool": "parsing",
+    "ParseProfiler": "instrumentation",
+    "Search": "search",
+    "TagSearch": "tag_search",
+    "TagUsageCollector": "tag_usage",
+    "TagUsageSeries": "tag_usage",
+    "PhraseScanner": "phrase_scanner",
+    "QuoteIndex": "quote_index",
+    "QuoteSearch": "quote_search",
+    "RequestMetrics": "instrumentation",
+    "Series": "series",
+    "GuestSession": "session",
+    "Session": "session",
+    "SessionManager": "session_manager",
+    "User": "users",
+    "Work": "works",
+    "Workgroup": "workgroup",
+}
+_SUBMODULES = ("extra", "instrumentation", "serialization", "utils")
+
+__all__ = list(_SUBMODULES) + list(_EXPORTS)
 
 VERSION = "2.5.4"
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from concurrent import futures
+
+import requests
+
+from . import utils
+from .pagination import RetryPolicy
+
+_END = object()
+
+
+class BulkLoader:
+    """
+    Loads many works with a bounded pool of workers and yields them as they complete.
+
+    Every worker fetches a work page, parses it and (optionally) extracts its chapters, with all
+    requests going through the shared rate limiter. Only a bounded number of IDs is scheduled at a
+    time, so 'ids' can be a long (or lazy) iterable. Rate-limit errors are retried with the given
+    retry policy; any other error is reported for that ID and the rest keep loading.
+
+    Iterating yields (workid, work, error) tuples in completion order, where either work or error
+    is None. BulkLoader.stats holds the progress so far.
+    """
+
+    def __init__(self, ids, session=None, load_chapters=True, max_workers=4, retry=None, progress=None, metadata_only=False):
+        """Creates a new bulk loader
+
+        Args:
+            ids (iterable): Work IDs to load
+            session (AO3.Session, optional): Session used for every work. Defaults to None.
+            load_chapters (bool, optional): Also extract the chapters of every work. Defaults to True.
+            max_workers (int, optional): Maximum number of works being loaded at once. Defaults to 4.
+            retry (AO3.pagination.RetryPolicy, optional): How to retry rate-limit errors. Defaults to RetryPolicy(max_retries=5).
+            progress (callable, optional): Called with BulkLoader.stats after every work. Defaults to None.
+            metadata_only (bool, optional): Only request the first chapter's page of every work (see Work.reload). Defaults to False.
+        """
+
+        self.ids = ids
+        self.session = session
+        self.load_chapters = load_chapters
+        self.max_workers = max(1, max_workers)
+        self.retry = RetryPolicy(max_retries=5) if retry is None else retry
+        self.progress = progress
+        self.metadata_only = metadata_only
+
+        self.stats = {"scheduled": 0, "loaded": 0, "failed": 0, "retries": 0, "in_flight": 0, "elapsed": 0.0, "rate": 0.0}
+        self._lock = threading.Lock()
+        self._backoff = 0
+        self._resume_at = 0
+
+    def _retry(self, function, *args, errors=(utils.HTTPError,)):
+        attempt = 0
+        while True:
+            with self._lock:
+                wait = self._resume_at - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result = function(*args)
+            except errors:
+                attempt += 1
+                if not self.retry.should_retry(attempt):
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                    self._backoff = self.retry.next_backoff(self._backoff)
+                    self._resume_at = max(self._resume_at, time.time() + self._backoff)
+                continue
+            with self._lock:
+                self._backoff /= 2
+            return result
+
+    def _load_work(self, workid):
+        from .works import Work
+
+        work = Work(workid, session=self.session, load=False)
+        work.reload(self.load_chapters, metadata_only=self.metadata_only)
+        return work
+
+    def _load(self, workid):
+        return self._retry(self._load_work, workid)
+
+    def __iter__(self):
+        start = time.time()
+        ids = iter(self.ids)
+        exhausted = False
+        with futures.ThreadPoolExecutor(self.max_workers) as executor:
+            pending = {}
+            try:
+                while True:
+                    # Keep a few IDs queued so the workers never wait for the consumer
+                    while not exhausted and len(pending) < 2*self.max_workers:
+                        workid = next(ids, _END)
+                        if workid is _END:
+                            exhausted = True
+                            break
+                        pending[executor.submit(self._load, workid)] = getattr(workid, "id", workid)
+                        self.stats["scheduled"] += 1
+                    if not pending:
+                        break
+                    self.stats["in_flight"] = len(pending)
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        workid = pending.pop(future)
+                        try:
+                            result = (workid, future.result(), None)
+                            self.stats["loaded"] += 1
+                        except Exception as e:
+                            result = (workid, None, e)
+                            self.stats["failed"] += 1
+                        self.stats["in_flight"] = len(pending)
+                        self.stats["elapsed"] = time.time() - start
+                        self.stats["rate"] = (self.stats["loaded"] + self.stats["failed"]) / max(self.stats["elapsed"], 1e-9)
+                        if self.progress is not None:
+                            self.progress(dict(self.stats))
+                        yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class BulkExporter(BulkLoader):
+    """
+    Downloads the exports (PDF, EPUB, ...) of many works with a bounded pool of workers.
+
+    Only the first chapter's page of every work is requested to find its download links, and
+    every export is streamed to disk with Work.download_to_file. Rate-limit errors and dropped
+    connections are retried with the given retry policy, resuming interrupted downloads from
+    where they stopped; any other error is reported for that work and the rest keep downloading.
+
+    Iterating yields (workid, filename, error) tuples in completion order, where either filename
+    or error is None. BulkExporter.stats holds the progress so far.
+    """
+
+    def __init__(self, works, directory=".", filetype="PDF", filename="{id}.{ext}", session=None, max_workers=4, retry=None, progress=None):
+        """Creates a new bulk exporter
+
+        Args:
+            works (iterable): Work IDs, or AO3.Work objects (which are used as they are if already loaded)
+            directory (str, optional): Directory where the files are saved. Defaults to ".".
+            filetype (str, optional): Desired filetype (AZW3, EPUB, HTML, MOBI or PDF). Defaults to "PDF".
+            filename (str, optional): File name template, formatted with the work's id and the file extension. Defaults to "{id}.{ext}".
+            session (AO3.Session, optional): Session used for every work. Defaults to None.
+            max_workers (int, optional): Maximum number of works being downloaded at once. Defaults to 4.
+            retry (AO3.pagination.RetryPolicy, optional): How to retry rate-limit and connection errors. Defaults to RetryPolicy(max_retries=5).
+            progress (callable, optional): Called with BulkExporter.stats after every work. Defaults to None.
+        """
+
+        super().__init__(works, session, False, max_workers, retry, progress, metadata_only=True)
+        self.directory = directory
+        self.filetype = filetype
+        self.filename = filename
+
+    def _export(self, work):
+        path = os.path.join(self.directory, self.filename.format(id=work.id, ext=self.filetype.lower()))
+        work.download_to_file(path, self.filetype)
+        return path
+
+    def _load(self, work):
+        from .works import Work
+
+        if not isinstance(work, Work):
+            work = self._retry(self._load_work, work)
+        elif not work.loaded:
+            self._retry(lambda: work.reload(metadata_only=True))
+        # A connection dropped mid-download is resumed from the part file
+        return self._retry(self._export, work, errors=(utils.HTTPError, requests.RequestException))
@@ -1,12 +1,50 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime
 from functools import cached_property
 
 import bs4
 from bs4 import BeautifulSoup
 
 from . import threadable, utils
-from .comments import Comment
+from .comments import iter_comments
 from .requester import requester
-from .users import User
+
+
+def _paragraph_text(div):
+    """Returns the text of every <p> and <center> in 'div', one per line, each followed by the text right after it.
+
+    The tree is walked once: strings are collected for every paragraph that contains them and all the
+    fragments are joined at the end, instead of searching for the paragraphs and then walking each one.
+    """
+
+    string_types = (bs4.element.NavigableString, bs4.element.CData)
+    blocks = []
+    open_blocks = []
+    block_end = None
+    for element in div.descendants:
+        while element is block_end:
+            open_blocks.pop()
+            block_end = open_blocks[-1][0] if open_blocks else None
+        cls = type(element)
+        if cls in string_types:
+            for _, parts in open_blocks:
+                parts.append(element)
+        elif cls is bs4.element.Tag and (element.name == "p" or element.name == "center"):
+            parts = []
+            block_end = element._last_descendant().next_element
+            open_blocks.append((block_end, parts))
+            sibling = element.next_sibling
+            blocks.append((parts, sibling if isinstance(sibling, bs4.element.NavigableString) else ""))
+
+    fragments = []
+    for parts, tail in blocks:
+        fragments.append("".join(parts).replace("\n", ""))
+        fragments.append("\n")
+        fragments.append(tail)
+    return "".join(fragments)
 
 
 class Chapter:
@@ -19,6 +57,7 @@ class Chapter:
         self._work = work
         self.id = chapterid
         self._soup = None
+        self._chapter_list = None
         if load:
             self.reload()
             
@@ -82,6 +121,11 @@ class Chapter:
                 if attr in self.__dict__:
                     delattr(self, attr)
         
+        if self._chapter_list is not None:
+            self._soup = None
+            self._chapter_list.load(self)
+            return
+        
         if self.work is None:
             soup = self.request(f"https://archiveofourown.org/chapters/{self.id}?view_adult=true")
             workid = soup.find("li", {"class": "chapter entire"})
@@ -95,6 +139,32 @@ class Chapter:
             if chapter == self:
                 self._soup = chapter._soup
         
+    def _load_page(self):
+        """Requests this chapter's own page and returns only the chapter's content"""
+        
+        soup = self.request(f"https://archiveofourown.org/works/{self._work.id}/chapters/{self.id}?view_adult=true")
+        chapters_div = soup.find(attrs={"id": "chapters"})
+        if chapters_div is None:
+            raise utils.InvalidIdError("Cannot find chapter")
+        chapter = chapters_div.find("div", {"class": "chapter"})
+        return chapters_div if chapter is None else chapter
+        
+    def _unload(self):
+        """Drops this chapter's page and everything parsed from it, except for its title and number"""
+        
+        self._soup = None
+        for attr in ("text", "words", "summary", "start_notes", "end_notes"):
+            if attr in self.__dict__:
+                delattr(self, attr)
+        
+    def _ensure_loaded(self):
+        # Callers parse the returned page rather than self._soup, which the chapter list
+        # can drop at any time to make room for another chapter
+        soup = self._soup
+        if soup is None and self._chapter_list is not None:
+            soup = self._chapter_list.load(self)
+        return soup
+        
     @threadable.threadable
     def comment(self, comment_text, email="", name="", pseud=None):
         """Leaves a comment on this chapter.
@@ -114,7 +184,7 @@ class Chapter:
         if self.id is None:
             return self._work.comment(comment_text, email, name, pseud)
         
-        if not self.loaded:
+        if not self.loaded and self._chapter_list is None:
             raise utils.UnloadedError("Chapter isn't loaded. Have you tried calling Chapter.reload()?")
         
         if self._session is None:
@@ -123,70 +193,48 @@ class Chapter:
         if self.id is not None:
             return utils.comment(self, comment_text, self._session, False, email=email, name=name, pseud=pseud)
     
-    def get_comments(self, maximum=None):
+    def get_comments(self, maximum=None, max_workers=4):
         """Returns a list of all threads of comments in the chapter. This operation can take a very long time.
         Because of that, it is recomended that you set a maximum number of comments. 
-        Duration: ~ (0.13 * n_comments) seconds or 2.9 seconds per comment page
+        Comment pages after the first one are fetched concurrently, so the duration scales with the
+        request rate allowed by the rate limiter rather than with the ~2.9 seconds per comment page.
 
         Args:
             maximum (int, optional): Maximum number of comments to be returned. None -> No maximum
+            max_workers (int, optional): Maximum number of comment pages being fetched at once. Defaults to 4.
 
         Raises:
-            ValueError: Invalid chapter number
-            IndexError: Invalid chapter number
             utils.UnloadedError: Chapter isn't loaded
 
         Returns:
             list: List of comments
         """
         
+        return list(self.iter_comments(maximum, max_workers))
+    
+    def iter_comments(self, maximum=None, max_workers=4):
+        """Returns a generator that yields the comment threads of this chapter as their pages arrive.
+        Stops requesting pages once 'maximum' comments have been yielded.
+
+        Args:
+            maximum (int, optional): Maximum number of comments to be returned. None -> No maximum
+            max_workers (int, optional): Maximum number of comment pages being fetched at once. Defaults to 4.
+
+        Raises:
+            utils.UnloadedError: Chapter isn't loaded
+
+        Returns:
+            generator: The generator object
+        """
+        
         if self.id is None:
-            return self._work.get_comments(maximum=maximum)
+            return self._work.iter_comments(maximum, max_workers)
         
-        if not self.loaded:
+        if not self.loaded and self._chapter_list is None:
             raise utils.UnloadedError("Chapter isn't loaded. Have you tried calling Chapter.reload()?")
             
         url = f"https://archiveofourown.org/chapters/{self.id}?page=%d&show_comments=true&view_adult=true"
-        soup = self.request(url%1)
-        
-        pages = 0
-        div = soup.find("div", {"id": "comments_placeholder"})
-        ol = div.find("ol", {"class": "pagination actions"})
-        if ol is None:
-            pages = 1
-        else:
-            for li in ol.findAll("li"):
-                if li.getText().isdigit():
-                    pages = int(li.getText())   
-        
-        comments = []
-        for page in range(pages):
-            if page != 0:
-                soup = self.request(url%(page+1))
-            ol = soup.find("ol", {"class": "thread"})
-            for li in ol.findAll("li", {"role": "article"}, recursive=False):
-                if maximum is not None and len(comments) >= maximum:
-                    return comments
-                id_ = int(li.attrs["id"][8:])
-                
-                header = li.find("h4", {"class": ("heading", "byline")})
-                if header is None:
-                    author = None
-                else:
-                    author = User(str(header.a.text), self._session, False)
-                    
-                if li.blockquote is not None:
-                    text = li.blockquote.getText()
-                else:
-                    text = ""                  
-                
-                comment = Comment(id_, self, session=self._session, load=False)       
-                setattr(comment, "authenticity_token", self.authenticity_token)
-                setattr(comment, "author", author)
-                setattr(comment, "text", text)
-                comment._thread = None
-                comments.append(comment)
-        return comments
+        return iter_comments(self, url, maximum, max_workers)
         
     def get_images(self):
         """Gets all images from this work
@@ -198,7 +246,8 @@ class Chapter:
             tuple: Pairs of image urls and the paragraph number
         """
         
-        div = self._soup.find("div", {"class": "userstuff"})
+        soup = self._ensure_loaded()
+        div = soup.find("div", {"class": "userstuff"})
         images = []
         line = 0
         for p in div.findAll("p"):
@@ -226,23 +275,20 @@ class Chapter:
     @cached_property
     def text(self):
         """This chapter's text"""
-        text = ""
+        soup = self._ensure_loaded()
         if self.id is not None:
-            div = self._soup.find("div", {"role": "article"})
+            div = soup.find("div", {"role": "article"})
         else:
-            div = self._soup
-        for p in div.findAll(("p", "center")):
-            text += p.getText().replace("\n", "") + "\n"
-            if isinstance(p.next_sibling, bs4.element.NavigableString):
-                text += str(p.next_sibling)
-        return text
+            div = soup
+        return _paragraph_text(div)
 
     @cached_property
     def title(self):
         """This chapter's title"""
         if self.id is None:
             return self.work.title
-        preface_group = self._soup.find("div", {"class": ("chapter", "preface", "group")})
+        soup = self._ensure_loaded()
+        preface_group = soup.find("div", {"class": ("chapter", "preface", "group")})
         if preface_group is None:
             return str(self.number)
         title = preface_group.find("h3", {"class": "title"})
@@ -255,7 +301,13 @@ class Chapter:
         """This chapter's number"""
         if self.id is None:
             return 1
-        return int(self._soup["id"].split("-")[-1])
+        soup = self._ensure_loaded()
+        return int(soup["id"].split("-")[-1])
+    
+    @cached_property
+    def fingerprint(self):
+        """Hash of this chapter's text, used to tell whether it was edited"""
+        return hashlib.blake2b(self.text.encode(), digest_size=16).hexdigest()
     
     @cached_property
     def words(self):
@@ -265,7 +317,8 @@ class Chapter:
     @cached_property
     def summary(self):
         """Text from this chapter's summary"""
-        notes = self._soup.find("div", {"id": "summary"})
+        soup = self._ensure_loaded()
+        notes = soup.find("div", {"id": "summary"})
         if notes is None:
             return ""
         text = ""
@@ -276,7 +329,8 @@ class Chapter:
     @cached_property
     def start_notes(self):
         """Text from this chapter's start notes"""
-        notes = self._soup.find("div", {"id": "notes"})
+        soup = self._ensure_loaded()
+        notes = soup.find("div", {"id": "notes"})
         if notes is None:
             return ""
         text = ""
@@ -287,7 +341,8 @@ class Chapter:
     @cached_property
     def end_notes(self):
         """Text from this chapter's end notes"""
-        notes = self._soup.find("div", {"id": f"chapter_{self.number}_endnotes"})
+        soup = self._ensure_loaded()
+        notes = soup.find("div", {"id": f"chapter_{self.number}_endnotes"})
         if notes is None:
             return ""
         text = ""
@@ -329,3 +384,92 @@ class Chapter:
         if req.status_code == 429:
             raise utils.HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
         return req
+
+
+class LazyChapterList(Sequence):
+    """
+    Sequence of the chapters of a work that loads each chapter's page only when it is needed.
+
+    The chapter IDs, titles and dates come from the work's chapter index (/navigate), so building
+    the list costs a single request. Accessing a chapter's text (or anything else parsed from its
+    page) requests that chapter alone. At most 'max_loaded' chapter pages are kept in memory; the
+    least recently used one is dropped when another one is loaded, and requested again if needed.
+    """
+
+    def __init__(self, work, max_loaded=16):
+        """Requests the chapter index of a work and creates a stub for each chapter
+
+        Args:
+            work (AO3.Work): Work the chapters belong to
+            max_loaded (int, optional): Maximum number of chapter pages kept in memory. None -> No maximum. Defaults to 16.
+
+        Raises:
+            utils.InvalidIdError: Raised if the work wasn't found
+        """
+
+        self.max_loaded = max_loaded
+        self.dates = []
+        self._chapters = []
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+        soup = work.request(f"https://archiveofourown.org/works/{work.id}/navigate?view_adult=true")
+        index = soup.find("ol", {"class": "chapter index group"})
+        if index is None:
+            raise utils.InvalidIdError("Cannot find work")
+        for n, li in enumerate(index.find_all("li"), 1):
+            chapter = Chapter(int(li.a["href"].split("/")[-1]), work, work._session, False)
+            chapter._chapter_list = self
+            chapter.number = n
+            label = li.a.getText().strip()
+            chapter.title = label.split(". ", 1)[1] if label.startswith(f"{n}. ") else label
+            self._chapters.append(chapter)
+            date = li.find("span", {"class": "datetime"})
+            self.dates.append(None if date is None else datetime(*map(int, date.getText().strip()[1:-1].split("-"))))
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        del d["_lock"]
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._chapters)
+
+    def __getitem__(self, index):
+        return self._chapters[index]
+
+    def __repr__(self):
+        return f"<LazyChapterList [{len(self._loaded)}/{len(self._chapters)} loaded]>"
+
+    def _add(self, chapter):
+        self._loaded[chapter.id] = chapter
+        self._loaded.move_to_end(chapter.id)
+        while self.max_loaded is not None and len(self._loaded) > max(1, self.max_loaded):
+            _, evicted = self._loaded.popitem(last=False)
+            evicted._unload()
+
+    def load(self, chapter):
+        """Loads a chapter's page, unless it is already in memory, and marks it as the most recently used.
+        The page is returned, as another thread may unload the chapter again right after this"""
+
+        with self._lock:
+            soup = chapter._soup
+            if soup is not None:
+                self._add(chapter)
+                return soup
+        soup = chapter._load_page()
+        with self._lock:
+            chapter._soup = soup
+            self._add(chapter)
+        return soup
+
+    def set_page(self, chapter, soup):
+        """Uses an already requested page for a chapter (e.g. the first chapter, from the work's page)"""
+
+        with self._lock:
+            chapter._soup = soup
+            self._add(chapter)
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import pickle
+import threading
+from concurrent import futures
+
+from . import threadable
+from .comments import Comment, comment_pages
+from .users import User
+
+
+def _digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _page_entries(soup):
+    """Returns every comment on a comments page (replies included) as
+    (id, author, text, is_top_level) tuples, in page order"""
+
+    entries = []
+    ol = soup.find("ol", {"class": "thread"})
+    if ol is None:
+        return entries
+    top_level = set(id(li) for li in ol.findAll("li", {"role": "article"}, recursive=False))
+    for li in ol.findAll("li", {"role": "article"}):
+        header = li.find("h4", {"class": ("heading", "byline")})
+        if header is None or header.a is None:
+            author = None
+        else:
+            author = str(header.a.text)
+        if li.blockquote is not None:
+            text = li.blockquote.getText()
+        else:
+            text = ""
+        entries.append((int(li.attrs["id"][8:]), author, text, id(li) in top_level))
+    return entries
+
+
+class CommentSync:
+    """
+    Incremental comment monitoring for works and chapters.
+
+    For every work/chapter it remembers the known comment IDs (with a digest of their
+    author and text), the number of comment pages and a fingerprint of each page seen.
+    A sync only requests the pages that can hold new threads: it starts at the end of the
+    thread list where new comments are added and stops at the first page holding only known threads.
+    New replies or edits are reported for the pages that were requested; use full=True to re-check every page.
+    """
+
+    def __init__(self, path=None, max_workers=4):
+        """Creates a new comment synchronizer
+
+        Args:
+            path (str, optional): File where the sync state is saved. If it exists, the state is loaded from it. Defaults to None (state isn't persisted).
+            max_workers (int, optional): Maximum number of pages being fetched at once during a full sync. Defaults to 4.
+        """
+
+        self.path = path
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._state = {}
+        self.requests = 0
+        if path is not None and os.path.isfile(path):
+            with open(path, "rb") as file:
+                self._state = pickle.load(file)
+
+    def save(self):
+        """Saves the sync state to self.path"""
+
+        if self.path is None:
+            raise ValueError("This CommentSync has no path to save to")
+        with self._lock:
+            data = pickle.dumps(self._state)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(commentable):
+        from .works import Work
+        if isinstance(commentable, Work):
+            return ("work", commentable.id)
+        if commentable.id is None:
+            return ("work", commentable.work.id)
+        return ("chapter", commentable.id)
+
+    @staticmethod
+    def _url(key):
+        kind, id_ = key
+        if kind == "work":
+            return f"https://archiveofourown.org/works/{id_}?page=%d&show_comments=true&view_adult=true&view_full_work=true"
+        return f"https://archiveofourown.org/chapters/{id_}?page=%d&show_comments=true&view_adult=true"
+
+    def known_comments(self, commentable):
+        """Returns the IDs of every comment already seen on 'commentable'"""
+
+        with self._lock:
+            state = self._state.get(self._key(commentable))
+            return set() if state is None else set(state["comments"])
+
+    def forget(self, commentable):
+        """Drops the sync state of 'commentable'"""
+
+        with self._lock:
+            self._state.pop(self._key(commentable), None)
+
+    @threadable.threadable
+    def sync(self, commentable, full=False):
+        """Fetches the comment pages of a work/chapter that can hold comments that weren't seen
+        in the previous sync, and returns the differences.
+        The first sync of a work/chapter requests every page and returns every comment as new.
+        This function is threadable.
+
+        Args:
+            commentable (Work/Chapter): Object to sync
+            full (bool, optional): If True, every page is requested. Defaults to False.
+
+        Returns:
+            tuple: (new_comments, changed_comments), two lists of Comment objects
+        """
+
+        if commentable.id is None:
+            commentable = commentable.work
+        key = self._key(commentable)
+        url = self._url(key)
+        with self._lock:
+            state = self._state.get(key)
+
+        def fetch(page):
+            with self._lock:
+                self.requests += 1
+            return commentable.request(url%page)
+
+        soup = fetch(1)
+        pages = max(comment_pages(soup), 1)
+        fetched = {1: _page_entries(soup)}
+        del soup
+
+        if state is None or full or state["newest_first"] is None:
+            if pages > 1:
+                with futures.ThreadPoolExecutor(max(1, self.max_workers)) as executor:
+                    for page, soup in zip(range(2, pages+1), executor.map(fetch, range(2, pages+1))):
+                        fetched[page] = _page_entries(soup)
+        else:
+            known = state["comments"]
+            if state["newest_first"]:
+                order = range(1, pages+1)
+            else:
+                order = range(pages, 0, -1)
+            for page in order:
+                if page not in fetched:
+                    fetched[page] = _page_entries(fetch(page))
+                entries = fetched[page]
+                unchanged = state["fingerprints"].get(page) == self._fingerprint(entries) and pages == state["pages"]
+                if unchanged or all(id_ in known for id_, _, _, top in entries if top):
+                    break
+
+        return self._update(commentable, key, pages, fetched, state)
+
+    @staticmethod
+    def _fingerprint(entries):
+        return _digest(*(str(id_) for id_, _, _, _ in entries))
+
+    def _update(self, commentable, key, pages, fetched, state):
+        # The stored state may be read (or pickled by save) from other threads, so it's never modified:
+        # changes are made to a copy, which replaces it once it's complete
+        if state is None:
+            state = {"pages": 0, "newest_first": None, "fingerprints": {}, "comments": {}}
+        else:
+            state = dict(state, fingerprints=dict(state["fingerprints"]), comments=dict(state["comments"]))
+        known = state["comments"]
+
+        new = []
+        changed = []
+        authenticity_token = commentable.authenticity_token
+        for page in sorted(fetched):
+            entries = fetched[page]
+            state["fingerprints"][page] = self._fingerprint(entries)
+            for id_, author, text, _ in entries:
+                digest = _digest(author or "", text)
+                old = known.get(id_)
+                if old == digest:
+                    continue
+                known[id_] = digest
+                comment = Comment(id_, commentable, session=commentable._session, load=False)
+                setattr(comment, "authenticity_token", authenticity_token)
+                setattr(comment, "author", None if author is None else User(author, commentable._session, False))
+                setattr(comment, "text", text)
+                comment._thread = None
+                if old is None:
+                    new.append(comment)
+                else:
+                    changed.append(comment)
+
+        if state["newest_first"] is None:
+            top_level = [id_ for id_, _, _, top in fetched[1] if top]
+            if len(top_level) > 1:
+                state["newest_first"] = top_level[0] > top_level[-1]
+        for page in list(state["fingerprints"]):
+            if page > pages:
+                del state["fingerprints"][page]
+        state["pages"] = pages
+
+        with self._lock:
+            self._state[key] = state
+        return new, changed
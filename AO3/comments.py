@@ -1,4 +1,6 @@
+from concurrent import futures
 from functools import cached_property
+from math import ceil
 
 from bs4 import BeautifulSoup
 
@@ -28,6 +30,8 @@ class Comment:
         self.parent_comment = parent_comment
         self.authenticity_token = None
         self._thread = None
+        self._flat = None
+        self._flat_index = None
         self._session = session
         self.__soup = None
         if load:
@@ -38,18 +42,19 @@ class Comment:
     
     @property
     def _soup(self):
-        if self.__soup is None:
-            if self.parent_comment is None:
+        comment = self
+        while comment.__soup is None:
+            if comment.parent_comment is None:
                 return None
-            return self.parent_comment._soup
-        return self.__soup
+            comment = comment.parent_comment
+        return comment.__soup
     
     @property
     def first_parent_comment(self):
-        if self.parent_comment is None:
-            return self
-        else:
-            return self.parent_comment.first_parent_comment
+        comment = self
+        while comment.parent_comment is not None:
+            comment = comment.parent_comment
+        return comment
     
     @property
     def fullwork(self):
@@ -92,74 +97,60 @@ class Comment:
         
         if self._thread is not None:
             return self._thread
-        else:
-            if self._soup is None:
-                self.reload()
-                
-            nav = self._soup.find("ul", {"id": f"navigation_for_comment_{self.id}"})
-            for li in nav.findAll("li"):
-                if li.getText() == "\nParent Thread\n":
-                    id_ = int(li.a["href"].split("/")[-1])
-                    parent = Comment(id_, session=self._session)
-                    for comment in parent.get_thread_iterator():
-                        if comment.id == self.id:
-                            index = comment.parent_comment._thread.index(comment)
-                            comment.parent_comment._thread.pop(index)
-                            comment.parent_comment._thread.insert(index, self)
-                            self._thread = comment._thread
-                            self.parent_comment = comment.parent_comment
-                            del comment
-                            return self._thread
-                        
-            thread = self._soup.find("ol", {"class": "thread"})
-            if thread is None:
-                self._thread = []
-                return self._thread
-            
-            self._get_thread(None, thread)
+        if self._flat is not None:
+            self._thread = self._thread_from_flat()
+            return self._thread
+        
+        if self._soup is None:
+            self.reload()
             
-            if self._thread is None:
-                self._thread = []
+        nav = self._soup.find("ul", {"id": f"navigation_for_comment_{self.id}"})
+        for li in nav.findAll("li"):
+            if li.getText() == "\nParent Thread\n":
+                id_ = int(li.a["href"].split("/")[-1])
+                parent = Comment(id_, session=self._session)
+                parent.get_thread()
+                index = parent._flat.index(self.id)
+                if index is None:
+                    break
+                # Walk down the path from the parent thread's root, only building the comments on it
+                comment = parent
+                for i in parent._flat.path(index)[1:-1]:
+                    comment = next(c for c in comment.get_thread() if c.id == parent._flat.ids[i])
+                siblings = comment.get_thread()
+                position = next(n for n, c in enumerate(siblings) if c.id == self.id)
+                siblings[position] = self
+                self.parent_comment = comment
+                self._flat = parent._flat
+                self._flat_index = index
+                self._thread = self._thread_from_flat()
+                return self._thread
+                    
+        thread = self._soup.find("ol", {"class": "thread"})
+        if thread is None:
+            self._thread = []
             return self._thread
+        
+        self._flat = CommentThread(thread)
+        self._flat_index = 0
+        if len(self._flat) > 0:
+            setattr(self, "text", self._flat.text(0))
+            setattr(self, "author", self._flat.author(0, self._session))
+        self._thread = self._thread_from_flat()
+        return self._thread
             
-    def _get_thread(self, parent, soup):
-        comments = soup.findAll("li", recursive=False)
-        l = [self] if parent is None else []
-        for comment in comments:
-            if "role" in comment.attrs:
-                id_ = int(comment.attrs["id"][8:])
-                c = Comment(id_, self.parent, session=self._session, load=False)
-                c.authenticity_token = self.authenticity_token
-                c._thread = []
-                if parent is not None:
-                    c.parent_comment = parent
-                    if comment.blockquote is not None:
-                        text =  comment.blockquote.getText()
-                    else:
-                        text = ""
-                    if comment.a is not None:
-                        author = User(comment.a.getText(), load=False)
-                    else:
-                        author = None
-                    setattr(c, "text", text)
-                    setattr(c, "author", author)
-                    l.append(c)
-                else:
-                    c.parent_comment = self
-                    if comment.blockquote is not None:
-                        text = comment.blockquote.getText()
-                    else:
-                        text = ""
-                    if comment.a is not None:
-                        author = User(comment.a.getText(), load=False)
-                    else:
-                        author = None
-                    setattr(l[0], "text", text)
-                    setattr(l[0], "author", author)
-            else:
-                self._get_thread(l[-1], comment.ol)
-        if parent is not None:
-            parent._thread = l
+    def _thread_from_flat(self):
+        flat = self._flat
+        thread = []
+        for i in flat.children(self._flat_index):
+            c = Comment(flat.ids[i], self.parent, parent_comment=self, session=self._session, load=False)
+            c.authenticity_token = self.authenticity_token
+            c._flat = flat
+            c._flat_index = i
+            setattr(c, "text", flat.text(i))
+            setattr(c, "author", flat.author(i, self._session))
+            thread.append(c)
+        return thread
             
     def get_thread_iterator(self):
         """Returns a generator that allows you to iterate through the entire thread
@@ -215,6 +206,8 @@ class Comment:
         self.authenticity_token = token["content"]
         
         self._thread = None
+        self._flat = None
+        self._flat_index = None
         
         li = self._soup.find("li", {"id": f"comment_{self.id}"})
         
@@ -254,11 +247,228 @@ class Comment:
         return req
     
 def threadIterator(comment):
-    if comment.get_thread() is None or len(comment.get_thread()) == 0:
+    thread = comment.get_thread()
+    if thread is None or len(thread) == 0:
         yield comment
-    else:
-        for c in comment.get_thread():
-            yield c
-            for sub in threadIterator(c):
-                if c != sub:
-                    yield sub
+        return
+    stack = [iter(thread)]
+    while stack:
+        c = next(stack[-1], None)
+        if c is None:
+            stack.pop()
+            continue
+        yield c
+        thread = c.get_thread()
+        if thread:
+            stack.append(iter(thread))
+
+
+class CommentThread:
+    """
+    Flat representation of a comment thread.
+
+    Every comment of an <ol class="thread"> is stored in page (pre-)order in parallel arrays:
+    its id, the index of its parent (-1 for top-level comments), its depth, its author and the
+    offsets of its text in a single shared buffer. The thread is built with one iterative pass,
+    so arbitrarily deep threads don't hit the recursion limit, and Comment objects are only
+    created for the parts of the tree that are actually accessed.
+    """
+    
+    def __init__(self, soup):
+        """Parses a comment thread
+        
+        Args:
+            soup (bs4.element.Tag): <ol class="thread"> element
+        """
+        
+        self.ids = []
+        self.parent_index = []
+        self.depth = []
+        self.authors = []
+        self.offsets = []
+        self._index = {}
+        self._children = None
+        
+        parts = []
+        length = 0
+        # Every frame is [children iterator, parent index, depth, last comment at this level]
+        stack = [[iter(soup.findAll("li", recursive=False)), -1, 0, -1]]
+        while stack:
+            frame = stack[-1]
+            li = next(frame[0], None)
+            if li is None:
+                stack.pop()
+                continue
+            if "role" in li.attrs:
+                index = len(self.ids)
+                self.ids.append(int(li.attrs["id"][8:]))
+                self.parent_index.append(frame[1])
+                self.depth.append(frame[2])
+                header = li.find("h4", {"class": ("heading", "byline")})
+                if header is None or header.a is None:
+                    self.authors.append(None)
+                else:
+                    self.authors.append(str(header.a.text))
+                text = li.blockquote.getText() if li.blockquote is not None else ""
+                parts.append(text)
+                self.offsets.append((length, length+len(text)))
+                length += len(text)
+                self._index[self.ids[-1]] = index
+                frame[3] = index
+            elif li.ol is not None:
+                parent = frame[3] if frame[3] != -1 else frame[1]
+                stack.append([iter(li.ol.findAll("li", recursive=False)), parent, frame[2]+1, -1])
+        self.buffer = "".join(parts)
+        
+    def __len__(self):
+        return len(self.ids)
+    
+    def index(self, comment_id):
+        """Returns the position of a comment in the thread, or None if it isn't in it"""
+        return self._index.get(int(comment_id))
+    
+    def text(self, index):
+        """Returns the text of the comment at 'index'"""
+        start, end = self.offsets[index]
+        return self.buffer[start:end]
+    
+    def author(self, index, session=None):
+        """Returns the author (User object) of the comment at 'index', or None"""
+        if self.authors[index] is None:
+            return None
+        return User(self.authors[index], session, False)
+    
+    def children(self, index):
+        """Returns the indexes of the direct replies to the comment at 'index' (-1 for the top-level comments)"""
+        if self._children is None:
+            children = {}
+            for i, parent in enumerate(self.parent_index):
+                children.setdefault(parent, []).append(i)
+            self._children = children
+        return self._children.get(index, [])
+    
+    def descendants(self, index):
+        """Returns the indexes of every reply under the comment at 'index', in page order"""
+        end = index + 1
+        while end < len(self.ids) and self.depth[end] > self.depth[index]:
+            end += 1
+        return range(index+1, end)
+    
+    def path(self, index):
+        """Returns the indexes of the comments from the top of the thread down to 'index'"""
+        path = []
+        while index != -1:
+            path.append(index)
+            index = self.parent_index[index]
+        return path[::-1]
+
+
+def comments_from_page(soup, parent, session=None, authenticity_token=None):
+    """Returns the top-level comments of a comments page
+
+    Args:
+        soup (bs4.BeautifulSoup): Comments page
+        parent (Work/Chapter): Object the comments were posted on
+        session (AO3.Session, optional): Session object. Defaults to None.
+        authenticity_token (str, optional): Token to set on every comment. Defaults to None.
+
+    Returns:
+        list: List of comments
+    """
+    
+    comments = []
+    ol = soup.find("ol", {"class": "thread"})
+    if ol is None:
+        return comments
+    for li in ol.findAll("li", {"role": "article"}, recursive=False):
+        id_ = int(li.attrs["id"][8:])
+        
+        header = li.find("h4", {"class": ("heading", "byline")})
+        if header is None or header.a is None:
+            author = None
+        else:
+            author = User(str(header.a.text), session, False)
+            
+        if li.blockquote is not None:
+            text = li.blockquote.getText()
+        else:
+            text = ""                  
+        
+        comment = Comment(id_, parent, session=session, load=False)           
+        setattr(comment, "authenticity_token", authenticity_token)
+        setattr(comment, "author", author)
+        setattr(comment, "text", text)
+        comment._thread = None
+        comments.append(comment)
+    return comments
+
+def comment_pages(soup):
+    """Returns the number of comment pages, given the first one"""
+    
+    div = soup.find("div", {"id": "comments_placeholder"})
+    if div is None:
+        return 0
+    ol = div.find("ol", {"class": "pagination actions"})
+    if ol is None:
+        return 1
+    pages = 1
+    for li in ol.findAll("li"):
+        if li.getText().isdigit():
+            pages = int(li.getText())
+    return pages
+
+def iter_comments(parent, url, maximum=None, max_workers=4):
+    """Returns a generator that yields the top-level comments of 'parent' in page order.
+    After the first page, up to 'max_workers' pages are fetched concurrently (the requests
+    still go through the shared rate limiter). Pages that can't contain any of the first
+    'maximum' comments are never requested.
+
+    Args:
+        parent (Work/Chapter): Object to get the comments from
+        url (str): Comments url, with '%d' in place of the page number
+        maximum (int, optional): Maximum number of comments to be returned. None -> No maximum
+        max_workers (int, optional): Maximum number of pages being fetched at once. Defaults to 4.
+
+    Returns:
+        generator: The generator object
+    """
+    
+    if maximum is not None and maximum <= 0:
+        return
+    
+    def load_page(page):
+        return comments_from_page(parent.request(url%page), parent, parent._session, parent.authenticity_token)
+    
+    soup = parent.request(url%1)
+    pages = comment_pages(soup)
+    first = comments_from_page(soup, parent, parent._session, parent.authenticity_token)
+    del soup
+    if maximum is not None and len(first) >= maximum:
+        yield from first[:maximum]
+        return
+    yield from first
+    if pages <= 1 or len(first) == 0:
+        return
+    
+    remaining = None if maximum is None else maximum - len(first)
+    if remaining is not None:
+        # Every page but the last one holds as many threads as the first one
+        pages = min(pages, 1 + ceil(remaining / len(first)))
+        
+    with futures.ThreadPoolExecutor(max(1, max_workers)) as executor:
+        pending = []
+        next_page = 2
+        try:
+            while pending or next_page <= pages:
+                while next_page <= pages and len(pending) < max(1, max_workers):
+                    pending.append(executor.submit(load_page, next_page))
+                    next_page += 1
+                for comment in pending.pop(0).result():
+                    if remaining is not None:
+                        if remaining <= 0:
+                            return
+                        remaining -= 1
+                    yield comment
+        finally:
+            for future in pending:
+                future.cancel()
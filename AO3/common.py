@@ -8,25 +8,25 @@ def __setifnotnone(obj, attr, value):
         setattr(obj, attr, value)
 
 def get_work_from_banner(work):
-    #* These imports need to be here to prevent circular imports
-    #* (series.py would requite common.py and vice-versa)
-    from .series import Series
-    from .users import User
-    from .works import Work
+    return work_from_record(banner_record(work))
+
+def banner_record(work):
+    """Extracts the metadata of a work blurb (search results, bookmarks, series, ...)
+    as a dictionary of plain values, which can be pickled and sent between processes"""
     
     authors = []
+    workname = None
+    workid = None
     try:
         for l in work.h4.find_all("a"):
             if 'rel' in l.attrs.keys():
                 if "author" in l['rel']:
-                    authors.append(User(str(l.string), load=False)) # cast as string for pickling
+                    authors.append(str(l.string))
             elif l.attrs["href"].startswith("/works"):
                 workname = str(l.string)
                 workid = utils.workid_from_url(l['href'])
     except AttributeError:
         pass
-            
-    new = Work(workid, load=False)
 
     fandoms = []
     try:
@@ -56,7 +56,7 @@ def get_work_from_banner(work):
     if reqtags is not None:
         rating = reqtags.find(attrs={"class": "rating"})
         if rating is not None:
-            rating = rating.text
+            rating = str(rating.text)
         categories = reqtags.find(attrs={"class": "category"})
         if categories is not None:
             categories = categories.text.split(", ")
@@ -65,23 +65,21 @@ def get_work_from_banner(work):
 
     summary = work.find(attrs={"class": "userstuff summary"})
     if summary is not None:
-        summary = summary.text
+        summary = str(summary.text)
 
     series = []
     series_list = work.find(attrs={"class": "series"})
     if series_list is not None:
         for l in series_list.find_all("a"):
             seriesid = int(l.attrs['href'].split("/")[-1])
-            seriesname = l.text
-            s = Series(seriesid, load=False)
-            setattr(s, "name", seriesname)
-            series.append(s)
+            seriesname = str(l.text)
+            series.append((seriesid, seriesname))
 
     stats = work.find(attrs={"class": "stats"})
     if stats is not None:
         language = stats.find("dd", {"class": "language"})
         if language is not None:
-            language = language.text
+            language = str(language.text)
         words = stats.find("dd", {"class": "words"})
         if words is not None:
             words = words.text.replace(",", "")
@@ -133,29 +131,57 @@ def get_work_from_banner(work):
         
     date_queried = datetime.datetime.now()
 
-    __setifnotnone(new, "authors", authors)
-    __setifnotnone(new, "bookmarks", bookmarks)
-    __setifnotnone(new, "categories", categories)
-    __setifnotnone(new, "nchapters", chapters)
-    __setifnotnone(new, "characters", characters)
-    __setifnotnone(new, "complete", complete)
-    __setifnotnone(new, "date_updated", date_updated)
-    __setifnotnone(new, "expected_chapters", expected_chapters)
-    __setifnotnone(new, "fandoms", fandoms)
-    __setifnotnone(new, "hits", hits)
-    __setifnotnone(new, "comments", comments)
-    __setifnotnone(new, "kudos", kudos)
-    __setifnotnone(new, "language", language)
-    __setifnotnone(new, "rating", rating)
-    __setifnotnone(new, "relationships", relationships)
-    __setifnotnone(new, "restricted", restricted)
+    return {
+        "id": workid,
+        "title": workname,
+        "authors": authors,
+        "bookmarks": bookmarks,
+        "categories": categories,
+        "nchapters": chapters,
+        "characters": characters,
+        "complete": complete,
+        "date_updated": date_updated,
+        "expected_chapters": expected_chapters,
+        "fandoms": fandoms,
+        "hits": hits,
+        "comments": comments,
+        "kudos": kudos,
+        "language": language,
+        "rating": rating,
+        "relationships": relationships,
+        "restricted": restricted,
+        "series": series,
+        "summary": summary,
+        "freeforms": freeforms,
+        "warnings": warnings,
+        "words": words,
+        "date_queried": date_queried
+    }
+
+def work_from_record(record, session=None):
+    """Creates an unloaded Work object from a record returned by banner_record()"""
+    
+    #* These imports need to be here to prevent circular imports
+    #* (series.py would requite common.py and vice-versa)
+    from .series import Series
+    from .users import User
+    from .works import Work
+    
+    new = Work(record["id"], session=session, load=False)
+    
+    series = []
+    for seriesid, seriesname in record["series"]:
+        s = Series(seriesid, load=False)
+        setattr(s, "name", seriesname)
+        series.append(s)
+
+    __setifnotnone(new, "authors", [User(author, load=False) for author in record["authors"]])
     __setifnotnone(new, "series", series)
-    __setifnotnone(new, "summary", summary)
-    __setifnotnone(new, "freeforms", freeforms)
-    __setifnotnone(new, "title", workname)
-    __setifnotnone(new, "warnings", warnings)
-    __setifnotnone(new, "words", words)
-    __setifnotnone(new, "date_queried", date_queried)
+    __setifnotnone(new, "title", record["title"])
+    for attr in ("bookmarks", "categories", "nchapters", "characters", "complete", "date_updated",
+                 "expected_chapters", "fandoms", "hits", "comments", "kudos", "language", "rating",
+                 "relationships", "restricted", "summary", "freeforms", "warnings", "words", "date_queried"):
+        __setifnotnone(new, attr, record[attr])
     
     return new
 
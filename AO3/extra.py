@@ -1,20 +1,23 @@
 import functools
+import hashlib
+import json
 import os
 import pathlib
 import pickle
 import datetime
 import re
-import time
+import threading
+from concurrent import futures
 from functools import cached_property
 
 import requests
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
+from . import pagination, threadable, utils
 from .requester import requester
 
 
-def get(self, *args, **kwargs):
+def get(*args, **kwargs):
         """Request a web page and return a Response object"""  
 
         req = requester.request("get", *args, **kwargs)
@@ -38,53 +41,93 @@ def request(url):
         soup = BeautifulSoup(req.content, "lxml")
         return soup
 
-def _download_languages():
-    path = os.path.dirname(__file__)
-    languages = []
+_MANIFEST_LOCK = threading.Lock()
+
+def _resources_path():
+    return os.path.join(os.path.dirname(__file__), "resources")
+
+def _read_manifest():
     try:
-        rsrc_path = os.path.join(path, "resources")
-        if not os.path.isdir(rsrc_path):
-            os.mkdir(rsrc_path)
-        language_path = os.path.join(rsrc_path, "languages")
-        if not os.path.isdir(language_path):
-            os.mkdir(language_path)
-        url = "https://archiveofourown.org/languages"
-        print(f"Downloading from {url}")
-        req = requester.request("get", url)
-        soup = BeautifulSoup(req.content, "lxml")
-        for dt in soup.find("dl", {"class": "language index group"}).findAll("dt"):
-            if dt.a is not None: 
-                alias = dt.a.attrs["href"].split("/")[-1]
-            else:
-                alias = None
-            languages.append((dt.getText(), alias))
-        with open(f"{os.path.join(language_path, 'languages')}.pkl", "wb") as file:
-            pickle.dump(languages, file)
-    except AttributeError:
-        raise utils.UnexpectedResponseError("Couldn't download the desired resource. Do you have the latest version of ao3-api?")
-    print(f"Download complete ({len(languages)} languages)")
+        with open(os.path.join(_resources_path(), "manifest.json"), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _update_manifest(name, entry):
+    with _MANIFEST_LOCK:
+        manifest = _read_manifest()
+        manifest[name] = entry
+        _atomic_write(os.path.join(_resources_path(), "manifest.json"), json.dumps(manifest, indent=2).encode("utf-8"))
 
-def _download_fandom(fandom_key, name):
-    path = os.path.dirname(__file__)
-    fandoms = []
+def _atomic_write(path, data):
+    temp = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, path)
+
+def _download(folder, name, url, parse, force=True):
+    """Downloads a resource and saves it unless it's unchanged.
+
+    Unless 'force' is set, the request carries the ETag/Last-Modified of the previous download, and
+    the resource is only parsed if the server says it changed. Its content is then compared with the
+    saved one, and the file is only rewritten (atomically) if it differs.
+
+    Returns:
+        str: "updated", "unchanged" (same content) or "not modified" (the server didn't send it again)
+    """
+    
+    path = os.path.join(_resources_path(), folder)
+    os.makedirs(path, exist_ok=True)
+    filename = f"{os.path.join(path, name)}.pkl"
+    entry = _read_manifest().get(name, {})
+    headers = {}
+    if not force and os.path.exists(filename):
+        if entry.get("etag") is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified") is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    
+    print(f"Downloading from {url}")
+    req = get(url, headers=headers)
+    if req.status_code == 304:
+        return "not modified"
     try:
-        rsrc_path = os.path.join(path, "resources")
-        if not os.path.isdir(rsrc_path):
-            os.mkdir(rsrc_path)
-        fandom_path = os.path.join(rsrc_path, "fandoms")
-        if not os.path.isdir(fandom_path):
-            os.mkdir(fandom_path)
-        url = f"https://archiveofourown.org/media/{fandom_key}/fandoms"
-        print(f"Downloading from {url}")
-        req = requester.request("get", url)
-        soup = BeautifulSoup(req.content, "lxml")
-        for fandom in soup.find("ol", {"class": "alphabet fandom index group"}).findAll("a", {"class": "tag"}):
-            fandoms.append(fandom.getText())
-        with open(f"{os.path.join(fandom_path, name)}.pkl", "wb") as file:
-            pickle.dump(fandoms, file)
+        items = parse(BeautifulSoup(req.content, "lxml"))
     except AttributeError:
         raise utils.UnexpectedResponseError("Couldn't download the desired resource. Do you have the latest version of ao3-api?")
-    print(f"Download complete ({len(fandoms)} fandoms)")
+    
+    digest = hashlib.sha256(json.dumps(items).encode("utf-8")).hexdigest()
+    status = "unchanged" if entry.get("sha256") == digest and os.path.exists(filename) else "updated"
+    if status == "updated":
+        _atomic_write(filename, pickle.dumps(items))
+    _update_manifest(name, {
+        "etag": req.headers.get("ETag"),
+        "last_modified": req.headers.get("Last-Modified"),
+        "sha256": digest,
+        "count": len(items),
+        "downloaded": datetime.datetime.now().isoformat(timespec="seconds")
+    })
+    print(f"Download complete ({len(items)} {folder}, {status})")
+    return status
+
+def _parse_languages(soup):
+    languages = []
+    for dt in soup.find("dl", {"class": "language index group"}).findAll("dt"):
+        if dt.a is not None: 
+            alias = dt.a.attrs["href"].split("/")[-1]
+        else:
+            alias = None
+        languages.append((dt.getText(), alias))
+    return languages
+
+def _parse_fandoms(soup):
+    return [fandom.getText() for fandom in soup.find("ol", {"class": "alphabet fandom index group"}).findAll("a", {"class": "tag"})]
+
+def _download_languages(force=True):
+    return _download("languages", "languages", "https://archiveofourown.org/languages", _parse_languages, force)
+
+def _download_fandom(fandom_key, name, force=True):
+    return _download("fandoms", name, f"https://archiveofourown.org/media/{fandom_key}/fandoms", _parse_fandoms, force)
  
 
 _FANDOM_RESOURCES = {
@@ -172,30 +215,80 @@ def has_resource(resource):
     path = os.path.join(os.path.dirname(__file__), "resources")
     return len(list(pathlib.Path(path).rglob(resource+".pkl"))) > 0
 
+@threadable.threadable
+def refresh(resources=None, force=False, max_workers=4):
+    """Downloads resources concurrently, skipping the ones that didn't change since they were last downloaded.
+    Every request still goes through the shared rate limiter. Unchanged resources aren't rewritten
+    (see resources/manifest.json), and the fandom index is rebuilt if any fandom resource changed.
+    This function is threadable.
+
+    Args:
+        resources (list, optional): Resource names. Defaults to None (every resource).
+        force (bool, optional): Download every resource again, even if the server says it didn't change. Defaults to False.
+        max_workers (int, optional): Maximum number of resources being downloaded at once. Defaults to 4.
+
+    Raises:
+        KeyError: Invalid resource
+
+    Returns:
+        dict: key = resource name; value = "updated", "unchanged", "not modified", or the exception raised while downloading it
+    """
+    
+    functions = {}
+    for _, resource_dict in _RESOURCE_DICTS:
+        functions.update(resource_dict)
+    if resources is None:
+        resources = list(functions)
+    for resource in resources:
+        if resource not in functions:
+            raise KeyError(f"'{resource}' is not a valid resource")
+    
+    results = {}
+    with futures.ThreadPoolExecutor(max(1, max_workers)) as executor:
+        pending = {executor.submit(functions[resource], force=force): resource for resource in resources}
+        for future in futures.as_completed(pending):
+            try:
+                results[pending[future]] = future.result()
+            except Exception as e:
+                results[pending[future]] = e
+    
+    if any(results[resource] == "updated" for resource in resources if resource in _FANDOM_RESOURCES):
+        if utils._FANDOMS is not None or os.path.exists(utils._fandom_index_path()):
+            utils.build_fandom_index()
+    return results
+
 @threadable.threadable
 def download_all(redownload=False):
-    """Downloads every available resource.
-    This function is threadable."""
+    """Downloads every available resource, one at a time (see refresh()).
+    This function is threadable.
+
+    Raises:
+        Exception: The first error raised while downloading a resource, once every other one was downloaded
+    """
     
-    types = get_resources()
-    for rsrc_type in types:
-        for rsrc in types[rsrc_type]:
-            if redownload or not has_resource(rsrc):
-                download(rsrc)
+    resources = [rsrc for rsrc in _all_resources() if redownload or not has_resource(rsrc)]
+    _raise_errors(refresh(resources, force=redownload, max_workers=1))
 
 @threadable.threadable    
 def download_all_threaded(redownload=False):
-    """Downloads every available resource in parallel (about ~3.7x faster).
-    This function is threadable."""
+    """Downloads every available resource in parallel (see refresh()).
+    This function is threadable.
+
+    Raises:
+        Exception: The first error raised while downloading a resource, once every other one was downloaded
+    """
     
-    threads = []
+    resources = [rsrc for rsrc in _all_resources() if redownload or not has_resource(rsrc)]
+    _raise_errors(refresh(resources, force=redownload, max_workers=max(1, len(resources))))
+
+def _raise_errors(results):
+    for result in results.values():
+        if isinstance(result, Exception):
+            raise result
+
+def _all_resources():
     types = get_resources()
-    for rsrc_type in types:
-        for rsrc in types[rsrc_type]:
-            if redownload or not has_resource(rsrc):
-                threads.append(download(rsrc, threaded=True))
-    for thread in threads:
-        thread.join()
+    return [rsrc for rsrc_type in types for rsrc in types[rsrc_type]]
 
 
 #----------Get works from any page with pagination
@@ -206,88 +299,36 @@ def get_pagecount(url):
     """
     page_one_url = f"{url}?page=1"
     soup = request(page_one_url)
-    pages = soup.find("ol",{"aria-label": "Pagination"})
-    if pages is None:
-        return 1
-    n = 1
-    for li in pages.findAll("li"):
-        text = li.getText()
-        if text.isdigit():
-            n = int(text)
-    return n
+    return pagination.page_count(soup)
 
 def load_ids(url, works, page=1 ):
     """
     loads the ids of all works on a specified page. 
     """
     
-    url = f"{url}?page={page}"
-    workPage = request(url)
-    worksRaw = workPage.find_all("li", {"role": "article"})
-    
-    for item in worksRaw:
-            # authors = []
-            workname = None
-            workid = None
-            for a in item.h4.find_all("a"):
-                if a.attrs["href"].startswith("/works"):
-                    workname = str(a.string)
-                    workid = utils.workid_from_url(a["href"])
-            if workname != None and workid != None:
-                # this seems sketchy:
-                works[workid]= workname
-
-    
+    works.update(pagination.work_id_titles(request(f"{url}?page={page}")))
 
-def get_work_ids(url, sleep = 3, start_page = 0, max_pages = None, page_count = None, timeout_sleep = 180): 
+def get_work_ids(url, sleep = None, start_page = 0, max_pages = None, page_count = None, timeout_sleep = 180, max_workers = 4): 
     
     """
     Gets work ids and work-titles from work-page-urls (i.e. Userpages or fandom-pages).
     Simply needs to end in /works (https://archiveofourown.org/tags/Pocket%20Monsters%20%7C%20Pokemon%20-%20All%20Media%20Types/works)
+    Pages are loaded concurrently (see AO3.pagination.ListingPaginator).
 
     Arguments: 
-        url(str): 
-        sleep (int): 
-        start_page (int): 
-        max_pages (int): 
-        page_count (int): 
-        timeout_sleep (int)
+        url(str): Listing url
+        sleep (int): Minimum number of seconds between two page requests. Defaults to None.
+        start_page (int): Page to start on, zero-indexed. Defaults to 0.
+        max_pages (int): Last page to load, zero-indexed. Defaults to None (every page).
+        page_count (int): Number of pages, if already known. Defaults to None (read from the first page).
+        timeout_sleep (int): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 180.
+        max_workers (int): Maximum number of pages being loaded at once. Defaults to 4.
 
     Returns: 
         works (dict): a dictionary of workid and title  
     """
-    start_url = f"{url}?page=1" #https://archiveofourown.org/users/<name>/pseuds/<name>/works
-    works = {}
-    if not page_count: 
-        page_count = get_pagecount(url)
-
-    # starts to loop through all the pages 
-    for page in range(start_page, page_count):
-        print(f"Processing page {page+1} of {page_count} pages.")
-        
-        if timeout_sleep is None:
-                  load_ids(url,works= works, page=page+1 )
-        else: 
-            loaded = False 
-            while loaded == False: 
-                try: 
-                    load_ids(url, works = works, page=page+1)
-                    #print(f"Added works on {page+1} of {}.")
-                    loaded = True 
-
-                except utils.HTTPError:
-                            print(f"Loading being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-        
-        # Check for maximum history page load
-        if max_pages is not None and page >= max_pages:
-            return works
-
-        # Again attempt to avoid rate limiter, sleep for a few
-        # seconds between page requests.
-        if sleep is not None and sleep > 0:
-            print(f"Sleeping for {sleep} seconds")
-            time.sleep(sleep)
-
-    return works
+    
+    paginator = pagination.ListingPaginator(
+        f"{url}?page={{page}}", pagination.work_id_titles, request,
+        start_page+1, None if max_pages is None else max_pages+1, max_workers, timeout_sleep, sleep, pages=page_count)
+    return dict(paginator)
@@ -0,0 +1,439 @@
+"""
+Request tracing and metrics.
+
+Functions registered with requester.add_hook() are called after every request with a dictionary:
+    method, url, status (None if the request raised), bytes (response size, None if unknown),
+    attempts, retries (attempts after 429 responses), network_time, wait_time (rate limiter, jitter
+    and back-off), total_time (all in seconds), caller (e.g. 'AO3.works.Work.reload'), error (name of
+    the exception raised, if any) and timestamp.
+
+RequestMetrics aggregates these events per URL class (see classify_url) and exports them as JSON
+or in the Prometheus text format:
+
+    metrics = AO3.RequestMetrics().install()
+    work = AO3.Work(14392692)
+    print(metrics.to_prometheus())
+
+ParseProfiler attributes the time (and optionally the memory) spent loading models to fetching the
+page, building its tree and each cached property that extracts a field from it:
+
+    with AO3.ParseProfiler() as profiler:
+        work = AO3.Work(14392692)
+        work.fandoms
+    print(profiler.report())
+"""
+
+import importlib
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+from functools import cached_property, wraps
+from urllib.parse import urlparse
+
+from .requester import requester as _requester
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_CLASSES = {
+    "works": "work",
+    "chapters": "work",
+    "downloads": "download",
+    "tags": "tag",
+    "series": "series",
+    "users": "user",
+    "comments": "comment",
+    "bookmarks": "bookmark",
+    "collections": "collection",
+    "media": "resource",
+    "languages": "resource",
+}
+
+
+def classify_url(url):
+    """Returns the class of an AO3 URL: work, search, tag, series, user, comment, bookmark, collection,
+    download, resource, other or external"""
+
+    parsed = urlparse(url or "")
+    if parsed.netloc and not parsed.netloc.endswith("archiveofourown.org"):
+        return "external"
+    parts = [part for part in parsed.path.split("/") if part]
+    if not parts:
+        return "other"
+    if parts[-1] == "search" or "search" in parts[:2]:
+        return "search"
+    if parsed.netloc.startswith("download.") or "downloads" in parts:
+        return "download"
+    # Listings like /users/<name>/bookmarks or /tags/<name>/works belong to the object they list
+    return _CLASSES.get(parts[0], "other")
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, like the ones Prometheus uses"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns a list of (upper bound, number of values <= bound), ending with (inf, count)"""
+
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Estimates a quantile (0 <= q <= 1) as the upper bound of the bucket it falls in"""
+
+        if self.count == 0:
+            return None
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): total for bound, total in self.cumulative()}
+        }
+
+
+class RequestMetrics:
+    """
+    Request hook that aggregates requests per URL class: counters for requests, errors, retries and
+    bytes, status codes, the callers that made them, and histograms of network and waiting time.
+    The last 'keep_events' events are also kept in RequestMetrics.events.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, keep_events=0):
+        """Creates a new aggregator
+
+        Args:
+            buckets (tuple, optional): Upper bounds (seconds) of the latency histogram buckets. Defaults to DEFAULT_BUCKETS.
+            keep_events (int, optional): Number of recent events to keep. Defaults to 0.
+        """
+
+        self.bucket_bounds = buckets
+        self.events = deque(maxlen=keep_events)
+        self._lock = threading.Lock()
+        self._requester = None
+        self.reset()
+
+    def reset(self):
+        """Clears every counter and histogram"""
+
+        with self._lock:
+            self._classes = {}
+            self.events.clear()
+
+    def _class_metrics(self, url_class):
+        metrics = self._classes.get(url_class)
+        if metrics is None:
+            metrics = self._classes[url_class] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "bytes": 0,
+                "status": {},
+                "callers": {},
+                "network_time": Histogram(self.bucket_bounds),
+                "wait_time": Histogram(self.bucket_bounds),
+            }
+        return metrics
+
+    def __call__(self, event):
+        url_class = classify_url(event["url"])
+        with self._lock:
+            metrics = self._class_metrics(url_class)
+            metrics["requests"] += 1
+            metrics["retries"] += event["retries"]
+            if event["error"] is not None or event["status"] is None or event["status"] >= 400:
+                metrics["errors"] += 1
+            if event["bytes"] is not None:
+                metrics["bytes"] += event["bytes"]
+            status = str(event["status"])
+            metrics["status"][status] = metrics["status"].get(status, 0) + 1
+            caller = event["caller"] or "unknown"
+            metrics["callers"][caller] = metrics["callers"].get(caller, 0) + 1
+            metrics["network_time"].observe(event["network_time"])
+            metrics["wait_time"].observe(event["wait_time"])
+            if self.events.maxlen:
+                self.events.append(dict(event, url_class=url_class))
+
+    def install(self, requester=None):
+        """Registers this aggregator as a hook of a requester (defaults to the global one) and returns it"""
+
+        self._requester = _requester if requester is None else requester
+        self._requester.add_hook(self)
+        return self
+
+    def uninstall(self):
+        """Unregisters this aggregator"""
+
+        if self._requester is not None:
+            self._requester.remove_hook(self)
+            self._requester = None
+
+    def __enter__(self):
+        return self.install() if self._requester is None else self
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def snapshot(self):
+        """Returns the current metrics as a dictionary of plain values
+
+        Returns:
+            dict: key = URL class; value = dictionary of counters, status codes, callers and histograms
+        """
+
+        with self._lock:
+            result = {}
+            for url_class, metrics in self._classes.items():
+                result[url_class] = {
+                    "requests": metrics["requests"],
+                    "errors": metrics["errors"],
+                    "retries": metrics["retries"],
+                    "bytes": metrics["bytes"],
+                    "status": dict(metrics["status"]),
+                    "callers": dict(metrics["callers"]),
+                    "network_time": metrics["network_time"].to_dict(),
+                    "wait_time": metrics["wait_time"].to_dict(),
+                }
+            return result
+
+    def to_json(self, **kwargs):
+        """Returns the current metrics as a JSON string (keyword arguments are passed to json.dumps)"""
+
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix="ao3"):
+        """Returns the current metrics in the Prometheus text exposition format"""
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def counter(name, help_text, key):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for url_class, metrics in sorted(snapshot.items()):
+                lines.append(f'{prefix}_{name}{{class="{url_class}"}} {metrics[key]}')
+
+        counter("requests_total", "Requests made", "requests")
+        counter("request_errors_total", "Requests that failed or returned an error status", "errors")
+        counter("request_retries_total", "Requests retried after a rate-limit response", "retries")
+        counter("response_bytes_total", "Bytes received", "bytes")
+
+        lines.append(f"# HELP {prefix}_responses_total Responses by status code")
+        lines.append(f"# TYPE {prefix}_responses_total counter")
+        for url_class, metrics in sorted(snapshot.items()):
+            for status, count in sorted(metrics["status"].items()):
+                lines.append(f'{prefix}_responses_total{{class="{url_class}",status="{status}"}} {count}')
+
+        for key, help_text in (("network_time", "Time spent on the network"), ("wait_time", "Time spent waiting for the rate limiter and back-off")):
+            name = f"{prefix}_request_{key}_seconds"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for url_class, metrics in sorted(snapshot.items()):
+                histogram = metrics[key]
+                for bound, total in histogram["buckets"].items():
+                    lines.append(f'{name}_bucket{{class="{url_class}",le="{bound}"}} {total}')
+                lines.append(f'{name}_sum{{class="{url_class}"}} {histogram["sum"]}')
+                lines.append(f'{name}_count{{class="{url_class}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# Classes whose get(), request() and cached properties are profiled by ParseProfiler
+_PROFILED_MODELS = (
+    ("works", "Work"),
+    ("chapters", "Chapter"),
+    ("series", "Series"),
+    ("tags", "Tag"),
+    ("users", "User"),
+    ("workgroup", "Workgroup"),
+    ("comments", "Comment"),
+    ("session", "GuestSession"),
+    ("session", "Session"),
+)
+
+# Stage names of the model methods
+_METHOD_STAGES = {"get": "fetch", "request": "build"}
+
+
+class ParseProfiler:
+    """
+    Opt-in profiler of the parsing done by the models (Work, Chapter, Series, Tag, User, ...).
+
+    While enabled, every call to a model's get() is recorded as the 'fetch' stage, the rest of its
+    request() (building the BeautifulSoup tree) as the 'build' stage, and every cached property under
+    its own name (e.g. 'fandoms'). Stages are grouped by model, and each one keeps its number of calls,
+    its total time and its self time (the total minus the time of the stages it called, so Work.metadata
+    isn't charged for Work.fandoms). With trace_memory=True, the net memory allocated by each stage
+    is measured with tracemalloc too.
+
+    Profiling works by wrapping the model classes, so only one profiler can be enabled at a time,
+    and nothing is wrapped while it's disabled.
+    """
+
+    _active = None
+
+    def __init__(self, trace_memory=False):
+        """Creates a new profiler
+
+        Args:
+            trace_memory (bool, optional): Measure allocations with tracemalloc (slower). Defaults to False.
+        """
+
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._patched = []
+        self._started_tracing = False
+        self.reset()
+
+    def reset(self):
+        """Clears every recorded stage"""
+
+        with self._lock:
+            self._stats = {}
+
+    @property
+    def enabled(self):
+        return ParseProfiler._active is self
+
+    def enable(self):
+        """Starts profiling and returns the profiler
+
+        Raises:
+            RuntimeError: Raised if another profiler is already enabled
+        """
+
+        with self._lock:
+            if ParseProfiler._active is not None:
+                raise RuntimeError("Another ParseProfiler is already enabled")
+            ParseProfiler._active = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        for module, name in _PROFILED_MODELS:
+            cls = getattr(importlib.import_module(f".{module}", __package__), name)
+            for attr, value in list(cls.__dict__.items()):
+                if isinstance(value, cached_property):
+                    self._patched.append((value, "func", value.func))
+                    value.func = self._wrap(value.func, attr)
+                elif attr in _METHOD_STAGES:
+                    self._patched.append((cls, attr, value))
+                    setattr(cls, attr, self._wrap(value, _METHOD_STAGES[attr]))
+        return self
+
+    def disable(self):
+        """Stops profiling. The recorded stages are kept"""
+
+        if not self.enabled:
+            return
+        while self._patched:
+            obj, attr, original = self._patched.pop()
+            setattr(obj, attr, original)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        ParseProfiler._active = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def _wrap(self, function, stage):
+        profiler = self
+
+        @wraps(function)
+        def wrapper(obj, *args, **kwargs):
+            return profiler._call(type(obj).__name__, stage, function, obj, args, kwargs)
+        return wrapper
+
+    def _call(self, model, stage, function, obj, args, kwargs):
+        stack = self._local.__dict__.setdefault("stack", [])
+        # Time and memory of the stages called by this one
+        children = [0.0, 0]
+        stack.append(children)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        memory = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = time.perf_counter()
+        try:
+            return function(obj, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[0] - memory if tracing else 0
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+                stack[-1][1] += allocated
+            with self._lock:
+                stages = self._stats.setdefault(model, {})
+                stats = stages.get(stage)
+                if stats is None:
+                    stats = stages[stage] = {"calls": 0, "total_time": 0.0, "self_time": 0.0, "memory": 0, "self_memory": 0}
+                stats["calls"] += 1
+                stats["total_time"] += elapsed
+                stats["self_time"] += elapsed - children[0]
+                stats["memory"] += allocated
+                stats["self_memory"] += allocated - children[1]
+
+    def snapshot(self):
+        """Returns the recorded stages
+
+        Returns:
+            dict: key = model name; value = dictionary of stage name to its calls, total_time, self_time (seconds),
+            memory and self_memory (bytes, 0 unless trace_memory is set)
+        """
+
+        with self._lock:
+            return {model: {stage: dict(stats) for stage, stats in stages.items()} for model, stages in self._stats.items()}
+
+    def to_json(self, **kwargs):
+        """Returns the recorded stages as a JSON string (keyword arguments are passed to json.dumps)"""
+
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def report(self, sort="self_time", limit=None):
+        """Returns a table of the recorded stages, most expensive first
+
+        Args:
+            sort (str, optional): Column to sort by (calls, total_time, self_time, memory or self_memory). Defaults to "self_time".
+            limit (int, optional): Maximum number of rows. Defaults to None.
+
+        Returns:
+            str: Table
+        """
+
+        rows = [(model, stage, stats) for model, stages in self.snapshot().items() for stage, stats in stages.items()]
+        rows.sort(key=lambda row: row[2][sort], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        lines = [f"{'stage':<40} {'calls':>8} {'self ms':>10} {'total ms':>10} {'self KiB':>10}"]
+        for model, stage, stats in rows:
+            lines.append(f"{model + '.' + stage:<40} {stats['calls']:>8} {stats['self_time']*1000:>10.2f} "
+                         f"{stats['total_time']*1000:>10.2f} {stats['self_memory']/1024:>10.1f}")
+        return "\n".join(lines)
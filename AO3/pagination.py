@@ -0,0 +1,240 @@
+import threading
+import time
+from concurrent import futures
+
+from . import utils
+
+
+def page_count(soup):
+    """Returns the number of pages of a listing, given any of its pages"""
+
+    pages = soup.find("ol", {"aria-label": "Pagination"})
+    if pages is None:
+        return 1
+    n = 1
+    for li in pages.findAll("li"):
+        text = li.getText()
+        if text.isdigit():
+            n = int(text)
+    return n
+
+def work_id_titles(soup):
+    """Returns a list of (workid, title) tuples for every work blurb on a listing page"""
+
+    items = []
+    for item in soup.find_all("li", {"role": "article"}):
+        if item.h4 is None:
+            continue
+        workname = None
+        workid = None
+        for a in item.h4.find_all("a"):
+            if a.attrs["href"].startswith("/works"):
+                workname = str(a.string)
+                workid = utils.workid_from_url(a["href"])
+        if workname is not None and workid is not None:
+            items.append((workid, workname))
+    return items
+
+
+class RetryPolicy:
+    """
+    Decides how to react to utils.HTTPError while loading pages.
+
+    The wait starts at 'initial' seconds and doubles with every consecutive failure, up to
+    'max_backoff'. Every successful page halves it again.
+    """
+
+    def __init__(self, max_retries=None, initial=1, max_backoff=60):
+        """Creates a new retry policy
+
+        Args:
+            max_retries (int, optional): Maximum number of retries of a single page. Defaults to None (no limit).
+            initial (int, optional): First wait, in seconds. Defaults to 1.
+            max_backoff (int, optional): Maximum wait, in seconds. Defaults to 60.
+        """
+
+        self.max_retries = max_retries
+        self.initial = initial
+        self.max_backoff = max_backoff
+
+    def should_retry(self, attempt):
+        """Returns True if a page that already failed 'attempt' times should be requested again"""
+        return self.max_retries is None or attempt <= self.max_retries
+
+    def next_backoff(self, backoff):
+        """Returns the wait after a failure, given the current one"""
+        return min(max(self.initial, backoff*2), self.max_backoff)
+
+
+class Paginator:
+    """
+    Loads the pages of a paginated listing concurrently and yields their items in page order.
+
+    Every request still goes through the shared rate limiter, so the concurrency only keeps the
+    request budget busy instead of waiting on one page at a time. When a page fails with
+    utils.HTTPError, all workers back off according to the retry policy and the number of pages
+    in flight is halved; it grows back by one with every page that loads successfully.
+
+    Iteration can be interrupted and started again: it resumes from Paginator.next_page, the first
+    page whose items weren't all yielded. Paginator.stats keeps the number of pages and items
+    yielded, retries, errors and the time spent loading.
+    """
+
+    def __init__(self, load_page, first_page, last_page, max_workers=4, max_backoff=60, delay=None, retry=None):
+        """Creates a new paginator
+
+        Args:
+            load_page (callable): Function that takes a page number and returns the list of items on that page
+            first_page (int): First page to load
+            last_page (int): Last page to load (inclusive). If None, pages are loaded until one comes back empty
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+            max_backoff (int, optional): Maximum wait (in seconds) after an HTTPError. If None, errors aren't retried. Defaults to 60.
+            delay (int, optional): Minimum number of seconds between two page requests. Defaults to None.
+            retry (RetryPolicy, optional): Retry policy. Overrides max_backoff. Defaults to None.
+        """
+
+        self.load_page = load_page
+        self.first_page = first_page
+        self.last_page = last_page
+        self.next_page = first_page
+        self.max_workers = max(1, max_workers)
+        self.delay = delay
+        if retry is None and max_backoff is not None:
+            retry = RetryPolicy(max_backoff=max_backoff)
+        self.retry = retry
+
+        self.stats = {"pages": 0, "items": 0, "retries": 0, "errors": 0, "load_time": 0.0}
+        self._lock = threading.Lock()
+        self._window = self.max_workers
+        self._backoff = 0
+        self._resume_at = 0
+        self._next_start = 0
+
+    @property
+    def retries(self):
+        return self.stats["retries"]
+
+    @property
+    def done(self):
+        """True once every page has been yielded"""
+        return self.last_page is not None and self.next_page > self.last_page
+
+    def _wait(self):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._resume_at)
+            if self.delay:
+                start = max(start, self._next_start)
+                self._next_start = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def _fetch(self, page, load_page=None):
+        if load_page is None:
+            load_page = self.load_page
+        attempt = 0
+        while True:
+            self._wait()
+            start = time.time()
+            try:
+                items = load_page(page)
+            except utils.HTTPError:
+                attempt += 1
+                with self._lock:
+                    self.stats["errors"] += 1
+                    if self.retry is None or not self.retry.should_retry(attempt):
+                        raise
+                    self.stats["retries"] += 1
+                    self._backoff = self.retry.next_backoff(self._backoff)
+                    self._resume_at = max(self._resume_at, time.time() + self._backoff)
+                    self._window = max(1, self._window // 2)
+                continue
+            with self._lock:
+                self.stats["load_time"] += time.time() - start
+                self._backoff /= 2
+                self._window = min(self.max_workers, self._window + 1)
+            return items
+
+    def _prepare(self):
+        pass
+
+    def __iter__(self):
+        self._prepare()
+        last_page = float("inf") if self.last_page is None else self.last_page
+        if self.next_page > last_page:
+            return
+        with futures.ThreadPoolExecutor(self.max_workers) as executor:
+            pending = []
+            next_page = self.next_page
+            try:
+                while pending or next_page <= last_page:
+                    while next_page <= last_page and len(pending) < self._window:
+                        pending.append(executor.submit(self._fetch, next_page))
+                        next_page += 1
+                    items = pending.pop(0).result()
+                    if not items and self.last_page is None:
+                        self.last_page = self.next_page - 1
+                        break
+                    yield from items
+                    self.stats["pages"] += 1
+                    self.stats["items"] += len(items)
+                    self.next_page += 1
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class ListingPaginator(Paginator):
+    """
+    Paginator for the standard AO3 listings (works, bookmarks, readings, series, ...).
+    Pages are requested from a URL template and parsed with an item extractor. Unless the number
+    of pages is given, it is read from the pagination links of the first page loaded, whose items
+    are then reused instead of requesting it again. The last page is never past the listing's end.
+    """
+
+    def __init__(self, url, extract, request, first_page=1, last_page=None, max_workers=4, max_backoff=60, delay=None, retry=None, pages=None):
+        """Creates a new listing paginator
+
+        Args:
+            url (str/callable): URL with '{page}' in place of the page number, or a function that takes a page number and returns its URL
+            extract (callable): Function that takes a page's BeautifulSoup object and returns the list of items on it
+            request (callable): Function that takes a URL and returns a BeautifulSoup object (e.g. Session.request)
+            first_page (int, optional): First page to load. Defaults to 1.
+            last_page (int, optional): Last page to load (inclusive), if it's before the listing's last page. Defaults to None (the listing's last page).
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+            max_backoff (int, optional): Maximum wait (in seconds) after an HTTPError. If None, errors aren't retried. Defaults to 60.
+            delay (int, optional): Minimum number of seconds between two page requests. Defaults to None.
+            retry (RetryPolicy, optional): Retry policy. Overrides max_backoff. Defaults to None.
+            pages (int, optional): Number of pages of the listing, if already known. Defaults to None (read from the first page loaded).
+        """
+
+        super().__init__(self._load_listing_page, first_page, last_page, max_workers, max_backoff, delay, retry)
+        self.url = url
+        self.extract = extract
+        self.request = request
+        self.pages = pages
+        self._prefetched = {}
+
+    def _url(self, page):
+        if callable(self.url):
+            return self.url(page)
+        return self.url.format(page=page)
+
+    def _load_listing_page(self, page):
+        if page in self._prefetched:
+            return self._prefetched.pop(page)
+        return self.extract(self.request(self._url(page)))
+
+    def _load_first_page(self, page):
+        soup = self.request(self._url(page))
+        self.pages = page_count(soup)
+        return self.extract(soup)
+
+    def _prepare(self):
+        if self.last_page is not None and self.next_page > self.last_page:
+            return
+        if self.pages is None:
+            page = self.next_page
+            self._prefetched[page] = self._fetch(page, self._load_first_page)
+        if self.last_page is None or self.last_page > self.pages:
+            self.last_page = self.pages
@@ -0,0 +1,152 @@
+import datetime
+import re
+from concurrent import futures
+
+from bs4 import BeautifulSoup
+
+from . import utils
+from .common import banner_record
+
+_LAST_VISITED_RE = re.compile(r"<span>Last visited:</span> (\d{2} .+ \d{4})")
+_VISITED_RE = re.compile(r"Visited (\d+) times")
+
+
+class ParsePool:
+    """
+    Process pool for the CPU-bound part of loading listing pages.
+
+    Parsing HTML with BeautifulSoup holds the GIL, so extra threads don't make it any faster.
+    A ParsePool ships the raw response bytes to worker processes, which parse them and only send
+    back compact records (plain dictionaries and tuples, not soup objects). Network requests keep
+    running on the calling threads.
+
+    Example:
+        with AO3.ParsePool() as pool:
+            search = AO3.Search(any_field="Clarke Lexa", parse_pool=pool)
+            search.update()
+    """
+
+    def __init__(self, max_workers=None):
+        """Creates a new parse pool
+
+        Args:
+            max_workers (int, optional): Number of worker processes. Defaults to None (one per CPU).
+        """
+
+        self._executor = futures.ProcessPoolExecutor(max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, parser, content):
+        """Schedules 'parser(content)' in a worker process and returns a Future"""
+        return self._executor.submit(parser, content)
+
+    def parse(self, parser, content):
+        """Runs 'parser(content)' in a worker process and waits for the result"""
+        return self.submit(parser, content).result()
+
+    def map(self, parser, contents):
+        """Parses several pages in parallel and returns the records in order"""
+        return self._executor.map(parser, contents)
+
+    def shutdown(self, wait=True):
+        """Stops the worker processes"""
+        self._executor.shutdown(wait)
+
+
+def parse(parser, content, pool=None):
+    """Runs 'parser(content)' in 'pool' if one is given, or in this process otherwise"""
+
+    if pool is None:
+        return parser(content)
+    return pool.parse(parser, content)
+
+def parse_work_list(content):
+    """Parses every work blurb of a listing page
+
+    Args:
+        content (bytes): Page html
+
+    Returns:
+        list: List of records (see common.banner_record)
+    """
+
+    soup = BeautifulSoup(content, "lxml")
+    return [banner_record(work) for work in soup.find_all("li", {"role": "article"}) if work.h4 is not None]
+
+def parse_search_page(content):
+    """Parses a work search results page
+
+    Args:
+        content (bytes): Page html
+
+    Returns:
+        dict: "works" (list of records, or None if the page has no results) and "total_results" (int)
+    """
+
+    soup = BeautifulSoup(content, "lxml")
+    results = soup.find("ol", {"class": ("work", "index", "group")})
+    if results is None and soup.find("p", text="No results found. You may want to edit your search to make it less specific.") is not None:
+        return {"works": None, "total_results": 0}
+
+    works = [banner_record(work) for work in results.find_all("li", {"role": "article"}) if work.h4 is not None]
+    maindiv = soup.find("div", {"class": "works-search region", "id": "main"})
+    total_results = int(maindiv.find("h3", {"class": "heading"}).getText().strip().split(" ")[0].replace(',',''))
+    return {"works": works, "total_results": total_results}
+
+def parse_history_page(content):
+    """Parses a reading history page
+
+    Args:
+        content (bytes): Page html
+
+    Returns:
+        list: List of tuples (workid, title, authors, visits, last_visited, marked_for_later, status)
+    """
+
+    soup = BeautifulSoup(content, "lxml")
+    history = soup.find("ol", {"class": "reading work index group"})
+    items = []
+    if history is None:
+        return items
+    for item in history.find_all("li", {"role": "article"}):
+        workname = None
+        workid = None
+        for a in item.h4.find_all("a"):
+            if a.attrs["href"].startswith("/works"):
+                workname = str(a.string)
+                workid = utils.workid_from_url(a["href"])
+        authors = [str(author.text) for author in item.h4.find_all("a", attrs={"rel" : "author"})]
+
+        visited_date = None
+        visited_num = 1
+        mfl = False
+        status = None
+        for viewed in item.find_all("h4", {"class": "viewed heading" }):
+            data_string = str(viewed)
+
+            date_str = _LAST_VISITED_RE.search(data_string)
+            if date_str is not None:
+                visited_date = datetime.datetime.strptime(date_str.group(1), '%d %b %Y')
+
+            visited_str = _VISITED_RE.search(data_string)
+            if visited_str is not None:
+                visited_num = int(visited_str.group(1))
+
+            if "Marked for Later." in data_string:
+                mfl = True
+
+            if "Latest version." in data_string:
+                status = 'latest version'
+            if "Update available." in data_string:
+                status = 'update available'
+            if "Minor edits made since then." in data_string:
+                status = 'latest version, minor edits'
+
+        if workname is not None and workid is not None:
+            items.append((workid, workname, authors, visited_num, visited_date, mfl, status))
+    return items
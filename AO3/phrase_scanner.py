@@ -0,0 +1,85 @@
+from collections import deque
+
+
+class PhraseScanner:
+    """
+    Aho-Corasick automaton that finds every occurrence of many phrases in a single pass over a text.
+
+    The phrases are compiled once into a trie with failure links, so scanning a text costs
+    time proportional to its length plus the number of matches, however many phrases there are.
+    Matching is exact (case-sensitive) and overlapping occurrences are all reported.
+    """
+
+    def __init__(self, phrases):
+        """Compiles the automaton
+
+        Args:
+            phrases (iterable): Phrases to look for. Empty and duplicate phrases are ignored.
+        """
+
+        self.phrases = list(dict.fromkeys(phrase for phrase in phrases if phrase))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for n, phrase in enumerate(self.phrases):
+            state = 0
+            for char in phrase:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (n,)
+
+        # Breadth-first, so the failure state of every node is complete before its children need it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                if self._output[fail]:
+                    self._output[child] = self._output[child] + self._output[fail]
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def iter_matches(self, text):
+        """Returns a generator that yields (phrase index, start position) for every occurrence, in the order they end"""
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        phrases = self.phrases
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for n in output[state]:
+                yield n, end - len(phrases[n])
+
+    def scan(self, text):
+        """Finds every phrase in a text
+
+        Args:
+            text (str): Text to scan
+
+        Returns:
+            dict: key = phrase; value = sorted list of start positions (only phrases that were found)
+        """
+
+        found = {}
+        for n, start in self.iter_matches(text):
+            found.setdefault(self.phrases[n], []).append(start)
+        for positions in found.values():
+            positions.sort()
+        return found
@@ -0,0 +1,202 @@
+import pickle
+import re
+from array import array
+
+from . import utils
+
+_TOKEN_RE = re.compile(r"\w+")
+_OFFSET_BITS = 32
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+
+class QuoteIndex:
+    """
+    Local full-text index over the chapter text of downloaded works.
+
+    Every chapter is stored once, and every (lowercased) word maps to a posting list of
+    (chapter, character offset) pairs packed into an array. A quote is looked up through
+    its rarest complete word and every candidate is checked against the stored text, so
+    results are exact occurrences of the quote with their character offsets.
+    """
+
+    def __init__(self):
+        self._docs = []
+        self._texts = []
+        self._works = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._works)
+
+    def __contains__(self, work):
+        return self._workid(work) in self._works
+
+    @staticmethod
+    def _workid(work):
+        return work if isinstance(work, int) else work.id
+
+    def add_work(self, work, reindex=False):
+        """Indexes the text of every chapter of a work. The work's chapters are loaded if needed.
+
+        Args:
+            work (AO3.Work): Loaded work
+            reindex (bool, optional): If False, works that are already indexed are skipped. Defaults to False.
+
+        Raises:
+            utils.UnloadedError: The work isn't loaded
+        """
+
+        if not work.loaded:
+            raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
+        if work.id in self._works:
+            if not reindex:
+                return
+            self.remove_work(work)
+        if len(work.chapters) == 0:
+            work.load_chapters()
+        self.add_text(work.id, [(chapter.str_no_work, chapter.text) for chapter in work.chapters])
+
+    def add_text(self, workid, chapters):
+        """Indexes chapter text directly (for text that was loaded some other way)
+
+        Args:
+            workid (int): Work ID
+            chapters (list): List of tuples (chapter label, chapter text), in chapter order
+        """
+
+        docs = []
+        for n, (label, text) in enumerate(chapters):
+            doc = len(self._docs)
+            self._docs.append((workid, n, label))
+            self._texts.append(text)
+            docs.append(doc)
+            key = doc << _OFFSET_BITS
+            for match in _TOKEN_RE.finditer(text):
+                token = match.group().lower()
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = array("Q")
+                postings.append(key | match.start())
+        self._works[workid] = docs
+
+    def remove_work(self, work):
+        """Removes a work from the index"""
+
+        docs = self._works.pop(self._workid(work), None)
+        if not docs:
+            return
+        removed = set(docs)
+        for doc in docs:
+            self._texts[doc] = None
+        for token in list(self._postings):
+            postings = array("Q", (p for p in self._postings[token] if p >> _OFFSET_BITS not in removed))
+            if postings:
+                self._postings[token] = postings
+            else:
+                del self._postings[token]
+
+    def _candidates(self, quote):
+        tokens = [(m.group().lower(), m.start()) for m in _TOKEN_RE.finditer(quote)]
+        # The first and last words might be cut in the middle, so they are only used if the quote doesn't cut them
+        if tokens and tokens[0][1] == 0:
+            tokens = tokens[1:]
+        if tokens and tokens[-1][1] + len(tokens[-1][0]) == len(quote):
+            tokens = tokens[:-1]
+        if not tokens:
+            return None
+        token, offset = min(tokens, key=lambda t: len(self._postings.get(t[0], ())))
+        return ((p >> _OFFSET_BITS, (p & _OFFSET_MASK) - offset) for p in self._postings.get(token, ()))
+
+    def _matches(self, quote, docs=None):
+        candidates = self._candidates(quote)
+        if candidates is None:
+            # No complete words to look up; scan the stored text instead
+            if docs is None:
+                docs = range(len(self._texts))
+            for doc in docs:
+                text = self._texts[doc]
+                if text is None:
+                    continue
+                start = text.find(quote)
+                while start != -1:
+                    yield doc, start
+                    start = text.find(quote, start+1)
+            return
+        for doc, start in candidates:
+            if docs is not None and doc not in docs:
+                continue
+            if start >= 0 and self._texts[doc].startswith(quote, start):
+                yield doc, start
+
+    def search(self, quote, works=None):
+        """Finds every occurrence of a quote
+
+        Args:
+            quote (str): Exact text to look for
+            works (list, optional): Works (or work IDs) to restrict the search to. Defaults to None (every indexed work).
+
+        Returns:
+            dict: key = work ID; value = list of tuples (chapter index, chapter label, list of character offsets)
+        """
+
+        return self.search_many([quote], works)[quote]
+
+    def search_many(self, quotes, works=None):
+        """Finds every occurrence of several quotes
+
+        Args:
+            quotes (list): Quotes to look for
+            works (list, optional): Works (or work IDs) to restrict the search to. Defaults to None (every indexed work).
+
+        Returns:
+            dict: key = quote; value = same as QuoteIndex.search()
+        """
+
+        docs = None
+        if works is not None:
+            docs = set()
+            for work in works:
+                docs.update(self._works.get(self._workid(work), ()))
+
+        results = {}
+        for quote in quotes:
+            found = {}
+            if quote:
+                for doc, start in self._matches(quote, docs):
+                    found.setdefault(doc, []).append(start)
+            result = {}
+            for doc in sorted(found):
+                workid, n, label = self._docs[doc]
+                result.setdefault(workid, []).append((n, label, sorted(found[doc])))
+            results[quote] = result
+        return results
+
+    def text(self, work, chapter):
+        """Returns the indexed text of a chapter
+
+        Args:
+            work (AO3.Work/int): Work or work ID
+            chapter (int): Chapter index (starting at 0)
+        """
+
+        return self._texts[self._works[self._workid(work)][chapter]]
+
+    def chapters(self, work):
+        """Returns a list of tuples (chapter index, chapter label, chapter text) for an indexed work"""
+
+        return [(self._docs[doc][1], self._docs[doc][2], self._texts[doc]) for doc in self._works[self._workid(work)]]
+
+    def save(self, path):
+        """Saves the index to a file"""
+
+        with open(path, "wb") as file:
+            pickle.dump((self._docs, self._texts, self._works, self._postings), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index saved with QuoteIndex.save()"""
+
+        index = cls()
+        with open(path, "rb") as file:
+            index._docs, index._texts, index._works, index._postings = pickle.load(file)
+        return index
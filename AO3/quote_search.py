@@ -9,7 +9,8 @@ from .series import Series
 from .users import User
 from .works import Work
 from .search import Search
-from .chapters import Chapter
+from .phrase_scanner import PhraseScanner
+from .quote_index import QuoteIndex
 
 """
 quote_search = QuoteSearch(user_quote, Search.pages, Search.results)
@@ -20,49 +21,62 @@ class QuoteSearch:
         self,
         user_quote="",
         pages_to_search=0,
-        works_to_search=None):
+        works_to_search=None,
+        index=None):
 
         #search results are passed in
         self.user_quote = user_quote
         self.pages_to_search = pages_to_search
         self.works_to_search = works_to_search
+        #works are added to the index as they are searched, so it can be reused for other quotes
+        self.index = QuoteIndex() if index is None else index
 
         self.results = None
         self.pages = 0
         self.total_results = 0
 
-    def _get_snippets(self, chapter_text):
-        positions = []
+    def _get_snippets(self, chapter_text, positions):
         snippets = []
-        search_start = 0
-        snippet_start = -1
-        while True:
-            search_start = chapter_text.find(self.user_quote, search_start)
-            #this section sets the start position of the snippet that is going to be added next
-            if snippet_start == -1:
-                snippet_start = search_start - 60 if search_start - 60 > 0 else 0
-            else:
-                #this section adds any completed snippet to the list
-                #if its the last occurence of the quote, or if the next is outside of the adjacency radius
-                if search_start == -1 or search_start > snippet_start+len(self.user_quote)+60:
-                    snippet_end = positions[-1] + len(self.user_quote) + 60
-                    #ellipses are added at start/end if its not the start/end of the chapter
-                    snippets.append("..." if snippet_start - 60 < 0 else "" + chapter_text[
-                        snippet_start - 60 if snippet_start - 60 > 0 else 0
-                        :snippet_end if snippet_end < len(chapter_text) else len(chapter_text)
-                        ] + "..." if snippet_end >= len(chapter_text) else "")
-                    snippet_start = -1
-            if search_start == -1:
-                break
-            positions.append(search_start)
-            if len(positions) > 4:
-                #No snippets are returned to save space on the page
-                return ["Multiple occurrences"]
-            
-            search_start += len(self.user_quote)
-
+        length = len(self.user_quote)
+        snippet_start = None
+        snippet_end = None
+        for position in positions:
+            #occurrences within the adjacency radius of the previous one are merged into the same snippet
+            if snippet_start is not None and position - 60 > snippet_end:
+                snippets.append(self._snippet(chapter_text, snippet_start, snippet_end))
+                snippet_start = None
+            if snippet_start is None:
+                snippet_start = max(position - 60, 0)
+            snippet_end = min(position + length + 60, len(chapter_text))
+        if snippet_start is not None:
+            snippets.append(self._snippet(chapter_text, snippet_start, snippet_end))
         return snippets
 
+    @staticmethod
+    def _snippet(chapter_text, start, end):
+        #ellipses are added at start/end if its not the start/end of the chapter
+        return ("..." if start > 0 else "") + chapter_text[start:end] + ("..." if end < len(chapter_text) else "")
+
+    def _index_works(self):
+        for work in self.works_to_search:
+            if work.id not in self.index:
+                if not work.loaded:
+                    work.reload()
+                self.index.add_work(work)
+
+    @threadable.threadable
+    def scan(self, phrases):
+        #batch mode: every phrase is compiled into one automaton and each chapter is scanned once
+        #returns {phrase: {work_id: [(chapter index, chapter label, positions), ...]}}
+        scanner = phrases if isinstance(phrases, PhraseScanner) else PhraseScanner(phrases)
+        results = {phrase: {} for phrase in scanner.phrases}
+        self._index_works()
+        for work in self.works_to_search:
+            for n, label, text in self.index.chapters(work):
+                for phrase, positions in scanner.scan(text).items():
+                    results[phrase].setdefault(work.id, []).append((n, label, positions))
+        return results
+
     @threadable.threadable
     def update(self):
         if self.pages_to_search != 1:
@@ -71,17 +85,15 @@ class QuoteSearch:
             self.pages = 0
             return
 
+        self._index_works()
+        found = self.index.search(self.user_quote, self.works_to_search)
+
         works = []
         for work in self.works_to_search:
-            work.load_chapters()
             chapters_with_quote = []
-            for chapter in work.chapters:
-                chapter = Chapter(chapter)
-                snippets = self._get_snippets(self, chapter.text)
-                #if there are no occurrences of the quote in the chapter text an empty list is returned
-                #which evaluates to False
-                if snippets:
-                    chapters_with_quote.append([chapter.str_no_work, snippets])
+            for n, label, positions in found.get(work.id, ()):
+                snippets = self._get_snippets(self.index.text(work, n), positions)
+                chapters_with_quote.append([label, snippets])
             if chapters_with_quote:
                 work.snippets = chapters_with_quote
                 works.append(work)
@@ -1,5 +1,7 @@
+import sys
 import threading
 import time
+import warnings
 
 import requests
 from ratelimit import limits, sleep_and_retry, RateLimitException
@@ -51,6 +53,27 @@ class Requester:
         self.wait_condition = threading.Condition()
         
         self._explambda = 0
+        
+        self._hooks = []
+        self._local = threading.local()
+        
+    def add_hook(self, hook):
+        """Registers a function that is called after every request with a dictionary describing it
+        (see AO3.instrumentation for the fields and some ready-made aggregators).
+        While no hooks are registered, requests aren't traced at all.
+
+        Args:
+            hook (callable): Function that takes the event dictionary
+        """
+        
+        with self._lock:
+            self._hooks = self._hooks + [hook]
+            
+    def remove_hook(self, hook):
+        """Unregisters a function registered with add_hook()"""
+        
+        with self._lock:
+            self._hooks = [h for h in self._hooks if h is not hook]
     
     def setExpLambda(self, value):
         self._explambda = value    
@@ -70,19 +93,74 @@ class Requester:
         """Requests a web page once enough time has passed since the last request
         
         Args:
-            session(requests.Session, optional): Session object to request with
+            session(requests.Session, optional): Session object to request with. If it has a throttle() method
+            (see AO3.SessionManager), the request is made inside the context it returns, which is entered
+            before the request waits for the rate limiter.
 
         Returns:
             requests.Response: Response object
         """
-        if EXP_LAMBDA>0:
-            time.sleep(expovariate(EXP_LAMBDA))
-        
-        self.total+=1
-        req = self.request_helper(*args, **kwargs)
-                
+        hooks = self._hooks
+        if not hooks:
+            if EXP_LAMBDA>0:
+                time.sleep(expovariate(EXP_LAMBDA))
             
-        return req
+            self.total+=1
+            req = self._throttled_request(*args, **kwargs)
+                    
+                
+            return req
+        
+        url = args[1] if len(args) > 1 else kwargs.get("url")
+        event = {
+            "method": (args[0] if args else kwargs.get("method", "")).upper(),
+            "url": url,
+            "caller": _caller(),
+            "status": None,
+            "bytes": None,
+            "attempts": 0,
+            "retries": 0,
+            "network_time": 0.0,
+            "wait_time": 0.0,
+            "total_time": 0.0,
+            "error": None,
+            "timestamp": time.time()
+        }
+        self._local.event = event
+        start = time.perf_counter()
+        try:
+            if EXP_LAMBDA>0:
+                time.sleep(expovariate(EXP_LAMBDA))
+            self.total+=1
+            req = self._throttled_request(*args, **kwargs)
+            event["status"] = req.status_code
+            if kwargs.get("stream"):
+                length = req.headers.get("Content-Length")
+                event["bytes"] = int(length) if length is not None and length.isdigit() else None
+            else:
+                event["bytes"] = len(req.content)
+            return req
+        except Exception as e:
+            event["error"] = type(e).__name__
+            raise
+        finally:
+            self._local.event = None
+            event["total_time"] = time.perf_counter() - start
+            # Everything that isn't network time was spent waiting: rate limiter, jitter and 429 back-off
+            event["wait_time"] = max(0.0, event["total_time"] - event["network_time"])
+            event["retries"] = max(0, event["attempts"] - 1)
+            for hook in hooks:
+                try:
+                    hook(event)
+                except Exception as e:
+                    warnings.warn(f"Request hook {hook!r} raised {e!r}", stacklevel=2)
+        
+    def _throttled_request(self, *args, **kwargs):
+        throttle = getattr(kwargs.get("session"), "throttle", None)
+        if throttle is None:
+            return self.request_helper(*args, **kwargs)
+        with throttle():
+            return self.request_helper(*args, **kwargs)
         
     @sleep_and_retry
     @limits(calls=int(PERIOD*RATE), period=PERIOD)
@@ -108,14 +186,36 @@ class Requester:
         Returns:
             requests.Response: Response object
         """
+        event = getattr(self._local, "event", None)
+        if event is not None:
+            event["attempts"] += 1
+            start = time.perf_counter()
         if "session" in kwargs:
             sess = kwargs["session"]
             del kwargs["session"]
             req = sess.request(*args, **kwargs)
         else:
             req = requests.request(*args, **kwargs)
+        if event is not None:
+            event["network_time"] += time.perf_counter() - start
                 
             
         return req
 
+_REQUEST_HELPERS = ("get", "post", "request")
+
+def _caller():
+    """Name of the first function in the current call stack that isn't part of the request machinery
+    (this module, the rate limiting decorators, or a model's get/post/request helpers), e.g. 'AO3.works.Work.reload'"""
+    
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if (module != __name__ and not module.startswith(("ratelimit", "backoff"))
+                and not (module.startswith(__package__ + ".") and frame.f_code.co_name in _REQUEST_HELPERS)):
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
 requester = Requester()
\ No newline at end of file
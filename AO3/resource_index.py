@@ -0,0 +1,225 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+MAGIC = b"AO3I"
+VERSION = 1
+
+# magic, version, number of strings, number of trigrams, then the byte offset of every section
+_HEADER = struct.Struct("<4s11I")
+
+
+def _trigrams(string):
+    return {string[i:i+3] for i in range(len(string) - 2)}
+
+def _trigram_key(trigram):
+    # Three code points (21 bits each) packed into one integer, so keys can be stored in a flat array
+    a, b, c = map(ord, trigram)
+    return a << 42 | b << 21 | c
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+def _native(view, typecode):
+    values = view.cast(typecode)
+    if sys.byteorder != "little":
+        values = array(typecode, values)
+        values.byteswap()
+    return values
+
+def _pad(buffer):
+    buffer += b"\0" * (-len(buffer) % 8)
+
+
+class ResourceIndex:
+    """
+    Read-only index of a list of strings (e.g. every fandom name), memory-mapped from a file.
+
+    The file holds the lowercased strings in sorted order, the original strings in the same order,
+    and a trigram posting list for each trigram of the lowercased strings. Nothing is loaded into
+    Python objects when the index is opened; queries decode only the strings they look at.
+
+    - Substring queries of 3 or more characters only check the strings that contain the query's
+      rarest trigram. Shorter ones scan the lowercased strings with a single bytes search.
+    - Prefix queries binary search the sorted strings.
+    """
+
+    def __init__(self, path):
+        """Opens an index file created by ResourceIndex.build
+
+        Args:
+            path (str): Index file
+
+        Raises:
+            ValueError: Raised if the file isn't an index, or was created by a newer version
+        """
+
+        self.path = path
+        with open(path, "rb") as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, ntrigrams, *sections = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError("Not a resource index")
+        if version > VERSION:
+            raise ValueError(f"Unsupported index version ({version})")
+        lower_offsets, self._lower_start, original_offsets, self._original_start, keys, posting_offsets, postings = sections[:7]
+
+        self._view = view = memoryview(self._mm)
+        self._n = n
+        self._lower_offsets = _native(view[lower_offsets:lower_offsets + 4*(n+1)], "I")
+        self._original_offsets = _native(view[original_offsets:original_offsets + 4*(n+1)], "I")
+        self._posting_offsets = _native(view[posting_offsets:posting_offsets + 4*(ntrigrams+1)], "I")
+        self._postings = _native(view[postings:postings + 4*self._posting_offsets[ntrigrams]], "I")
+        self._keys = _native(view[keys:keys + 8*ntrigrams], "Q")
+
+    @classmethod
+    def build(cls, strings, path):
+        """Writes the index of a list of strings and opens it.
+        The file is written next to 'path' and then moved over it, so readers never see a partial index.
+
+        Args:
+            strings (iterable): Strings to index (duplicates are kept once)
+            path (str): Index file
+
+        Returns:
+            ResourceIndex: The new index
+        """
+
+        entries = sorted({(string.lower(), string) for string in strings if "\n" not in string}, key=lambda entry: (entry[0].encode(), entry[1]))
+        lower_blob = bytearray()
+        original_blob = bytearray()
+        lower_offsets = array("I", [0])
+        original_offsets = array("I", [0])
+        trigrams = {}
+        for n, (lower, original) in enumerate(entries):
+            lower_blob += lower.encode() + b"\n"
+            original_blob += original.encode()
+            lower_offsets.append(len(lower_blob))
+            original_offsets.append(len(original_blob))
+            for trigram in _trigrams(lower):
+                trigrams.setdefault(_trigram_key(trigram), []).append(n)
+
+        keys = array("Q", sorted(trigrams))
+        posting_offsets = array("I", [0])
+        postings = array("I")
+        for key in keys:
+            postings.extend(trigrams[key])
+            posting_offsets.append(len(postings))
+
+        body = bytearray()
+        sections = []
+        for data in (_little_endian(lower_offsets), lower_blob, _little_endian(original_offsets), original_blob,
+                     _little_endian(keys), _little_endian(posting_offsets), _little_endian(postings)):
+            sections.append(_HEADER.size + len(body))
+            body += data
+            _pad(body)
+        sections += [0] * (8 - len(sections))
+
+        temp = f"{path}.tmp"
+        with open(temp, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, len(entries), len(keys), *sections))
+            file.write(body)
+        os.replace(temp, path)
+        return cls(path)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, n):
+        if not 0 <= n < self._n:
+            raise IndexError("Index out of range")
+        start = self._original_start + self._original_offsets[n]
+        return self._mm[start:self._original_start + self._original_offsets[n+1]].decode()
+
+    def __iter__(self):
+        for n in range(self._n):
+            yield self[n]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _lower(self, n):
+        start = self._lower_start + self._lower_offsets[n]
+        # Leaves out the trailing newline
+        return self._mm[start:self._lower_start + self._lower_offsets[n+1] - 1]
+
+    def _postings_of(self, key):
+        keys = self._keys
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(keys) or keys[lo] != key:
+            return None
+        return self._postings[self._posting_offsets[lo]:self._posting_offsets[lo+1]]
+
+    def search(self, query):
+        """Returns every string that contains 'query' (case-insensitive), in alphabetical order"""
+
+        query = query.lower()
+        if "\n" in query:
+            return []
+        encoded = query.encode()
+        if not encoded:
+            return list(self)
+        if len(query) < 3:
+            return self._scan(encoded)
+
+        candidates = None
+        for trigram in _trigrams(query):
+            postings = self._postings_of(_trigram_key(trigram))
+            if postings is None:
+                return []
+            if candidates is None or len(postings) < len(candidates):
+                candidates = postings
+        return [self[n] for n in candidates if encoded in self._lower(n)]
+
+    def _scan(self, encoded):
+        # Strings are separated by newlines in the blob, so a match can't span two of them
+        results = []
+        start = self._lower_start
+        end = start + self._lower_offsets[self._n]
+        position = self._mm.find(encoded, start, end)
+        while position != -1:
+            n = bisect_right(self._lower_offsets, position - start) - 1
+            results.append(self[n])
+            position = self._mm.find(encoded, start + self._lower_offsets[n+1], end)
+        return results
+
+    def prefix(self, query):
+        """Returns every string that starts with 'query' (case-insensitive), in alphabetical order"""
+
+        encoded = query.lower().encode()
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._lower(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        while lo < self._n and self._lower(lo)[:len(encoded)] == encoded:
+            results.append(self[lo])
+            lo += 1
+        return results
+
+    def close(self):
+        """Unmaps the index file"""
+
+        for attr in ("_lower_offsets", "_original_offsets", "_posting_offsets", "_postings", "_keys"):
+            values = getattr(self, attr)
+            if isinstance(values, memoryview):
+                values.release()
+        self._view.release()
+        self._mm.close()
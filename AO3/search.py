@@ -2,8 +2,8 @@ from math import ceil
 
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
-from .common import get_work_from_banner
+from . import parsing, threadable, utils
+from .common import get_work_from_banner, work_from_record
 from .requester import requester
 from .series import Series
 from .users import User
@@ -51,7 +51,8 @@ class Search:
         characters="",
         relationships="",
         tags="",
-        session=None):
+        session=None,
+        parse_pool=None):
 
         self.any_field = any_field
         self.title = title
@@ -77,6 +78,7 @@ class Search:
         self.revised_at = revised_at
         
         self.session = session
+        self.parse_pool = parse_pool
 
         self.results = None
         self.pages = 0
@@ -88,32 +90,25 @@ class Search:
         This function is threadable.
         """
 
-        soup = search(
+        req = _search_request(
             self.any_field, self.title, self.author, self.single_chapter,
             self.word_count, self.language, self.fandoms, self.rating, self.hits,
             self.kudos, self.crossovers, self.bookmarks, self.excluded_tags, self.comments, self.completion_status, self.page,
             self.sort_column, self.sort_direction, self.revised_at, self.session,
             self.characters, self.relationships, self.tags)
 
-        results = soup.find("ol", {"class": ("work", "index", "group")})
-        if results is None and soup.find("p", text="No results found. You may want to edit your search to make it less specific.") is not None:
+        parse_pool = self.parse_pool
+        if parse_pool is None and self.session is not None:
+            parse_pool = getattr(self.session, "parse_pool", None)
+        page = parsing.parse(parsing.parse_search_page, req.content, parse_pool)
+        if page["works"] is None:
             self.results = []
             self.total_results = 0
             self.pages = 0
             return
 
-        works = []
-        for work in results.find_all("li", {"role": "article"}):
-            if work.h4 is None:
-                continue
-            
-            new = get_work_from_banner(work)
-            new._session = self.session
-            works.append(new)
-
-        self.results = works
-        maindiv = soup.find("div", {"class": "works-search region", "id": "main"})
-        self.total_results = int(maindiv.find("h3", {"class": "heading"}).getText().strip().split(" ")[0].replace(',',''))      
+        self.results = [work_from_record(record, self.session) for record in page["works"]]
+        self.total_results = page["total_results"]
         self.pages = ceil(self.total_results / 20)
 
     def search_from_url(self, user_url):
@@ -227,6 +222,43 @@ def search(
     Returns:
         bs4.BeautifulSoup: Search result's soup
     """
+    
+    req = _search_request(
+        any_field, title, author, single_chapter, word_count, language, fandoms, rating, hits, kudos,
+        crossovers, bookmarks, excluded_tags, comments, completion_status, page, sort_column,
+        sort_direction, revised_at, session, characters, relationships, tags)
+    soup = BeautifulSoup(req.content, features="lxml")
+    return soup
+
+def _search_request(
+    any_field="",
+    title="",
+    author="",
+    single_chapter=False,
+    word_count=None,
+    language="",
+    fandoms="",
+    rating=None,
+    hits=None,
+    kudos=None,
+    crossovers=None,
+    bookmarks=None,
+    excluded_tags="",
+    comments=None,
+    completion_status=None,
+    page=1,
+    sort_column="",
+    sort_direction="",
+    revised_at="",
+    session=None,
+    characters="",
+    relationships="",
+    tags=""):
+    """Requests the results page for the search. Takes the same arguments as search()
+
+    Returns:
+        requests.models.Response: Search result's page
+    """
 
     query = utils.Query()
     query.add_field(f"work_search[query]={any_field if any_field != '' else ' '}")
@@ -280,5 +312,4 @@ def search(
         req = session.get(url)
     if req.status_code == 429:
         raise utils.HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
-    soup = BeautifulSoup(req.content, features="lxml")
-    return soup
+    return req
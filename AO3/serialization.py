@@ -0,0 +1,353 @@
+"""
+Compact binary snapshots of works, series and tags.
+
+Pickling a model keeps its BeautifulSoup page as HTML, which has to be parsed again when it is
+unpickled. A snapshot only keeps the fields extracted from the page, so loading one is a plain
+data copy. Restored objects are unloaded (like the works returned by a search): their fields are
+cached, but anything that needs the page (chapter text, comments, ...) requires a reload.
+
+Format (all integers are varints; signed ones are zigzag-encoded):
+    magic b"AO3S", version
+    string table: count, then the length and UTF-8 bytes of each string
+    records: count, then for each record its type, key, a bitmask of the fields present and their values
+
+Strings (titles, tag names, usernames, ...) are stored once in the string table and referenced by
+index, dates are stored as seconds since the epoch (datetimes) or ordinals (dates). The fields of
+each type are listed in _SCHEMAS; adding fields requires bumping VERSION.
+"""
+
+from datetime import date, datetime, timedelta
+
+from . import utils
+
+MAGIC = b"AO3S"
+VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+
+_WORK = 1
+_SERIES = 2
+_TAG = 3
+
+_SCHEMAS = {
+    _WORK: (
+        ("title", "str"),
+        ("authors", "users"),
+        ("series", "series"),
+        ("fandoms", "strs"),
+        ("relationships", "strs"),
+        ("characters", "strs"),
+        ("freeforms", "strs"),
+        ("warnings", "strs"),
+        ("categories", "strs"),
+        ("rating", "str"),
+        ("language", "str"),
+        ("summary", "str"),
+        ("collections", "strs"),
+        ("words", "int"),
+        ("nchapters", "int"),
+        ("expected_chapters", "int"),
+        ("hits", "int"),
+        ("kudos", "int"),
+        ("comments", "int"),
+        ("bookmarks", "int"),
+        ("complete", "bool"),
+        ("restricted", "bool"),
+        ("date_published", "datetime"),
+        ("date_updated", "datetime"),
+        ("date_edited", "datetime"),
+        ("date_queried", "datetime"),
+    ),
+    _SERIES: (
+        ("name", "str"),
+        ("creators", "users"),
+        ("series_begun", "date"),
+        ("series_updated", "date"),
+        ("words", "int"),
+        ("nworks", "int"),
+        ("complete", "bool"),
+        ("description", "str"),
+        ("notes", "str"),
+        ("nbookmarks", "int"),
+    ),
+    _TAG: (
+        ("query_error", "int"),
+        ("category", "str"),
+        ("canonical", "bool"),
+        ("works", "int"),
+        ("date_queried", "datetime"),
+        ("date_tag_search", "datetime"),
+        ("merged_name", "str"),
+        ("parent_names", "strs"),
+        ("immediate_parent_names", "strs"),
+        ("metatag_names", "strs"),
+        ("immediate_metatag_names", "strs"),
+        ("subtag_names", "strs"),
+        ("immediate_subtag_names", "strs"),
+        ("synonym_names", "strs"),
+        ("children_names", "strdict"),
+        ("_soup", "bool"),
+    ),
+}
+
+# Errors raised by properties that can't be extracted from an object's page
+_MISSING = (AttributeError, KeyError, TypeError, ValueError, utils.UnloadedError, utils.UnexpectedResponseError)
+
+
+def _write_varint(buffer, value):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def _write_signed(buffer, value):
+    _write_varint(buffer, value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def varint(self):
+        data = self.data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def signed(self):
+        value = self.varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def bytes(self, n):
+        start = self.pos
+        self.pos += n
+        if self.pos > len(self.data):
+            raise ValueError("Truncated snapshot")
+        return self.data[start:self.pos]
+
+
+class _Writer:
+    def __init__(self):
+        self.strings = {}
+        self.records = bytearray()
+        self.count = 0
+
+    def string(self, value):
+        """Index of a string in the string table, plus one (0 is None)"""
+        if value is None:
+            return 0
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        return index + 1
+
+    def value(self, kind, value):
+        buffer = self.records
+        if kind == "str":
+            _write_varint(buffer, self.string(value))
+        elif kind == "int":
+            _write_signed(buffer, int(value))
+        elif kind == "bool":
+            buffer.append(1 if value else 0)
+        elif kind == "strs":
+            _write_varint(buffer, len(value))
+            for item in value:
+                _write_varint(buffer, self.string(str(item)))
+        elif kind == "users":
+            _write_varint(buffer, len(value))
+            for user in value:
+                _write_varint(buffer, self.string(user.username))
+        elif kind == "series":
+            _write_varint(buffer, len(value))
+            for series in value:
+                _write_signed(buffer, int(series.id))
+                _write_varint(buffer, self.string(series.__dict__.get("name")))
+        elif kind == "strdict":
+            _write_varint(buffer, len(value))
+            for key, items in value.items():
+                _write_varint(buffer, self.string(str(key)))
+                self.value("strs", items)
+        elif kind == "datetime":
+            delta = value - _EPOCH if value.tzinfo is None else value.replace(tzinfo=None) - value.utcoffset() - _EPOCH
+            _write_signed(buffer, delta.days*86400 + delta.seconds)
+        elif kind == "date":
+            _write_varint(buffer, value.toordinal())
+
+    def record(self, type_, key, obj):
+        values = []
+        present = 0
+        for n, (attr, kind) in enumerate(_SCHEMAS[type_]):
+            value = _get_field(obj, attr)
+            if value is not None:
+                present |= 1 << n
+                values.append((kind, value))
+        _write_varint(self.records, type_)
+        if type_ == _TAG:
+            _write_varint(self.records, self.string(key))
+        else:
+            _write_signed(self.records, int(key))
+        _write_varint(self.records, present)
+        for kind, value in values:
+            self.value(kind, value)
+        self.count += 1
+
+    def getvalue(self):
+        buffer = bytearray(MAGIC)
+        _write_varint(buffer, VERSION)
+        _write_varint(buffer, len(self.strings))
+        for string in self.strings:
+            encoded = string.encode("utf-8")
+            _write_varint(buffer, len(encoded))
+            buffer += encoded
+        _write_varint(buffer, self.count)
+        buffer += self.records
+        return bytes(buffer)
+
+
+def _get_field(obj, attr):
+    """Returns a field that is already cached or can be extracted from the object's page, or None"""
+
+    if attr in obj.__dict__:
+        value = obj.__dict__[attr]
+    elif obj.loaded:
+        try:
+            value = getattr(obj, attr)
+        except _MISSING:
+            return None
+    else:
+        return None
+    if attr == "_soup":
+        # Tags are restored as parsed (see Tag.parse)
+        return value is not None
+    return value
+
+
+def dumps(objects):
+    """Serializes works, series and tags into a snapshot
+
+    Args:
+        objects (iterable): AO3.Work, AO3.Series and AO3.Tag objects. Fields that are neither cached nor available
+        from the object's page are left out.
+
+    Raises:
+        TypeError: Raised if an object can't be serialized
+
+    Returns:
+        bytes: Snapshot
+    """
+
+    from .series import Series
+    from .tags import Tag
+    from .works import Work
+
+    writer = _Writer()
+    for obj in objects:
+        if isinstance(obj, Work):
+            writer.record(_WORK, obj.id, obj)
+        elif isinstance(obj, Series):
+            writer.record(_SERIES, obj.id, obj)
+        elif isinstance(obj, Tag):
+            writer.record(_TAG, obj.name, obj)
+        else:
+            raise TypeError(f"Cannot serialize {type(obj).__name__} objects")
+    return writer.getvalue()
+
+def loads(data, session=None):
+    """Restores the objects of a snapshot
+
+    Args:
+        data (bytes): Snapshot created by dumps()
+        session (AO3.Session, optional): Session given to every restored object. Defaults to None.
+
+    Raises:
+        ValueError: Raised if the data isn't a snapshot, or was created by a newer version of this format
+
+    Returns:
+        list: Unloaded AO3.Work, AO3.Series and AO3.Tag objects, in the same order they were serialized.
+        Tags go through the tag cache, so a tag that is already cached is updated instead of duplicated.
+    """
+
+    from .series import Series
+    from .tags import Tag
+    from .users import User
+    from .works import Work
+
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an AO3 snapshot")
+    reader = _Reader(data)
+    reader.pos = len(MAGIC)
+    version = reader.varint()
+    if version > VERSION:
+        raise ValueError(f"Unsupported snapshot version ({version})")
+
+    strings = [None]
+    for _ in range(reader.varint()):
+        strings.append(str(reader.bytes(reader.varint()), "utf-8"))
+
+    def read(kind):
+        if kind == "str":
+            return strings[reader.varint()]
+        if kind == "int":
+            return reader.signed()
+        if kind == "bool":
+            return reader.bytes(1)[0] == 1
+        if kind == "strs":
+            return [strings[reader.varint()] for _ in range(reader.varint())]
+        if kind == "users":
+            return [User(strings[reader.varint()], load=False) for _ in range(reader.varint())]
+        if kind == "series":
+            series = []
+            for _ in range(reader.varint()):
+                s = Series(reader.signed(), session, False)
+                name = strings[reader.varint()]
+                if name is not None:
+                    setattr(s, "name", name)
+                series.append(s)
+            return series
+        if kind == "strdict":
+            return {strings[reader.varint()]: read("strs") for _ in range(reader.varint())}
+        if kind == "datetime":
+            return _EPOCH + timedelta(seconds=reader.signed())
+        if kind == "date":
+            return date.fromordinal(reader.varint())
+        raise ValueError(f"Unknown field kind '{kind}'")
+
+    objects = []
+    for _ in range(reader.varint()):
+        type_ = reader.varint()
+        if type_ not in _SCHEMAS:
+            raise ValueError(f"Unknown record type ({type_})")
+        if type_ == _TAG:
+            obj = Tag(strings[reader.varint()], session, False)
+        elif type_ == _SERIES:
+            obj = Series(reader.signed(), session, False)
+        else:
+            obj = Work(reader.signed(), session, False)
+        present = reader.varint()
+        for n, (attr, kind) in enumerate(_SCHEMAS[type_]):
+            if present >> n & 1:
+                value = read(kind)
+                if attr == "_soup":
+                    value = True if value else None
+                obj.__dict__[attr] = value
+        objects.append(obj)
+    return objects
+
+def dump(objects, path):
+    """Serializes works, series and tags into a snapshot file (see dumps)"""
+
+    with open(path, "wb") as file:
+        file.write(dumps(objects))
+
+def load(path, session=None):
+    """Restores the objects of a snapshot file (see loads)"""
+
+    with open(path, "rb") as file:
+        return loads(file.read(), session)
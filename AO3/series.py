@@ -2,11 +2,11 @@ from datetime import date
 from functools import cached_property
 import datetime
 import re
-import time
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
+from . import pagination, threadable, utils
 from .common import get_work_from_banner
+from .pagination import ListingPaginator
 from .requester import requester
 from .users import User
 from .works import Work
@@ -375,90 +375,38 @@ class Series:
 
     
     def _get_pagecount(self):
-        url = f"{self._seriesurl}&page=1"
+        url = f"{self._seriesurl}?page=1"
         soup = self.request(url)
-        pages = soup.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
+        return pagination.page_count(soup)
     
-    def get_work_ids(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60):
+    def get_work_ids(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
         """
+        Gets the IDs and titles of every work in this series.
+        Pages are loaded concurrently (see AO3.pagination.ListingPaginator).
+
         Arguments:
-            sleep (int): The time to wait between page requests
-            timeout_sleep (int): The time to wait after the rate limit is hit
+            hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None.
+            start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+            max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+            timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
 
         Returns:
-            works (list): All marked for later works
+            works (dict): workid -> title
         """
 
         if self._work_ids is None:
-
-          self._work_ids = {}
-          self._pagecount = self._get_pagecount()
-
-          for page in range(start_page, self._pagecount):
-                print(f"Processing page {page+1} of {self._pagecount} pages.")
-                #print(str(page))
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                  self._load_work_ids(page=page+1)
-
-                else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            self._load_work_ids(page=page+1)
-                            print(f"Read marked-for-later page {page+1}")
-                            loaded = True
-
-                        except utils.HTTPError:
-                            print(f"Loading being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-
-                  # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._work_ids 
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    print(f"Sleeping for {hist_sleep} seconds")
-                    time.sleep(hist_sleep)
-                    
-
+            paginator = ListingPaginator(
+                f"{self._seriesurl}?page={{page}}", pagination.work_id_titles, self.request,
+                start_page+1, None if max_pages is None else max_pages+1,
+                max_workers, timeout_sleep, hist_sleep)
+            self._work_ids = dict(paginator)
+            self._pagecount = paginator.pages
         return self._work_ids 
     
     def _load_work_ids(self, page=1):   
-        url = f"{self._seriesurl}&page={page}"
-        workPage = self.request(url)
-        worksRaw = workPage.find_all("li", {"role": "article"})
-
-        '''
-        #try later: general purpose version: 
-        all_works_soup =soup.find("ol", {"class": ["index", "group"]})
-        works_soup = all_works_soup.find_all("li", {"role": "article"})
-        '''
-        #read_later = worksRaw.find("ol", {"class": "reading work index group"})
-
-        for item in worksRaw:
-            # authors = []
-            workname = None
-            workid = None
-            for a in item.h4.find_all("a"):
-                if a.attrs["href"].startswith("/works"):
-                    workname = str(a.string)
-                    workid = utils.workid_from_url(a["href"])
-                    
-            if workname != None and workid != None:
-                self._work_ids[workid]= workname
+        url = f"{self._seriesurl}?page={page}"
+        self._work_ids.update(pagination.work_id_titles(self.request(url)))
 
     
     def get(self, *args, **kwargs):
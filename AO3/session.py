@@ -1,28 +1,87 @@
-import datetime
-import re
 import time
 from functools import cached_property
 
 import requests
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
+from . import pagination, parsing, threadable, utils
+from .pagination import ListingPaginator, Paginator
 from .requester import requester
 from .series import Series
 from .users import User
 from .works import Work
 
 
+class AuthCache:
+    """
+    Authenticity token and pseud IDs of a session, so commenting, bookmarking, etc. don't have to
+    load a page to find them every time. Entries expire 'ttl' seconds after they were stored.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.clear()
+
+    def clear(self):
+        self._token = (None, 0)
+        self._pseuds = (None, 0)
+
+    def _valid(self, entry):
+        value, stored = entry
+        if value is None or time.monotonic() - stored > self.ttl:
+            return None
+        return value
+
+    @property
+    def token(self):
+        """Cached authenticity token, or None if it expired"""
+        return self._valid(self._token)
+
+    @token.setter
+    def token(self, value):
+        self._token = (value, time.monotonic())
+
+    @property
+    def pseuds(self):
+        """Cached pseuds as a (dictionary of pseud name to ID, default pseud ID) tuple, or None if they expired.
+        The dictionary is None if the user only has one pseud"""
+        return self._valid(self._pseuds)
+
+    @pseuds.setter
+    def pseuds(self, value):
+        self._pseuds = (value, time.monotonic())
+
+    def __getstate__(self):
+        # time.monotonic() values are meaningless in another process
+        return {"ttl": self.ttl}
+
+    def __setstate__(self, d):
+        self.ttl = d["ttl"]
+        self.clear()
+
+
 class GuestSession:
     """
     AO3 guest session object
     """
 
-    def __init__(self):
+    def __init__(self, requests_session=None):
+        """Creates a new guest session
+
+        Args:
+            requests_session (requests.Session, optional): HTTP session to use (e.g. one sharing a connection pool,
+            see AO3.SessionManager). It isn't closed with this session. Defaults to None (a new one).
+        """
+
         self.is_authed = False
         self.authenticity_token = None
         self.username = ""
-        self.session = requests.Session()
+        self._owns_session = requests_session is None
+        self.session = requests.Session() if requests_session is None else requests_session
+        # Authenticity token and pseud IDs used by utils.comment, utils.bookmark, etc.
+        self.auth_cache = AuthCache()
+        # Optional AO3.ParsePool used to parse listing pages in worker processes
+        self.parse_pool = None
         
     @property
     def user(self):
@@ -98,6 +157,7 @@ class GuestSession:
         if token is None:
             raise utils.UnexpectedResponseError("Couldn't refresh token")
         self.authenticity_token = token.attrs["value"]
+        self.auth_cache.token = self.authenticity_token
         
     def get(self, *args, **kwargs):
         """Request a web page and return a Response object"""  
@@ -137,31 +197,32 @@ class GuestSession:
         return req
     
     def __del__(self):
-        self.session.close()
+        if getattr(self, "_owns_session", True):
+            self.session.close()
 
 class Session(GuestSession):
     """
     AO3 session object
     """
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, requests_session=None):
         """Creates a new AO3 session object
 
         Args:
             username (str): AO3 username
             password (str): AO3 password
+            requests_session (requests.Session, optional): HTTP session to log in with (e.g. one sharing a connection pool,
+            see AO3.SessionManager). It isn't closed with this session. Defaults to None (a new one).
 
         Raises:
             utils.LoginError: Login was unsucessful (wrong username or password)
         """
 
-        super().__init__()
+        super().__init__(requests_session)
         self.is_authed = True
         self.username = username
         self.url = "https://archiveofourown.org/users/%s"%self.username
         
-        self.session = requests.Session()
-        
         soup = self.request("https://archiveofourown.org/users/login")
         self.authenticity_token = soup.find("input", {"name": 'authenticity_token'})["value"]
         payload = {'user[login]': username,
@@ -178,6 +239,7 @@ class Session(GuestSession):
         self._bookmarks = None
         self._subscriptions = None
         self._history = None
+        self._history_index = {}
         self._marked_for_later = None
         self._series_bookmarks = None 
         
@@ -197,6 +259,8 @@ class Session(GuestSession):
                 self.__dict__[attr] = BeautifulSoup(value, "lxml")
             else:
                 self.__dict__[attr] = value
+        # Sessions pickled before the cache existed
+        self.__dict__.setdefault("auth_cache", AuthCache())
         
     def clear_cache(self):
         for attr in self.__class__.__dict__:
@@ -205,20 +269,14 @@ class Session(GuestSession):
                     delattr(self, attr)
         self._bookmarks = None
         self._subscriptions = None
+        self._history = None
+        self._history_index = {}
         
     @cached_property
     def _subscription_pages(self):
         url = self._subscriptions_url.format(self.username, 1)
         soup = self.request(url)
-        pages = soup.find("ol", {"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
+        return pagination.page_count(soup)
     
     def get_work_subscriptions(self, use_threading=False):
         """
@@ -324,144 +382,137 @@ class Session(GuestSession):
                 setattr(new, "authors", authors)
                 self._subscriptions.append(new)
 
+    def _paginate(self, load_page, pages, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
+        last_page = pages if max_pages is None else min(pages, max_pages+1)
+        return iter(Paginator(load_page, start_page+1, last_page, max_workers, timeout_sleep, hist_sleep))
+
+    def _listing(self, url, extract, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
+        last_page = None if max_pages is None else max_pages+1
+        return iter(ListingPaginator(url, extract, self.request, start_page+1, last_page, max_workers, timeout_sleep, hist_sleep))
+
     @cached_property
     def _get_history_pages(self):
         url = self._history_url.format(self.username, 1)
         soup = self.request(url)
-        pages = soup.find("ol", {"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
-
-    def get_history(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60, lite = False):
+        return pagination.page_count(soup)
+
+    def get_history(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, lite=False, max_workers=4):
         """
         Get history works. Loads them if they haven't been previously.
+        Pages are loaded concurrently (see AO3.pagination.Paginator).
 
         Arguments:
-          hist_sleep (int to sleep between requests)
-          start_page (int for page to start on, zero-indexed)
-          max_pages  (int for page to end on, zero-indexed)
-          timeout_sleep (int, if set will attempt to recovery from http errors, likely timeouts, if set to None will just attempt to load)
-
- takes two arguments the first hist_sleep is an int and is a sleep to run between pages of history to load to avoid hitting the rate limiter, the second is an int of the maximum number of pages of history to load, by default this is None so loads them all.
+          hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None (only the shared rate limiter applies).
+          start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+          max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+          timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+          max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+          lite (bool, optional): Only load the work IDs and titles. Defaults to False.
 
         Returns:
-            list: List of tuples (Work, number-of-visits, datetime-last-visited)
+            list: List of lists [Work, number-of-visits, datetime-last-visited, marked-for-later, status]
+            (dict workid -> title if lite is True)
         """
         
         if self._history is None:
-            self._history = []
-            if lite: 
-                self._history = {}
-            #self._history_pages= self._get_history_pages()
-            for page in range(start_page, self._get_history_pages):
-                print(f"Processing page {page+1} of {self._get_history_pages} pages.")
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                    if lite: 
-                        self._load_history_id(page=page+1)
-                    else: 
-                        self._load_history(page=page+1)
-                    
+            self._history = {} if lite else []
+            self._history_index = {}
+            for item in self.iter_history(hist_sleep, start_page, max_pages, timeout_sleep, lite, max_workers):
+                if lite:
+                    self._history[item[0]] = item[1]
                 else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            if lite: 
-                                self._load_history_id(page=page+1)
-                                loaded = True
-                            else: 
-                                self._load_history(page=page+1)
-                                # print(f"Read history page {page+1}")
-                                loaded = True
-
-                        except utils.HTTPError:
-                            # print(f"History being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-                # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._history
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    time.sleep(hist_sleep)
-
+                    self._add_history_item(item)
         return self._history
 
-    def _load_history(self, page=1):       
+    def sync_history(self, timeout_sleep=60, max_workers=4):
+        """
+        Brings the loaded history up to date and returns the entries that changed since the last sync.
+        
+        The history is sorted by last visit, so pages are requested from the start only until
+        an entry is found that is unchanged since the last sync (same visit count and last visit date):
+        every entry after it is unchanged too. The first sync loads the whole history concurrently.
+        Changes to the 'marked for later' or update status of entries below that point aren't picked up;
+        set Session._history to None (or call clear_cache()) to load everything again.
+
+        Arguments:
+          timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+          max_workers (int, optional): Maximum number of pages being loaded at once during the first sync. Defaults to 4.
+
+        Returns:
+            list: History entries that are new or were visited again, newest first
+        """
+        
+        if not isinstance(self._history, list) or not self._history_index:
+            self.__dict__.pop("_get_history_pages", None)
+            self._history = None
+            return list(self.get_history(timeout_sleep=timeout_sleep, max_workers=max_workers))
+        
+        updated = []
+        for item in Paginator(self._history_page, 1, None, 1, timeout_sleep):
+            old = self._history_index.get(item[0].id)
+            if old is not None and old[1] == item[1] and old[2] == item[2]:
+                break
+            updated.append(item)
+            self._history_index[item[0].id] = item
+        if updated:
+            changed = set(item[0].id for item in updated)
+            self._history = updated + [item for item in self._history if item[0].id not in changed]
+        return updated
+
+    def _add_history_item(self, item):
+        if item[0].id not in self._history_index:
+            self._history_index[item[0].id] = item
+            self._history.append(item)
+
+    def iter_history(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, lite=False, max_workers=4):
+        """
+        Returns a generator that yields the history items page by page, as soon as they are loaded.
+        Takes the same arguments as get_history(). If lite is True, the items are (workid, title) tuples.
+        """
+        
+        if lite:
+            load_page = self._history_id_page
+        else:
+            load_page = self._history_page
+        return self._paginate(load_page, self._get_history_pages, hist_sleep, start_page, max_pages, timeout_sleep, max_workers)
+
+    def _history_page(self, page=1):
         url = self._history_url.format(self.username, page)
-        soup = self.request(url)
+        req = self.get(url)
+        
+        items = []
+        for workid, workname, authors, visited_num, visited_date, mfl, status in parsing.parse(parsing.parse_history_page, req.content, self.parse_pool):
+            new = Work(workid, load=False)
+            if not authors: 
+                authors = ["Anonymous"]
+            setattr(new, "title", workname)
+            setattr(new, "authors", authors)
+            items.append([new, visited_num, visited_date, mfl, status])
+        return items
 
-        '''
-        #try later: general purpose version: 
-        all_works_soup =soup.find("ol", {"class": ["index", "group"]})
-        works_soup = all_works_soup.find_all("li", {"role": "article"})
-        '''
+    def _load_history(self, page=1):       
+        for item in self._history_page(page):
+            self._add_history_item(item)
+
+    def _history_id_page(self, page=1):
+        url = self._history_url.format(self.username, page)
+        workPage = self.request(url)
         
-        history = soup.find("ol", {"class": "reading work index group"})
-        for item in history.find_all("li", {"role": "article"}):
-            authors = []
+        items = []
+        for item in workPage.find_all("li", {"role": "article"}):
             workname = None
             workid = None
-            #author = None
             for a in item.h4.find_all("a"):
                 if a.attrs["href"].startswith("/works"):
                     workname = str(a.string)
                     workid = utils.workid_from_url(a["href"])
-            for author in item.h4.find_all("a", attrs={"rel" : "author"}):
-                    authors.append(author.text)
-
-            visited_date = None
-            visited_num = 1
-            mfl = False
-            status = None 
-            for viewed in item.find_all("h4", {"class": "viewed heading" }):
-                data_string = str(viewed)
-                
-                date_str = re.search('<span>Last visited:</span> (\d{2} .+ \d{4})', data_string)
-                if date_str is not None:
-                    raw_date = date_str.group(1)
-                    date_time_obj = datetime.datetime.strptime(date_str.group(1), '%d %b %Y')
-                    visited_date = date_time_obj
-                    
-                visited_str = re.search('Visited (\d+) times', data_string)
-                if visited_str is not None:
-                    visited_num = int(visited_str.group(1))
                     
-                mfl_str = re.search('Marked for Later.', data_string)
-                if mfl_str is not None:
-                    mfl = True
-
-                if re.search('Latest version.', data_string) is not None:
-                    status = 'latest version'
-                if re.search('Update available.', data_string) is not None:
-                    status = 'update available'
-                if re.search('Minor edits made since then.', data_string) is not None:
-                    status = 'latest version, minor edits'                
-
             if workname != None and workid != None:
-                new = Work(workid, load=False)
-                if not authors: 
-                    authors = ["Anonymous"]
-                setattr(new, "title", workname)
-                setattr(new, "authors", authors)
-                # setattr(new, "authors", authors)
-                hist_item = [ new, visited_num, visited_date, mfl, status]
-                # print(hist_item)
-                if new not in self._history:
-                    self._history.append(hist_item)
-
-
-
-
+                viewed = item.find("h4", {"class": "viewed heading"})
+                if viewed is not None:
+                    workname += f" --- {viewed.text}"
+                items.append((workid, workname))
+        return items
     
     def _load_history_id (self, page=1):       
         '''a more lightweight version to load history: 
@@ -470,55 +521,14 @@ class Session(GuestSession):
 
         could be extended to contain more metadata ....
         '''
-        url = self._history_url.format(self.username, page)
-        workPage = self.request(url)
-        worksRaw = workPage.find_all("li", {"role": "article"})
-        
-        
-        '''
-        #try later: general purpose version: 
-        all_works_soup =soup.find("ol", {"class": ["index", "group"]})
-        works_soup = all_works_soup.find_all("li", {"role": "article"})
-        '''
-        
-        #read_later = worksRaw.find("ol", {"class": "reading work index group"})
-
-        for item in worksRaw:
-            # authors = []
-            workname = None
-            workid = None
-            for a in item.h4.find_all("a"):
-                if a.attrs["href"].startswith("/works"):
-                    workname = str(a.string)
-                    workid = utils.workid_from_url(a["href"])
-            #########---############
-            # added: 
-            last_read_blurb = item.find_all("h4", {"class": "viewed heading"}).text
-            workname+= f" --- {last_read_blurb}"
-            #########---############
-                    
-            if workname != None and workid != None:
-                #new = Work(workid, load=False)
-                #setattr(new, "title", workname)
-                # setattr(new, "authors", authors)
-                # hist_item = [ new, visited_num, visited_date ]
-                # print(hist_item)
-                #if new not in self._history:
-                self._history[workid]= workname
+        for workid, workname in self._history_id_page(page):
+            self._history[workid] = workname
                 
     #@cached_property
     def _get_bookmark_pages(self):
         url = self._bookmarks_url.format(self.username, 1)
         soup = self.request(url)
-        pages = soup.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
+        return pagination.page_count(soup)
     
     # def get_bookmarks(self, use_threading=False):
     #     """
@@ -537,65 +547,46 @@ class Session(GuestSession):
     #                 self._load_bookmarks(page=page+1)
     #     return self._bookmarks
 
-    def get_bookmarks(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60, lite = False):
-        
+    def get_bookmarks(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, lite=False, max_workers=4):
         """
-        Kopie von get_history: jetzt auch mit sleep etc. 
+        Get bookmarked works. Loads them if they haven't been previously.
+        Pages are loaded concurrently (see AO3.pagination.Paginator).
 
-        
-        Get bookmarked works. Loads them if they haven't been previously
+        Arguments:
+          hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None (only the shared rate limiter applies).
+          start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+          max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+          timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+          max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+          lite (bool, optional): Only load the work IDs and titles. Defaults to False.
 
         Returns:
-            list: List of tuples (workid, workname, authors)
+            list: List of Work objects (dict workid -> title if lite is True)
         """
 
         if self._bookmarks is None:
-            self._bookmarks = []
-            if lite: 
-                self._bookmarks = {}
-                
-            self._bookmark_pages= self._get_bookmark_pages()
-            #self._soupDump = []
-            for page in range(start_page, self._bookmark_pages):
-                print(f"Processing page {page+1} of {self._bookmark_pages} pages.")
-              
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                    if lite: 
-                        self._load_bookmarks_id(page=page+1)
-                    else: 
-                        self._load_bookmarks(page=page+1)
-
-                else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            if lite:   
-                                self._load_bookmarks_id(page=page+1)
-                                loaded = True
-                                #print(f"Read history page {page+1}")
-                            else:
-                                self._load_bookmarks(page=page+1)
-                                loaded = True
-
-                        except utils.HTTPError:
-                            print(f"History being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-
-                  # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._bookmarks
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    print(f"Sleeping for {hist_sleep} seconds")
-                    time.sleep(hist_sleep)
-                    
-
+            self._bookmarks = {} if lite else []
+            seen = set()
+            for item in self.iter_bookmarks(hist_sleep, start_page, max_pages, timeout_sleep, lite, max_workers):
+                if lite:
+                    self._bookmarks[item[0]] = item[1]
+                elif item.id not in seen:
+                    seen.add(item.id)
+                    self._bookmarks.append(item)
         return self._bookmarks
+
+    def iter_bookmarks(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, lite=False, max_workers=4):
+        """
+        Returns a generator that yields the bookmarked works page by page, as soon as they are loaded.
+        Takes the same arguments as get_bookmarks(). If lite is True, the items are (workid, title) tuples.
+        """
+        
+        if lite:
+            extract = self._bookmarks_id_from_soup
+        else:
+            extract = self._bookmarks_from_soup
+        url = lambda page: self._bookmarks_url.format(self.username, page)
+        return self._listing(url, extract, hist_sleep, start_page, max_pages, timeout_sleep, max_workers)
     
     @threadable.threadable
     def load_bookmarks_threaded(self):
@@ -612,11 +603,12 @@ class Session(GuestSession):
         for thread in threads:
             thread.join()
     
-    #@threadable.threadable
-    def _load_bookmarks(self, page=1):       
+    def _bookmarks_page(self, page=1):
         url = self._bookmarks_url.format(self.username, page)
-        soup = self.request(url)
-        #print(soup)
+        return self._bookmarks_from_soup(self.request(url))
+
+    @staticmethod
+    def _bookmarks_from_soup(soup):
         
         '''
         #try later: general purpose version: 
@@ -625,7 +617,7 @@ class Session(GuestSession):
         '''
         bookmarks = soup.find("ol", {"class": "bookmark index group"})
 
-        
+        items = []
         for bookm in bookmarks.find_all("li", {"class": ["bookmark", "index", "group"]}): # could use .find_all("li", {"role": "article"}) instead!!
             # this tmk doesnt actually find anything else than .find(ol) which created bookmarks!
             # doesnt matter though; 
@@ -654,13 +646,21 @@ class Session(GuestSession):
                     setattr(new, "title", workname)
                     setattr(new, "authors", authors)
                     setattr(new, "recommended", recommended)
-                    if new not in self._bookmarks:
-                        self._bookmarks.append(new)
+                    items.append(new)
+        return items
 
-    def _load_bookmarks_id(self, page=1):
+    #@threadable.threadable
+    def _load_bookmarks(self, page=1):       
+        for new in self._bookmarks_page(page):
+            if new not in self._bookmarks:
+                self._bookmarks.append(new)
+
+    def _bookmarks_id_page(self, page=1):
         url = self._bookmarks_url.format(self.username, page)
-        soup = self.request(url)
-        #print(soup)
+        return self._bookmarks_id_from_soup(self.request(url))
+
+    @staticmethod
+    def _bookmarks_id_from_soup(soup):
         
         '''
         #try later: general purpose version: 
@@ -669,7 +669,7 @@ class Session(GuestSession):
         '''
         bookmarks = soup.find("ol", {"class": "bookmark index group"})
 
-        
+        items = []
         for bookm in bookmarks.find_all("li", {"role": "article"}):
             workname = None
             workid = None
@@ -679,7 +679,12 @@ class Session(GuestSession):
                     workid = utils.workid_from_url(a["href"])
                     
             if workname != None and workid != None:
-                self._bookmarks[workid]= workname
+                items.append((workid, workname))
+        return items
+
+    def _load_bookmarks_id(self, page=1):
+        for workid, workname in self._bookmarks_id_page(page):
+            self._bookmarks[workid] = workname
             
     #@cached_property
     def bookmarks(self):
@@ -757,182 +762,87 @@ class Session(GuestSession):
     #         time.sleep(sleep)
     #     return works
 
-    def _get_marked_for_later_pages(self):
-        # pageRaw = self.request(f"https://archiveofourown.org/users/{self.username}/readings?page=1&show=to-read").find("ol", {"aria-label": "Pagination"}).find_all("li")
-        # maxPage = int(pageRaw[len(pageRaw)-2].text)
-        # return maxPage
-
-        soup = self.request(f"https://archiveofourown.org/users/{self.username}/readings?page=1&show=to-read")
-        pages = soup.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
-
-    
-        
-    def get_marked_for_later(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60):
+    def get_marked_for_later(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
         """
-        Gets every marked for later work
+        Gets every marked for later work.
+        Pages are loaded concurrently (see AO3.pagination.Paginator).
 
         Arguments:
-            sleep (int): The time to wait between page requests
-            timeout_sleep (int): The time to wait after the rate limit is hit
+          hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None (only the shared rate limiter applies).
+          start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+          max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+          timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+          max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
 
         Returns:
-            works (list): All marked for later works
+            works (dict): All marked for later works (workid -> title)
         """
 
         if self._marked_for_later is None:
-
-          self._marked_for_later = {}
-          self._marked_for_later_pages = self._get_marked_for_later_pages()
-
-          for page in range(start_page, self._marked_for_later_pages):
-                print(f"Processing page {page+1} of {self._marked_for_later_pages} pages.")
-                #print(str(page))
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                  self._load_marked_for_later(page=page+1)
-
-                else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            self._load_marked_for_later(page=page+1)
-                            print(f"Read marked-for-later page {page+1}")
-                            loaded = True
-
-                        except utils.HTTPError:
-                            print(f"Loading being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-
-                  # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._marked_for_later 
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    print(f"Sleeping for {hist_sleep} seconds")
-                    time.sleep(hist_sleep)
-                    
-
+            self._marked_for_later = {}
+            for workid, workname in self.iter_marked_for_later(hist_sleep, start_page, max_pages, timeout_sleep, max_workers):
+                self._marked_for_later[workid] = workname
         return self._marked_for_later 
 
-    def _load_marked_for_later(self, page=1):   
+    def iter_marked_for_later(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
+        """
+        Returns a generator that yields (workid, title) tuples of the marked for later works page by page.
+        Takes the same arguments as get_marked_for_later().
+        """
+        
+        url = f"https://archiveofourown.org/users/{self.username}/readings?show=to-read&page={{page}}"
+        return self._listing(url, pagination.work_id_titles, hist_sleep, start_page, max_pages, timeout_sleep, max_workers)
+
+    def _marked_for_later_page(self, page=1):
         url = f"https://archiveofourown.org/users/{self.username}/readings?show=to-read&page={page}"
-        workPage = self.request(url)
-        worksRaw = workPage.find_all("li", {"role": "article"})
-        #read_later = worksRaw.find("ol", {"class": "reading work index group"})
-        '''
-        #try later: general purpose version: 
-        all_works_soup =soup.find("ol", {"class": ["index", "group"]})
-        works_soup = all_works_soup.find_all("li", {"role": "article"})
-        '''
-        for item in worksRaw:
-            # authors = []
-            workname = None
-            workid = None
-            for a in item.h4.find_all("a"):
-                if a.attrs["href"].startswith("/works"):
-                    workname = str(a.string)
-                    workid = utils.workid_from_url(a["href"])
-                    
-            if workname != None and workid != None:
-                #new = Work(workid, load=False)
-                #setattr(new, "title", workname)
-                # setattr(new, "authors", authors)
-                # hist_item = [ new, visited_num, visited_date ]
-                # print(hist_item)
-                #if new not in self._history:
-                self._marked_for_later[workid]= workname
+        return pagination.work_id_titles(self.request(url))
 
+    def _load_marked_for_later(self, page=1):   
+        for workid, workname in self._marked_for_later_page(page):
+            self._marked_for_later[workid] = workname
 
-    def _get_bookmarked_series_pages(self):
-        # pageRaw = self.request(f"https://archiveofourown.org/users/{self.username}/readings?page=1&show=to-read").find("ol", {"aria-label": "Pagination"}).find_all("li")
-        # maxPage = int(pageRaw[len(pageRaw)-2].text)
-        # return maxPage
-        url = f"https://archiveofourown.org/bookmarks?bookmark_search%5Bbookmarkable_query%5D=bookmarkable_type%3A+Series&commit=Sort+and+Filter&user_id={self.username}&page=1"
-        #soup = self.request(f"https://archiveofourown.org/bookmarks?bookmark_search[sort_column]=created_at&bookmark_search[other_tag_names]=&bookmark_search[other_bookmark_tag_names]=&bookmark_search[excluded_tag_names]=&bookmark_search[excluded_bookmark_tag_names]=&bookmark_search[bookmarkable_query]=bookmarkable_type%3A+Series&bookmark_search[bookmark_query]=&bookmark_search[language_id]=&bookmark_search[rec]=0&bookmark_search[with_notes]=0&commit=Sort+and+Filter&user_id={self.username}&page=1")
-        soup = self.request(url)
-        pages = soup.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            pages = soup.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
 
-        
-    def get_bookmarked_series(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60):
+    def get_bookmarked_series(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
         """
-        Gets all bookmarked series 
+        Gets all bookmarked series.
+        Pages are loaded concurrently (see AO3.pagination.Paginator).
 
         Arguments:
-            sleep (int): The time to wait between page requests
-            timeout_sleep (int): The time to wait after the rate limit is hit
+          hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None (only the shared rate limiter applies).
+          start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+          max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+          timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+          max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
 
         Returns:
-            works (dict): all bookmarked Series
+            works (dict): all bookmarked Series (seriesid -> name)
         """
 
         if self._series_bookmarks is None:
-
-          self._series_bookmarks = {}
-          self._bookmarked_series_pages = self._get_bookmarked_series_pages()
-
-          for page in range(start_page, self._bookmarked_series_pages):
-                print(f"Processing page {page+1} of {self._bookmarked_series_pages} pages.")
-                #print(str(page))
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                  self._load_bookmarked_series(page=page+1)
-
-                else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            self._load_bookmarked_series(page=page+1)
-                            print(f"Read page {page+1}")
-                            loaded = True
-
-                        except utils.HTTPError:
-                            print(f"Loading being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-
-                  # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._series_bookmarks
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    print(f"Sleeping for {hist_sleep} seconds")
-                    time.sleep(hist_sleep)
-                    
-
+            self._series_bookmarks = {}
+            for seriesid, seriesname in self.iter_bookmarked_series(hist_sleep, start_page, max_pages, timeout_sleep, max_workers):
+                self._series_bookmarks[seriesid] = seriesname
         return self._series_bookmarks
 
-    def _load_bookmarked_series(self, page=1):   
+    def iter_bookmarked_series(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
+        """
+        Returns a generator that yields (seriesid, name) tuples of the bookmarked series page by page.
+        Takes the same arguments as get_bookmarked_series().
+        """
+        
+        url = f"https://archiveofourown.org/bookmarks?bookmark_search%5Bbookmarkable_query%5D=bookmarkable_type%3A+Series&commit=Sort+and+Filter&user_id={self.username}&page={{page}}"
+        return self._listing(url, self._bookmarked_series_from_soup, hist_sleep, start_page, max_pages, timeout_sleep, max_workers)
+
+    def _bookmarked_series_page(self, page=1):   
 
         
         #url = f"https://archiveofourown.org/bookmarks?bookmark_search[sort_column]=created_at&bookmark_search[other_tag_names]=&bookmark_search[other_bookmark_tag_names]=&bookmark_search[excluded_tag_names]=&bookmark_search[excluded_bookmark_tag_names]=&bookmark_search[bookmarkable_query]=bookmarkable_type%3A+Series&bookmark_search[bookmark_query]=&bookmark_search[language_id]=&bookmark_search[rec]=0&bookmark_search[with_notes]=0&commit=Sort+and+Filter&user_id={self.username}&page={page}"
         
         url = f"https://archiveofourown.org/bookmarks?bookmark_search%5Bbookmarkable_query%5D=bookmarkable_type%3A+Series&commit=Sort+and+Filter&user_id={self.username}&page={page}"
-        workPage = self.request(url)
+        return self._bookmarked_series_from_soup(self.request(url))
+
+    @staticmethod
+    def _bookmarked_series_from_soup(workPage):
         worksRaw = workPage.find_all("li", {"role": "article"})
         #read_later = worksRaw.find("ol", {"class": "reading work index group"})
         '''
@@ -941,6 +851,7 @@ class Session(GuestSession):
         works_soup = all_works_soup.find_all("li", {"role": "article"})
         '''
 
+        items = []
         for item in worksRaw:
             # authors = []
             seriesname = None
@@ -957,7 +868,12 @@ class Session(GuestSession):
                 # hist_item = [ new, visited_num, visited_date ]
                 # print(hist_item)
                 #if new not in self._history:
-                self._series_bookmarks[seriesid]= seriesname
+                items.append((seriesid, seriesname))
+        return items
+
+    def _load_bookmarked_series(self, page=1):
+        for seriesid, seriesname in self._bookmarked_series_page(page):
+            self._series_bookmarks[seriesid] = seriesname
 
 
 
@@ -0,0 +1,289 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import utils
+from .session import Session
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: allows bursts of up to 'capacity' requests, refilled at 'rate' requests per second
+    """
+
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Takes tokens from the bucket, sleeping until enough of them are available"""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _AccountSession(requests.Session):
+    """HTTP session of a single account: its own cookies, the manager's shared connection pool, and its request budget"""
+
+    def __init__(self, adapter, bucket):
+        super().__init__()
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self._bucket = bucket
+        self._local = threading.local()
+
+    @contextmanager
+    def throttle(self):
+        """Takes a request from the account's budget. AO3.requester enters this before waiting for the global
+        rate limiter, so an account that ran out of requests doesn't hold up the others while it waits"""
+
+        if self._bucket is not None:
+            self._bucket.acquire()
+        self._local.throttled = True
+        try:
+            yield
+        finally:
+            self._local.throttled = False
+
+    def request(self, *args, **kwargs):
+        # Requests that don't go through AO3.requester (e.g. Session.post) are charged here
+        if self._bucket is not None and not getattr(self._local, "throttled", False):
+            self._bucket.acquire()
+        return super().request(*args, **kwargs)
+
+    def close(self):
+        # The adapter is shared with every other account, so it's closed by the manager
+        self.adapters.clear()
+        super().close()
+
+
+class _Account:
+    __slots__ = ("username", "password", "bucket", "session", "last_used", "lock")
+
+    def __init__(self, username, password, bucket):
+        self.username = username
+        self.password = password
+        self.bucket = bucket
+        self.session = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class SessionManager:
+    """
+    Keeps the sessions of many AO3 accounts.
+
+    - Accounts are logged in the first time they're used, not when they're added.
+    - Every account has its own cookies, but they all share one connection pool.
+    - Sessions that haven't been used for 'idle_timeout' seconds are dropped, and at most 'max_sessions'
+      are kept at once (the least recently used ones are dropped first). A dropped session isn't logged
+      out on AO3; the manager just forgets it, and its account logs in again the next time it's used.
+    - Each account can be limited to 'rate' requests per second (with bursts of up to 'burst' requests),
+      so a single busy account can't use up the requests of every other one. This is on top of the
+      global rate limit of AO3.requester.
+
+    Example:
+        manager = AO3.SessionManager(rate=0.5)
+        manager.add("alice", "alice_ao3", "password")
+        history = manager.run("alice", lambda session: session.get_history())
+    """
+
+    def __init__(self, max_sessions=100, idle_timeout=1800, rate=None, burst=10, pool_connections=10, pool_maxsize=10):
+        """Creates a new session manager
+
+        Args:
+            max_sessions (int, optional): Maximum number of logged in sessions. Defaults to 100.
+            idle_timeout (int, optional): Seconds after which an unused session is dropped (None to keep them). Defaults to 1800.
+            rate (float, optional): Requests per second allowed for each account (None for no limit). Defaults to None.
+            burst (int, optional): Requests an account can make at once before being limited to 'rate'. Defaults to 10.
+            pool_connections (int, optional): Number of hosts to keep connection pools for. Defaults to 10.
+            pool_maxsize (int, optional): Connections kept per host. Defaults to 10.
+
+        Raises:
+            ValueError: Raised if rate isn't positive or burst is less than 1
+        """
+
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.rate = rate
+        self.burst = burst
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._accounts = {}
+        # Keys of the accounts that are logged in, least recently used first
+        self._active = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._accounts
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def active(self):
+        """Keys of the accounts that are currently logged in"""
+
+        with self._lock:
+            return list(self._active)
+
+    def add(self, key, username, password):
+        """Registers an account. It isn't logged in until it's used
+
+        Args:
+            key (hashable): Key used to refer to this account (e.g. the ID of your own user)
+            username (str): AO3 username
+            password (str): AO3 password
+        """
+
+        bucket = None if self.rate is None else TokenBucket(self.rate, self.burst)
+        with self._lock:
+            if key in self._accounts:
+                self._drop(key)
+            self._accounts[key] = _Account(username, password, bucket)
+
+    def remove(self, key):
+        """Unregisters an account and drops its session"""
+
+        with self._lock:
+            self._drop(key)
+            self._accounts.pop(key, None)
+
+    def get(self, key):
+        """Returns the session of an account, logging it in if needed
+
+        Args:
+            key (hashable): Account key
+
+        Raises:
+            KeyError: Raised if the account isn't registered
+            utils.LoginError: Raised if the account couldn't log in
+
+        Returns:
+            AO3.Session: Logged in session
+        """
+
+        with self._lock:
+            account = self._accounts.get(key)
+            if account is None:
+                raise KeyError(f"Unknown account {key!r}")
+            account.last_used = time.monotonic()
+            if key in self._active:
+                self._active.move_to_end(key)
+            self._evict_idle()
+
+        with account.lock:
+            session = account.session
+            if session is None:
+                requests_session = _AccountSession(self._adapter, account.bucket)
+                session = Session(account.username, account.password, requests_session=requests_session)
+                with self._lock:
+                    if self._accounts.get(key) is not account:
+                        # Removed while logging in
+                        return session
+                    account.session = session
+                    self._active[key] = None
+                    while len(self._active) > self.max_sessions:
+                        self._drop(next(iter(self._active)))
+            return session
+
+    def run(self, key, function, *args, **kwargs):
+        """Calls function(session, *args, **kwargs) with the session of an account.
+        If it raises utils.AuthError (e.g. because the session expired), the account logs in again and
+        the function is called once more.
+
+        Args:
+            key (hashable): Account key
+            function (callable): Function to call
+
+        Returns:
+            Whatever the function returns
+        """
+
+        session = self.get(key)
+        try:
+            return function(session, *args, **kwargs)
+        except utils.AuthError:
+            self.invalidate(key, session)
+            return function(self.get(key), *args, **kwargs)
+
+    def invalidate(self, key, session=None):
+        """Drops the session of an account, so it logs in again the next time it's used
+
+        Args:
+            key (hashable): Account key
+            session (AO3.Session, optional): Only drop the account's session if it is still this one. Defaults to None.
+        """
+
+        with self._lock:
+            account = self._accounts.get(key)
+            if account is not None and (session is None or account.session is session):
+                self._drop(key)
+
+    def evict_idle(self):
+        """Drops the sessions that have been idle for longer than idle_timeout
+
+        Returns:
+            int: Number of sessions dropped
+        """
+
+        with self._lock:
+            return self._evict_idle()
+
+    def close(self):
+        """Drops every session and closes the shared connection pool"""
+
+        with self._lock:
+            for key in list(self._active):
+                self._drop(key)
+        self._adapter.close()
+
+    def _evict_idle(self):
+        if self.idle_timeout is None:
+            return 0
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = 0
+        while self._active:
+            key = next(iter(self._active))
+            if self._accounts[key].last_used > deadline:
+                break
+            self._drop(key)
+            evicted += 1
+        return evicted
+
+    def _drop(self, key):
+        # The session isn't closed, as another thread may still be using it. It only holds cookies
+        # and a reference to the shared pool, so it's simply left to the garbage collector
+        self._active.pop(key, None)
+        account = self._accounts.get(key)
+        if account is not None:
+            account.session = None
@@ -1,5 +1,6 @@
 from math import ceil
 
+import lxml.html
 from bs4 import BeautifulSoup
 
 from . import threadable, utils
@@ -10,7 +11,7 @@ from .users import User
 from .works import Work
 from .tags import Tag
 
-from .utils import ImproperSearchError, tagname_from_href
+from .utils import ImproperSearchError
 
 import re
 from datetime import datetime
@@ -32,6 +33,12 @@ KUDOS = "kudos_count"
 DESCENDING = "desc"
 ASCENDING = "asc"
 
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_TAG_ROW_RE = re.compile(r"([A-Za-z]+): (.+) \u200e\((\d+)\)")
+_RESULTS_XPATH = "//ol[contains(concat(' ', normalize-space(@class), ' '), ' tag ')]"
+_CANONICAL_XPATH = ".//span[contains(concat(' ', normalize-space(@class), ' '), ' canonical ')]"
+_HEADING_XPATH = "//h3[contains(concat(' ', normalize-space(@class), ' '), ' heading ')]"
+
 #https://stackoverflow.com/questions/18495098/python-check-if-an-object-is-a-list-of-strings
 def is_list_of_strings(lst):
         return bool(lst) and not isinstance(lst, str) and all(isinstance(elem, str) for elem in lst)
@@ -79,7 +86,7 @@ class TagSearch:
         This function is threadable.
         """
 
-        soup = tag_search(
+        req = _tag_search_request(
             any_field=self.any_field,
             tag_name=self.tag_name,
             fandoms=self.fandoms,
@@ -93,49 +100,67 @@ class TagSearch:
         # Pull time for building tags
         c_time = datetime.now()
 
-        results = soup.find("ol", {"class": ("tag", "index", "group")})
-        # Fix the next thing probably
-        if results is None and soup.find("p", text="No results found. You may want to edit your search to make it less specific.") is not None:
+        rows, total_results = parse_tag_results(req.content)
+        if total_results == 0:
             self.results = []
             self.total_results = 0
             self.pages = 0
             return
 
-        tags = []
-        for tag in results.find_all("li"):
-               
-            canonical =  tag.find("span",{'class':'canonical'}) is not None
-            category, _, n_works = re.findall(r"([A-Za-z]+): (.+) \u200e\((\d+)\)",tag.find("span").getText())[0]
-            n_works = int(n_works)
-            
-            tag_name = tagname_from_href(tag.find("span").a['href'])
-            
-            # Add tag to cache, but dont load?
-            # Not sure if this is necessary or a good idea
-            # Doing it since we do it for works
-            c_tag = Tag(tag_name,load=False,session=self.session)
-            if not c_tag.loaded and not c_tag.query_error:
-                # Set what we do know, but don't update loaded status
-                setattr(c_tag,'canonical',canonical)
-                # need to add space to ArchiveWarning
-                if category == 'ArchiveWarning':
-                    setattr(c_tag,'category','Archive Warning')
-                else:
-                    setattr(c_tag,'category',category)
-            # Tags don't hold count info as of 2024-08-20
-            # I'd rather not include it there since you can't get that
-            # data from the Tag page itself, and you get different results]
-            # from the 'tag search' page and from filtering by works on that tag
-            # (probably due to unlisted/restricted works)
-            # IDK
-            setattr(c_tag,'works',n_works)
-            setattr(c_tag,'date_tag_search',c_time)
-            tags.append(c_tag)
-
-        self.results = tags
-        self.total_results = int(soup.find("h3",{"class":"heading"}).getText().replace(',','')[:-8])
+        # Tags don't hold count info as of 2024-08-20
+        # I'd rather not include it there since you can't get that
+        # data from the Tag page itself, and you get different results]
+        # from the 'tag search' page and from filtering by works on that tag
+        # (probably due to unlisted/restricted works)
+        # IDK
+        self.results = Tag._bulk_from_tag_search(rows, c_time, session=self.session)
+        self.total_results = total_results
         self.pages = min(ceil(self.total_results / 50),2000) # Pages cap out at 2000
 
+def parse_tag_results(content):
+    """Parses a tag search results page in a single lxml pass
+
+    Args:
+        content (bytes): Raw html of the results page
+
+    Returns:
+        tuple: (rows, total_results), where rows is a list of 
+        (tag name, category, canonical, number of works) tuples
+    """
+    
+    root = lxml.html.fromstring(content, parser=_HTML_PARSER)
+    results = root.xpath(_RESULTS_XPATH)
+    if not results:
+        return [], 0
+    
+    hrefs = []
+    rows = []
+    for li in results[0].iter("li"):
+        span = li.find(".//span")
+        if span is None:
+            continue
+        a = span.find(".//a")
+        match = _TAG_ROW_RE.search(span.text_content())
+        if a is None or match is None:
+            continue
+        category, _, n_works = match.groups()
+        # need to add space to ArchiveWarning
+        if category == "ArchiveWarning":
+            category = "Archive Warning"
+        canonical = len(li.xpath(_CANONICAL_XPATH)) > 0
+        hrefs.append(a.get("href"))
+        rows.append((category, canonical, int(n_works)))
+        
+    names = utils.tagnames_from_hrefs(hrefs)
+    rows = [(name,) + row for name, row in zip(names, rows)]
+    
+    heading = root.xpath(_HEADING_XPATH)
+    if heading:
+        total_results = int(heading[0].text_content().replace(',','')[:-8])
+    else:
+        total_results = len(rows)
+    return rows, total_results
+
 def tag_search(
     any_field="",
     tag_name = "",
@@ -162,6 +187,26 @@ def tag_search(
     Returns:
         bs4.BeautifulSoup: Search result's soup
     """
+    
+    req = _tag_search_request(any_field, tag_name, fandoms, page, category, canonical, sort_column, sort_direction, session)
+    soup = BeautifulSoup(req.content, features="lxml")
+    return soup
+
+def _tag_search_request(
+    any_field="",
+    tag_name = "",
+    fandoms="",
+    page=1,
+    category = "",
+    canonical = "",
+    sort_column="name",
+    sort_direction="asc",
+    session=None):
+    """Requests the results page for the search. Takes the same arguments as tag_search()
+
+    Returns:
+        requests.Response: Search result's response
+    """
 
     query = utils.Query()
     query.add_field(f"tag_search[query]={any_field if any_field != '' else ' '}")
@@ -205,5 +250,4 @@ def tag_search(
         req = session.get(url)
     if req.status_code == 429:
         raise utils.HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
-    soup = BeautifulSoup(req.content, features="lxml")
-    return soup
+    return req
@@ -0,0 +1,363 @@
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from . import threadable
+from .tag_search import TagSearch
+
+_MAGIC = b"AO3TU\x01"
+_NAME_RECORD = b"N"[0]
+_SAMPLE_RECORD = b"S"[0]
+
+
+def _encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+class TagUsageSeries:
+    """
+    Append-only time series of tag usage counts.
+
+    Samples are stored as (tag, timestamp, uses) in a compact binary file: tag names
+    are dictionary-coded and written once, and every sample is three varints
+    (tag id, epoch seconds, uses), so a sample usually takes less than 10 bytes.
+    The whole file is indexed in memory on load, so range queries are a binary search.
+    """
+
+    def __init__(self, path):
+        """Opens (or creates) a tag usage time series file
+
+        Args:
+            path (str): Path to the time series file
+
+        Raises:
+            ValueError: Raised if the file isn't a time series file, or is corrupted
+        """
+
+        self.path = path
+        self._names = []
+        self._ids = {}
+        self._timestamps = []
+        self._uses = []
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            self._read()
+        else:
+            with open(path, "wb") as file:
+                file.write(_MAGIC)
+
+    def __len__(self):
+        return sum(len(ts) for ts in self._timestamps)
+
+    def __contains__(self, tag):
+        return self._name(tag) in self._ids
+
+    def _read(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError(f"'{self.path}' is not a tag usage time series file")
+        pos = len(_MAGIC)
+        end = len(data)
+        while pos < end:
+            start = pos
+            kind = data[pos]
+            try:
+                if kind == _NAME_RECORD:
+                    length, pos = _decode_varint(data, pos+1)
+                    if pos + length > end:
+                        raise IndexError
+                    name = data[pos:pos+length]
+                    pos += length
+                elif kind == _SAMPLE_RECORD:
+                    tagid, pos = _decode_varint(data, pos+1)
+                    timestamp, pos = _decode_varint(data, pos)
+                    uses, pos = _decode_varint(data, pos)
+                else:
+                    raise ValueError(f"Corrupted record at byte {start} of '{self.path}'")
+            except IndexError:
+                # An interrupted append left a partial record at the end of the file
+                with open(self.path, "r+b") as file:
+                    file.truncate(start)
+                break
+            
+            if kind == _NAME_RECORD:
+                try:
+                    self._add_name(name.decode("utf-8"))
+                except UnicodeDecodeError:
+                    raise ValueError(f"Corrupted tag name at byte {start} of '{self.path}'") from None
+            else:
+                if tagid >= len(self._names):
+                    raise ValueError(f"Unknown tag id {tagid} at byte {start} of '{self.path}'")
+                self._insert(tagid, timestamp, uses)
+
+    @staticmethod
+    def _name(tag):
+        return tag if isinstance(tag, str) else tag.name
+
+    def _add_name(self, name):
+        self._ids[name] = len(self._names)
+        self._names.append(name)
+        self._timestamps.append(array("q"))
+        self._uses.append(array("q"))
+        return self._ids[name]
+
+    def _insert(self, tagid, timestamp, uses):
+        timestamps = self._timestamps[tagid]
+        if len(timestamps) == 0 or timestamps[-1] <= timestamp:
+            timestamps.append(timestamp)
+            self._uses[tagid].append(uses)
+        else:
+            index = bisect_right(timestamps, timestamp)
+            timestamps.insert(index, timestamp)
+            self._uses[tagid].insert(index, uses)
+
+    def extend(self, samples):
+        """Appends several samples to the time series with a single write
+
+        Args:
+            samples (iterable): Tuples of (tag, timestamp, uses). Tags can be Tag objects or names,
+            and timestamps can be datetime objects or epoch seconds.
+
+        Raises:
+            ValueError: Raised if a timestamp or a number of uses isn't a non-negative integer. Nothing is written then.
+        """
+
+        # Everything is encoded and written before the in-memory index is touched, so a sample
+        # that can't be encoded doesn't leave tag ids that the file doesn't know about
+        out = bytearray()
+        new_names = {}
+        records = []
+        for tag, timestamp, uses in samples:
+            name = self._name(tag)
+            timestamp = _to_epoch(timestamp)
+            for field, value in (("timestamp", timestamp), ("uses", uses)):
+                if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                    raise ValueError(f"Invalid {field} for '{name}': {value!r} (expected a non-negative integer)")
+            tagid = self._ids.get(name)
+            if tagid is None:
+                tagid = new_names.get(name)
+            if tagid is None:
+                tagid = new_names[name] = len(self._names) + len(new_names)
+                encoded = name.encode("utf-8")
+                out.append(_NAME_RECORD)
+                _encode_varint(len(encoded), out)
+                out += encoded
+            out.append(_SAMPLE_RECORD)
+            _encode_varint(tagid, out)
+            _encode_varint(timestamp, out)
+            _encode_varint(uses, out)
+            records.append((tagid, timestamp, uses))
+        with open(self.path, "ab") as file:
+            file.write(out)
+        for name in new_names:
+            self._add_name(name)
+        for record in records:
+            self._insert(*record)
+
+    def append(self, tag, timestamp, uses):
+        """Appends a single sample to the time series
+
+        Args:
+            tag (AO3.Tag/str): Tag or tag name
+            timestamp (datetime.datetime/int): When the sample was taken
+            uses (int): Number of works using the tag
+        """
+
+        self.extend(((tag, timestamp, uses),))
+
+    def tags(self):
+        """Returns the names of every tag in the time series"""
+        return self._names[:]
+
+    def query(self, tag, start=None, end=None):
+        """Returns the samples of a tag between start and end (inclusive)
+
+        Args:
+            tag (AO3.Tag/str): Tag or tag name
+            start (datetime.datetime/int, optional): Start of the range. Defaults to None (no bound).
+            end (datetime.datetime/int, optional): End of the range. Defaults to None (no bound).
+
+        Returns:
+            list: List of tuples (datetime, uses)
+        """
+
+        tagid = self._ids.get(self._name(tag))
+        if tagid is None:
+            return []
+        timestamps = self._timestamps[tagid]
+        uses = self._uses[tagid]
+        start = _to_epoch(start)
+        end = _to_epoch(end)
+        lo = 0 if start is None else bisect_left(timestamps, start)
+        hi = len(timestamps) if end is None else bisect_right(timestamps, end)
+        return [(datetime.fromtimestamp(timestamps[i]), uses[i]) for i in range(lo, hi)]
+
+    def latest(self, tag):
+        """Returns the most recent sample of a tag, or None if there isn't one"""
+
+        tagid = self._ids.get(self._name(tag))
+        if tagid is None or len(self._timestamps[tagid]) == 0:
+            return None
+        return datetime.fromtimestamp(self._timestamps[tagid][-1]), self._uses[tagid][-1]
+
+    def downsample(self, tag, interval, start=None, end=None):
+        """Returns one sample per time bucket, keeping the last sample of each bucket
+
+        Args:
+            tag (AO3.Tag/str): Tag or tag name
+            interval (int): Bucket size in seconds (e.g. 86400 for daily values)
+            start (datetime.datetime/int, optional): Start of the range. Defaults to None (no bound).
+            end (datetime.datetime/int, optional): End of the range. Defaults to None (no bound).
+
+        Returns:
+            list: List of tuples (datetime, uses)
+        """
+
+        samples = []
+        last_bucket = None
+        for date, uses in self.query(tag, start, end):
+            bucket = int(date.timestamp()) // interval
+            if bucket == last_bucket:
+                samples[-1] = (date, uses)
+            else:
+                samples.append((date, uses))
+                last_bucket = bucket
+        return samples
+
+    def compact(self, interval):
+        """Rewrites the file keeping only the last sample of each tag per time bucket.
+        The new file replaces the old one atomically.
+
+        Args:
+            interval (int): Bucket size in seconds
+        """
+
+        samples = []
+        for name in self._names:
+            samples.extend((name, date, uses) for date, uses in self.downsample(name, interval))
+
+        tmp_path = f"{self.path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        compacted = TagUsageSeries(tmp_path)
+        compacted.extend(samples)
+        os.replace(tmp_path, self.path)
+
+        self._names = compacted._names
+        self._ids = compacted._ids
+        self._timestamps = compacted._timestamps
+        self._uses = compacted._uses
+
+
+class TagUsageCollector:
+    """
+    Repeatedly sweeps the tag search (sorted by uses) and records the usage count
+    of every tag found in a TagUsageSeries, so that tag popularity can be tracked over time.
+    """
+
+    def __init__(self, series, fandoms=None, categories=None, canonical="", max_pages=None, session=None):
+        """Creates a new tag usage collector
+
+        Args:
+            series (TagUsageSeries/str): Time series (or path to the time series file) to append to
+            fandoms (list, optional): Fandoms to sweep. Each item is passed as TagSearch(fandoms=...). Defaults to None (all fandoms).
+            categories (list, optional): Tag categories to sweep (e.g. ["Relationship", "Freeform"]). Defaults to None (all categories).
+            canonical (bool, optional): If specified, only sweep canonical (True) or non-canonical (False) tags. Defaults to "".
+            max_pages (int, optional): Maximum number of result pages per sweep (50 tags each). Defaults to None (every page).
+            session (AO3.Session, optional): Session object. Defaults to None.
+        """
+
+        if isinstance(series, str):
+            series = TagUsageSeries(series)
+        self.series = series
+        self.fandoms = [""] if not fandoms else list(fandoms)
+        self.categories = [""] if not categories else list(categories)
+        self.canonical = canonical
+        self.max_pages = max_pages
+        self.session = session
+
+        self.sweeps = 0
+        self.last_sweep = None
+
+    def _sweep_search(self, fandoms, category):
+        n = 0
+        page = 1
+        pages = 1
+        while page <= pages:
+            search = TagSearch(
+                fandoms=fandoms,
+                category=category,
+                canonical=self.canonical,
+                page=page,
+                sort_column="uses",
+                sort_direction="desc",
+                session=self.session)
+            search.update()
+            if not search.results:
+                break
+            self.series.extend((tag.name, tag.date_tag_search, tag.works) for tag in search.results)
+            n += len(search.results)
+            pages = search.pages if self.max_pages is None else min(search.pages, self.max_pages)
+            page += 1
+        return n
+
+    @threadable.threadable
+    def sweep(self):
+        """Runs the tag search for every configured fandom and category, and records the usage counts.
+        This function is threadable.
+
+        Returns:
+            int: Number of samples recorded
+        """
+
+        n = 0
+        for fandoms in self.fandoms:
+            for category in self.categories:
+                n += self._sweep_search(fandoms, category)
+        self.sweeps += 1
+        self.last_sweep = datetime.now()
+        return n
+
+    @threadable.threadable
+    def run(self, interval, iterations=None):
+        """Sweeps every 'interval' seconds.
+        This function is threadable.
+
+        Args:
+            interval (int): Seconds between the start of two sweeps
+            iterations (int, optional): Number of sweeps. Defaults to None (run forever).
+        """
+
+        done = 0
+        while iterations is None or done < iterations:
+            start = time.time()
+            self.sweep()
+            done += 1
+            if iterations is not None and done >= iterations:
+                break
+            wait = interval - (time.time() - start)
+            if wait > 0:
+                time.sleep(wait)
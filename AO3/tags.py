@@ -142,6 +142,12 @@ class Tag:
             self.name = name
             self._cache[self.name] = self
         
+        self._init_fields(session)
+        
+        if load:
+            self.reload()
+
+    def _init_fields(self, session):
         self._session = session
         self._soup = None
         self.date_queried = None
@@ -151,8 +157,39 @@ class Tag:
         self.works = None
         self.date_tag_search = None
         
-        if load:
-            self.reload()
+    @classmethod
+    def _bulk_from_tag_search(cls, rows, date_tag_search, session=None):
+        """Gets or creates the (unloaded) tags of a tag search results page,
+        inserting every new tag into the cache under a single lock acquisition.
+
+        Args:
+            rows (list): Tuples of (tag name, category, canonical, number of works)
+            date_tag_search (datetime.datetime): When the tag search was made
+            session (AO3.Session, optional): Session object. Defaults to None.
+
+        Returns:
+            list: Tag objects, in the same order as rows
+        """
+        
+        tags = []
+        with cls._cache_lock:
+            for name, category, canonical, n_works in rows:
+                tag = cls._cache.get(name)
+                if tag is None:
+                    tag = super(Tag, cls).__new__(cls)
+                    tag.name = name
+                    tag._init_fields(session)
+                    cls._cache[name] = tag
+                else:
+                    cls._cache_counter += 1
+                if not tag.loaded and not tag.query_error:
+                    # Set what we do know, but don't update loaded status
+                    tag.canonical = canonical
+                    tag.category = category
+                tag.works = n_works
+                tag.date_tag_search = date_tag_search
+                tags.append(tag)
+        return tags
 
 
             
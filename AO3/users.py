@@ -4,8 +4,9 @@ from functools import cached_property
 import requests
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
+from . import pagination, threadable, utils
 from .common import get_work_from_banner
+from .pagination import ListingPaginator
 from .requester import requester
 
 
@@ -214,36 +215,32 @@ class User:
 
     @cached_property
     def _works_pages(self):
-        pages = self._soup_works.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
+        return pagination.page_count(self._soup_works)
     
-    def get_works(self, lite = True, use_threading=False):
+    def get_works(self, lite = True, use_threading=False, max_workers=4, timeout_sleep=60):
         """
         Get works authored by this user.
+        Pages are loaded concurrently (see AO3.pagination.ListingPaginator).
+
+        Args:
+            lite (bool, optional): Only load the work IDs and titles. Defaults to True.
+            use_threading (bool, optional): Load every page in its own thread. Defaults to False.
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+            timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
 
         Returns:
-            list: List of works
+            list: List of works (dict workid -> title if lite is True)
         """
         
         if self._works is None:
             if use_threading:
                 self.load_works_threaded()
             else:
-                if not lite: 
-                    self._works = []
-                    for page in range(self._works_pages):
-                        self._load_works(page=page+1)
-                else: 
-                    self._works = {}
-                    for page in range(self._works_pages):
-                        self._load_works_id(page=page+1)
+                paginator = ListingPaginator(
+                    f"https://archiveofourown.org/users/{self.username}/works?page={{page}}",
+                    pagination.work_id_titles if lite else _works_from_soup, self.request,
+                    1, self._works_pages, max_workers, timeout_sleep)
+                self._works = dict(paginator) if lite else list(paginator)
         return self._works
     
     @threadable.threadable
@@ -264,30 +261,11 @@ class User:
     def _load_works(self, page=1):
         from .works import Work
         self._soup_works = self.request(f"https://archiveofourown.org/users/{self.username}/works?page={page}")
-            
-        ol = self._soup_works.find("ol", {"class": "work index group"})
-
-        for work in ol.find_all("li", {"role": "article"}):
-            if work.h4 is None:
-                continue
-            self._works.append(get_work_from_banner(work))
+        self._works.extend(_works_from_soup(self._soup_works))
 
     def _load_works_id(self, page=1):
         url = f"https://archiveofourown.org/users/{self.username}/works?page={page}"
-        workPage = self.request(url)
-        worksRaw = workPage.find_all("li", {"role": "article"})
-    
-        for item in worksRaw:
-                # authors = []
-                workname = None
-                workid = None
-                for a in item.h4.find_all("a"):
-                    if a.attrs["href"].startswith("/works"):
-                        workname = str(a.string)
-                        workid = utils.workid_from_url(a["href"])
-                if workname != None and workid != None:
-                    # this seems sketchy:
-                    self._works[workid]= workname
+        self._works.update(pagination.work_id_titles(self.request(url)))
         
 
     @cached_property
@@ -304,19 +282,17 @@ class User:
 
     @cached_property
     def _bookmarks_pages(self):
-        pages = self._soup_bookmarks.find("ol",{"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.findAll("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-        return n
-
-    def get_bookmarks(self, use_threading=False):
+        return pagination.page_count(self._soup_bookmarks)
+
+    def get_bookmarks(self, use_threading=False, max_workers=4, timeout_sleep=60):
         """
-        Get this user's bookmarked works. Loads them if they haven't been previously
+        Get this user's bookmarked works. Loads them if they haven't been previously.
+        Pages are loaded concurrently (see AO3.pagination.ListingPaginator).
+
+        Args:
+            use_threading (bool, optional): Load every page in its own thread. Defaults to False.
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
+            timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
 
         Returns:
             list: List of works
@@ -326,9 +302,10 @@ class User:
             if use_threading:
                 self.load_bookmarks_threaded()
             else:
-                self._bookmarks = []
-                for page in range(self._bookmarks_pages):
-                    self._load_bookmarks(page=page+1)
+                paginator = ListingPaginator(
+                    f"https://archiveofourown.org/users/{self.username}/bookmarks?page={{page}}",
+                    _bookmarks_from_soup, self.request, 1, self._bookmarks_pages, max_workers, timeout_sleep)
+                self._bookmarks = list(paginator)
         return self._bookmarks
     
     @threadable.threadable
@@ -349,14 +326,7 @@ class User:
     def _load_bookmarks(self, page=1):
         from .works import Work
         self._soup_bookmarks = self.request(f"https://archiveofourown.org/users/{self.username}/bookmarks?page={page}")
-            
-        ol = self._soup_bookmarks.find("ol", {"class": "bookmark index group"})
-
-        for work in ol.find_all("li", {"role": "article"}):
-            authors = []
-            if work.h4 is None:
-                continue
-            self._bookmarks.append(get_work_from_banner(work))
+        self._bookmarks.extend(_bookmarks_from_soup(self._soup_bookmarks))
     
     @cached_property
     def bio(self):
@@ -429,3 +399,12 @@ class User:
             int: Amount of pages
         """
         return self._works_pages
+
+
+def _works_from_soup(soup):
+    ol = soup.find("ol", {"class": "work index group"})
+    return [get_work_from_banner(work) for work in ol.find_all("li", {"role": "article"}) if work.h4 is not None]
+
+def _bookmarks_from_soup(soup):
+    ol = soup.find("ol", {"class": "bookmark index group"})
+    return [get_work_from_banner(work) for work in ol.find_all("li", {"role": "article"}) if work.h4 is not None]
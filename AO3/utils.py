@@ -5,11 +5,8 @@ import warnings
 import queue
 from urllib.parse import unquote
 
-from bs4 import BeautifulSoup
-
-from .requester import requester
 from .common import url_join
-from .tags import Tag
+from .resource_index import ResourceIndex
 from concurrent import futures
 import time
 _FANDOMS = None
@@ -135,21 +132,24 @@ def word_count(text):
     
 def set_rqtw(value):
     """Sets the requests per time window parameter for the AO3 requester"""
+    from .requester import requester
     requester.setRQTW(value)
     
 def set_timew(value):
     """Sets the time window parameter for the AO3 requester"""
+    from .requester import requester
     requester.setTimeW(value)
         
 def limit_requests(limit=True):
     """Toggles request limiting"""
+    from .requester import requester
     if limit:
         requester.setRQTW(12)
     else:
         requester.setRQTW(-1)
     
-def load_fandoms():
-    """Loads fandoms into memory
+def build_fandom_index():
+    """Builds the fandom index from the downloaded fandom resources, and memory-maps it
 
     Raises:
         FileNotFoundError: No resource was found
@@ -160,11 +160,38 @@ def load_fandoms():
     fandom_path = os.path.join(os.path.dirname(__file__), "resources", "fandoms")
     if not os.path.isdir(fandom_path):
         raise FileNotFoundError("No fandom resources have been downloaded. Try AO3.extra.download()")
-    files = os.listdir(fandom_path)
-    _FANDOMS = []
-    for file in files:
+    fandoms = []
+    for file in os.listdir(fandom_path):
         with open(os.path.join(fandom_path, file), "rb") as f:
-            _FANDOMS += pickle.load(f)
+            fandoms += pickle.load(f)
+    if _FANDOMS is not None:
+        _FANDOMS.close()
+    _FANDOMS = ResourceIndex.build(fandoms, _fandom_index_path())
+    
+def _fandom_index_path():
+    return os.path.join(os.path.dirname(__file__), "resources", "fandoms.idx")
+    
+def load_fandoms():
+    """Memory-maps the fandom index, building it first if it's missing or older than the fandom resources
+
+    Raises:
+        FileNotFoundError: No resource was found
+    """
+    
+    global _FANDOMS
+    
+    fandom_path = os.path.join(os.path.dirname(__file__), "resources", "fandoms")
+    if not os.path.isdir(fandom_path):
+        raise FileNotFoundError("No fandom resources have been downloaded. Try AO3.extra.download()")
+    index_path = _fandom_index_path()
+    if os.path.exists(index_path):
+        built = os.path.getmtime(index_path)
+        if all(os.path.getmtime(os.path.join(fandom_path, file)) <= built for file in os.listdir(fandom_path)):
+            if _FANDOMS is not None:
+                _FANDOMS.close()
+            _FANDOMS = ResourceIndex(index_path)
+            return
+    build_fandom_index()
             
 def load_languages():
     """Loads languages into memory
@@ -188,29 +215,29 @@ def get_languages():
     """Returns all available languages"""
     return _LANGUAGES[:]
 
-def search_fandom(fandom_string):
-    """Searches for a fandom that matches the given string
+def search_fandom(fandom_string, prefix=False):
+    """Searches for a fandom that matches the given string (case-insensitive).
+    The fandom index is loaded on first use (see load_fandoms()).
 
     Args:
         fandom_string (str): query string
+        prefix (bool, optional): Only return fandoms that start with 'fandom_string'. Defaults to False.
 
     Raises:
-        UnloadedError: load_fandoms() wasn't called
+        FileNotFoundError: No resources were downloaded
         UnloadedError: No resources were downloaded
 
     Returns:
-        list: All results matching 'fandom_string'
+        list: All results matching 'fandom_string', in alphabetical order
     """
     
     if _FANDOMS is None:
-        raise UnloadedError("Did you forget to call AO3.utils.load_fandoms()?")
-    if _FANDOMS == []:
+        load_fandoms()
+    if len(_FANDOMS) == 0:
         raise UnloadedError("Did you forget to download the required resources with AO3.extra.download()?")
-    results = []
-    for fandom in _FANDOMS:
-        if fandom_string.lower() in fandom.lower():
-            results.append(fandom)
-    return results
+    if prefix:
+        return _FANDOMS.prefix(fandom_string)
+    return _FANDOMS.search(fandom_string)
         
 def workid_from_url(url):
     """Get the workid from an archiveofourown.org website url
@@ -276,10 +303,15 @@ def comment(commentable, comment_text, session, fullwork=False, commentid=None,
         requests.models.Response: Response object
     """
 
-    if commentable.authenticity_token is not None:
-        at = commentable.authenticity_token
-    else:
-        at = session.authenticity_token
+    # If the token was rejected, it's refreshed and the comment is posted once more
+    try:
+        return _post_comment(commentable, comment_text, session, fullwork, commentid, email, name, pseud,
+                             get_authenticity_token(commentable, session))
+    except AuthError:
+        return _post_comment(commentable, comment_text, session, fullwork, commentid, email, name, pseud,
+                             get_authenticity_token(commentable, session, refresh=True))
+
+def _post_comment(commentable, comment_text, session, fullwork, commentid, email, name, pseud, at):
     headers = {
         "x-requested-with": "XMLHttpRequest",
         "x-newrelic-id": "VQcCWV9RGwIJVFFRAw==",
@@ -357,10 +389,7 @@ def delete_comment(comment, session):
     if session is None or not session.is_authed:
         raise PermissionError("You don't have permission to do this")
     
-    if comment.authenticity_token is not None:
-        at = comment.authenticity_token
-    else:
-        at = session.authenticity_token
+    at = get_authenticity_token(comment, session)
     
     data = {
         "authenticity_token": at,
@@ -371,6 +400,7 @@ def delete_comment(comment, session):
     if req.status_code == 429:
         raise HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
     else:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(req.content, "lxml")
         if "auth error" in soup.title.getText().lower():
             raise AuthError("Invalid authentication token. Try calling session.refresh_auth_token()")
@@ -394,17 +424,14 @@ def kudos(work, session):
         bool: True if successful, False if you already left kudos there
     """
     
-    if work.authenticity_token is not None:
-        at = work.authenticity_token
-    else:
-        at = session.authenticity_token
+    at = get_authenticity_token(work, session)
     data = {
         "authenticity_token": at,
         "kudo[commentable_id]": work.id,
         "kudo[commentable_type]": "Work"
     }
     headers = {
-        "x-csrf-token": work.authenticity_token,
+        "x-csrf-token": at,
         "x-requested-with": "XMLHttpRequest",
         "referer": f"https://archiveofourown.org/work/{work.id}"
     }
@@ -448,10 +475,7 @@ def subscribe(subscribable, worktype, session, unsubscribe=False, subid=None):
     if session is None or not session.is_authed:
         raise AuthError("Invalid session")
     
-    if subscribable.authenticity_token is not None:
-        at = subscribable.authenticity_token
-    else:
-        at = session.authenticity_token
+    at = get_authenticity_token(subscribable, session)
     
     data = {
         "authenticity_token": at,
@@ -492,11 +516,15 @@ def bookmark(bookmarkable, session=None, notes="", tags=None, collections=None,
     if session == None or not session.is_authed:
         raise AuthError("Invalid session")
     
-    if bookmarkable.authenticity_token is not None:
-        at = bookmarkable.authenticity_token
-    else:
-        at = session.authenticity_token
-    
+    # If the token was rejected, it's refreshed and the bookmark is created once more
+    try:
+        _post_bookmark(bookmarkable, session, notes, tags, collections, private, recommend, pseud,
+                       get_authenticity_token(bookmarkable, session))
+    except AuthError:
+        _post_bookmark(bookmarkable, session, notes, tags, collections, private, recommend, pseud,
+                       get_authenticity_token(bookmarkable, session, refresh=True))
+
+def _post_bookmark(bookmarkable, session, notes, tags, collections, private, recommend, pseud, at):
     if tags is None: tags = []
     if collections is None: collections = []   
        
@@ -546,6 +574,7 @@ def handle_bookmark_errors(request):
             raise AuthError("Invalid authentication token. Try calling session.refresh_auth_token()")
     else:
         if request.status_code == 200:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(request.content, "lxml")
             error_div = soup.find("div", {"id": "error", "class": "error"})
             if error_div is None:
@@ -558,32 +587,87 @@ def handle_bookmark_errors(request):
 
         raise UnexpectedResponseError(f"Unexpected HTTP status code received ({request.status_code})")
 
+def get_authenticity_token(ao3object, session, refresh=False):
+    """Returns the authenticity token to take an action on an object with a session.
+    The object's own token is used if it was loaded with this session. Otherwise, the session's
+    token is used, and refreshed if it expired (see AO3.session.AuthCache).
+
+    Args:
+        ao3object (Work/Chapter/Series/Comment/...): AO3 object
+        session (AO3.Session/AO3.GuestSession): Session object
+        refresh (bool, optional): Refresh the session's token, e.g. because it was rejected. Defaults to False.
+
+    Returns:
+        str: Authenticity token
+    """
+
+    if not refresh and getattr(ao3object, "_session", None) is session:
+        token = getattr(ao3object, "authenticity_token", None)
+        if token is not None:
+            return token
+    cache = getattr(session, "auth_cache", None)
+    if cache is None:
+        # Session pickled before the cache existed
+        if refresh:
+            session.refresh_auth_token()
+    elif refresh or cache.token is None:
+        session.refresh_auth_token()
+    return session.authenticity_token
+
+def _parse_pseuds(soup):
+    pseud = soup.find("input", {"name": re.compile(".+\\[pseud_id\\]")})
+    if pseud is not None:
+        return None, pseud.attrs["value"]
+    pseud = soup.find("select", {"name": re.compile(".+\\[pseud_id\\]")})
+    if pseud is None:
+        return None
+    names = {}
+    default = None
+    for option in pseud.findAll("option"):
+        names.setdefault(option.string, option.attrs["value"])
+        if default is None and option.attrs.get("selected") == "selected":
+            default = option.attrs["value"]
+    return names, default
+
 def get_pseud_id(ao3object, session=None, specified_pseud=None):
+    """Returns the ID of one of the session user's pseuds.
+    The pseuds are read from the object's page (only requested if the object wasn't loaded with this
+    session) and cached in session.auth_cache, so they aren't looked up again for every action.
+
+    Args:
+        ao3object (Work/Chapter/Series): AO3 object with a comment or bookmark form
+        session (AO3.Session, optional): Session object. Defaults to the object's session.
+        specified_pseud (str, optional): Pseud name. Defaults to None (the default pseud).
+
+    Raises:
+        AuthError: Invalid session
+
+    Returns:
+        str: Pseud ID, or None if it wasn't found
+    """
+
     if session is None:
         session = ao3object.session
     if session is None or not session.is_authed:
         raise AuthError("Invalid session")
     
-    soup = session.request(ao3object.url)   
-    pseud = soup.find("input", {"name": re.compile(".+\\[pseud_id\\]")})
-    if pseud is None:
-        pseud = soup.find("select", {"name": re.compile(".+\\[pseud_id\\]")})
-        if pseud is None:
-            return None
-        pseud_id = None
-        if specified_pseud:
-            for option in pseud.findAll("option"):
-                if option.string == specified_pseud:
-                    pseud_id = option.attrs["value"]
-                    break
-        else:
-            for option in pseud.findAll("option"):
-                if "selected" in option.attrs and option.attrs["selected"] == "selected":
-                    pseud_id = option.attrs["value"]
-                    break
-    else:
-        pseud_id = pseud.attrs["value"]
-    return pseud_id
+    cache = getattr(session, "auth_cache", None)
+    pseuds = None if cache is None else cache.pseuds
+    if pseuds is None:
+        soup = getattr(ao3object, "_soup", None) if getattr(ao3object, "_session", None) is session else None
+        if hasattr(soup, "find"):
+            pseuds = _parse_pseuds(soup)
+        if pseuds is None:
+            pseuds = _parse_pseuds(session.request(ao3object.url))
+            if pseuds is None:
+                return None
+        if cache is not None:
+            cache.pseuds = pseuds
+    
+    names, default = pseuds
+    if names is not None and specified_pseud:
+        return names.get(specified_pseud)
+    return default
 
 def collect(collectable, session, collections):
     """Invites a work to a collection. Be careful, you can collect a work multiple times
@@ -598,10 +682,7 @@ def collect(collectable, session, collections):
     if session == None or not session.is_authed:
         raise AuthError("Invalid session")
     
-    if collectable.authenticity_token is not None:
-        at = collectable.authenticity_token
-    else:
-        at = session.authenticity_token
+    at = get_authenticity_token(collectable, session)
       
     if collections is None: collections = []   
     
@@ -618,6 +699,7 @@ def collect(collectable, session, collections):
         if req.headers["Location"] == AO3_AUTH_ERROR_URL:
             raise AuthError("Invalid authentication token. Try calling session.refresh_auth_token()")
     elif req.status_code == 200:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(req.content, "lxml")
         notice_div = soup.find("div", {"class": "notice"})
         
@@ -654,6 +736,9 @@ def tagname_from_urlext(url):
     
     return url.replace('*s*',r'/').replace('*a*',r'&').replace('*d*',r'.').replace('*q*',r'?').replace('*h*',r'#')
 
+_TAG_HREF_RE = re.compile(r"/tags/([^/]+)(?:/works)?")
+_TAG_HREF_LINES_RE = re.compile(r"/tags/([^/\n]+)")
+
 def tagname_from_href(url):
     # Do the following character substititions
     # '/' with '*s*'
@@ -661,7 +746,31 @@ def tagname_from_href(url):
     # '.' with *d*
     # '?' with *q*
     
-    return unquote(tagname_from_urlext(re.findall(r"/tags/([^/]+)(?:/works)?",url)[0]))
+    return unquote(tagname_from_urlext(_TAG_HREF_RE.findall(url)[0]))
+
+def tagnames_from_hrefs(urls):
+    """Decodes the tag names of several tag urls at once.
+    Equivalent to [tagname_from_href(url) for url in urls], but the pattern is
+    matched against all urls in a single call and repeated hrefs are only decoded once.
+
+    Args:
+        urls (list): Tag hrefs (e.g. "/tags/Fluff/works")
+
+    Returns:
+        list: Tag names, in the same order as urls
+    """
+    
+    exts = _TAG_HREF_LINES_RE.findall("\n".join(urls))
+    if len(exts) != len(urls):
+        return [tagname_from_href(url) for url in urls]
+    decoded = {}
+    names = []
+    for ext in exts:
+        name = decoded.get(ext)
+        if name is None:
+            name = decoded[ext] = unquote(tagname_from_urlext(ext))
+        names.append(name)
+    return names
 
 
 def get_inherited_tags(tag_list,parents=True,metatags=True,characters_from_relationships=False,max_workers=None,load_all=False):
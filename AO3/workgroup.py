@@ -2,11 +2,11 @@ from datetime import date
 from functools import cached_property
 import datetime
 import re
-import time
 from bs4 import BeautifulSoup
 
-from . import threadable, utils
+from . import pagination, threadable, utils
 from .common import get_work_from_banner
+from .pagination import ListingPaginator
 from .requester import requester
 from .users import User
 from .works import Work
@@ -131,92 +131,40 @@ class Workgroup:
 
     @cached_property
     def pages(self):
-        pages = self._soup.find("ol", {"aria-label": "Pagination"})
-        if pages is None:
-            return 1
-        n = 1
-        for li in pages.find_all("li"):
-            text = li.getText()
-            if text.isdigit():
-                n = int(text)
-
+        n = pagination.page_count(self._soup)
         if n > 10:
             print(f"WARNING: this group of works contains more than {(n-1)*20} items on {n} pages.")
         return n
 
 
     
-    def get_work_ids(self, hist_sleep=3, start_page=0, max_pages=None, timeout_sleep=60):
+    def get_work_ids(self, hist_sleep=None, start_page=0, max_pages=None, timeout_sleep=60, max_workers=4):
         """
+        Gets the IDs and titles of every work in this group.
+        Pages are loaded concurrently (see AO3.pagination.ListingPaginator).
+
         Arguments:
-            sleep (int): The time to wait between page requests
-            timeout_sleep (int): The time to wait after the rate limit is hit
+            hist_sleep (int, optional): Minimum number of seconds between two page requests. Defaults to None.
+            start_page (int, optional): Page to start on, zero-indexed. Defaults to 0.
+            max_pages (int, optional): Last page to load, zero-indexed. Defaults to None (every page).
+            timeout_sleep (int, optional): Maximum number of seconds to back off for after an HTTP error. If None, errors aren't retried. Defaults to 60.
+            max_workers (int, optional): Maximum number of pages being loaded at once. Defaults to 4.
 
         Returns:
-            works (list): All marked for later works
+            works (dict): workid -> title
         """
 
         if self._work_ids is None:
-
-          self._work_ids = {}
-          #self._pagecount = self.pages()
-
-
-          for page in range(start_page, self.pages):
-                print(f"Processing page {page+1} of {self.pages} pages.")
-                #print(str(page))
-                # If we are attempting to recover from errors then
-                # catch and loop, otherwise just call and go
-                if timeout_sleep is None:
-                  self._load_work_ids(page=page+1)
-
-                else:
-                    loaded=False
-                    while loaded == False:
-                        try:
-                            self._load_work_ids(page=page+1)
-                            print(f"Read marked-for-later page {page+1}")
-                            loaded = True
-
-                        except utils.HTTPError:
-                            print(f"Loading being rate limited, sleeping for {timeout_sleep} seconds")
-                            time.sleep(timeout_sleep)
-
-
-                  # Check for maximum history page load
-                if max_pages is not None and page >= max_pages:
-                    return self._work_ids 
-
-                # Again attempt to avoid rate limiter, sleep for a few
-                # seconds between page requests.
-                if hist_sleep is not None and hist_sleep > 0:
-                    print(f"Sleeping for {hist_sleep} seconds")
-                    time.sleep(hist_sleep)
-                    
-
+            last_page = self.pages if max_pages is None else min(self.pages, max_pages+1)
+            paginator = ListingPaginator(
+                f"{self.group_url}?page={{page}}", pagination.work_id_titles, self.request,
+                start_page+1, last_page, max_workers, timeout_sleep, hist_sleep)
+            self._work_ids = dict(paginator)
         return self._work_ids 
     
     def _load_work_ids(self, page=1):   
-        #url = f"{self.group_url}&page={page}"
         url = f"{self.group_url}?page={page}"
-        soup = self.request(url)
-        #all_works_soup = soup.find("ol", {"class": ["index", "group"]})
-        #works_soup = all_works_soup.find_all("li", {"role": "article"})
-        works_soup = soup.find_all("li", {"role": "article"})
-
-        #read_later = worksRaw.find("ol", {"class": "reading work index group"})
-
-        for item in works_soup:
-            # authors = []
-            workname = None
-            workid = None
-            for a in item.h4.find_all("a"):
-                if a.attrs["href"].startswith("/works"):
-                    workname = str(a.string)
-                    workid = utils.workid_from_url(a["href"])
-                    
-            if workname is not None and workid is not None:
-                self._work_ids[workid]= workname
+        self._work_ids.update(pagination.work_id_titles(self.request(url)))
 
     
     def get(self, *args, **kwargs):
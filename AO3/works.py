@@ -1,3 +1,4 @@
+import os
 import warnings
 from datetime import datetime
 from functools import cached_property
@@ -5,10 +6,9 @@ from functools import cached_property
 from bs4 import BeautifulSoup
 
 from . import threadable, utils, tags
-from .chapters import Chapter
-from .comments import Comment
+from .chapters import Chapter, LazyChapterList
+from .comments import iter_comments
 from .requester import requester
-from .users import User
 
 from .utils import tagname_from_href
 
@@ -19,7 +19,7 @@ class Work:
     AO3 work object
     """
 
-    def __init__(self, workid, session=None, load=True, load_chapters=True):
+    def __init__(self, workid, session=None, load=True, load_chapters=True, metadata_only=False, lazy_chapters=False):
         """Creates a new AO3 work object
 
         Args:
@@ -27,6 +27,8 @@ class Work:
             session (AO3.Session, optional): Used to access restricted works
             load (bool, optional): If true, the work is loaded on initialization. Defaults to True.
             load_chapters (bool, optional): If false, chapter text won't be parsed, and Work.load_chapters() will have to be called. Defaults to True.
+            metadata_only (bool, optional): If true, only the first chapter's page is requested (see Work.reload). Defaults to False.
+            lazy_chapters (bool, optional): If true, chapters are loaded one at a time when needed (see Work.reload). Defaults to False.
 
         Raises:
             utils.InvalidIdError: Raised if the work wasn't found
@@ -35,16 +37,19 @@ class Work:
         self._snippet_list = None
 
         self._session = session
-        self.chapters = []
+        self._chapters = []
         self.id = workid
         self._soup = None
+        self._metadata_only = False
+        self._deferred_chapters = False
         
         self.date_queried = None
         
         self.MAX_WORKERS = None
+        self.MAX_LOADED_CHAPTERS = 16
         
         if load:
-            self.reload(load_chapters)
+            self.reload(load_chapters, metadata_only=metadata_only, lazy_chapters=lazy_chapters)
             
     def __repr__(self):
         try:
@@ -74,15 +79,48 @@ class Work:
                 self.__dict__[attr] = BeautifulSoup(value, "lxml")
             else:
                 self.__dict__[attr] = value
+        # Works pickled before chapters became a property
+        if "chapters" in self.__dict__:
+            self.__dict__["_chapters"] = self.__dict__.pop("chapters")
+        self.__dict__.setdefault("_metadata_only", False)
+        self.__dict__.setdefault("_deferred_chapters", False)
+        
+    @classmethod
+    def load_many(cls, ids, session=None, load_chapters=True, max_workers=4, retry=None, progress=None, metadata_only=False):
+        """Loads many works concurrently with a bounded pool of workers.
+        Works are yielded as soon as they are loaded, so results don't follow the order of 'ids'.
+
+        Args:
+            ids (iterable): Work IDs to load
+            session (AO3.Session, optional): Session used for every work. Defaults to None.
+            load_chapters (bool, optional): Also extract the chapters of every work. Defaults to True.
+            max_workers (int, optional): Maximum number of works being loaded at once. Defaults to 4.
+            retry (AO3.pagination.RetryPolicy, optional): How to retry rate-limit errors. Defaults to 5 retries with exponential backoff.
+            progress (callable, optional): Called with a dictionary of progress stats after every work. Defaults to None.
+            metadata_only (bool, optional): Only request the first chapter's page of every work (see Work.reload). Defaults to False.
+
+        Returns:
+            AO3.bulk.BulkLoader: Iterable of (workid, work, error) tuples, where either work or error is None
+        """
+        
+        from .bulk import BulkLoader
+        return BulkLoader(ids, session, load_chapters, max_workers, retry, progress, metadata_only)
         
     @threadable.threadable
-    def reload(self, load_chapters=False, load_chapter_dates = False):
+    def reload(self, load_chapters=False, load_chapter_dates = False, metadata_only=False, lazy_chapters=False):
         """
         Loads information about this work.
         This function is threadable.
         
         Args:
             load_chapters (bool, optional): If false, chapter text won't be parsed, and Work.load_chapters() will have to be called. Defaults to True.
+            metadata_only (bool, optional): If true, only the first chapter's page is requested instead of the full work,
+            which is enough for the stats, tags and other metadata. The full work is requested the first time chapters
+            or text are needed: if load_chapters is true, the first time Work.chapters is accessed, otherwise when
+            Work.load_chapters() is called or the text is needed. Defaults to False.
+            lazy_chapters (bool, optional): If true, only the first chapter's page and the chapter index are requested, and
+            Work.chapters becomes an AO3.chapters.LazyChapterList: every chapter's page is requested the first time its
+            text is needed, and at most Work.MAX_LOADED_CHAPTERS of them are kept in memory. Defaults to False.
         """
         
         for attr in self.__class__.__dict__:
@@ -90,10 +128,20 @@ class Work:
                 if attr in self.__dict__:
                     delattr(self, attr)
         
-        self._soup = self.request(f"https://archiveofourown.org/works/{self.id}?view_adult=true&view_full_work=true")
+        self._chapters = []
+        partial = metadata_only or lazy_chapters
+        if partial:
+            self._soup = self.request(f"https://archiveofourown.org/works/{self.id}?view_adult=true")
+        else:
+            self._soup = self.request(f"https://archiveofourown.org/works/{self.id}?view_adult=true&view_full_work=true")
         if "Error 404" in self._soup.find("h2", {"class", "heading"}).text:
             raise utils.InvalidIdError("Cannot find work")
-        if load_chapters:
+        # The first chapter's page already is the full work if there's only one chapter
+        self._metadata_only = partial and self.nchapters > 1
+        self._deferred_chapters = load_chapters
+        if lazy_chapters and self._metadata_only:
+            self._load_chapter_index()
+        elif load_chapters and not self._metadata_only:
             self.load_chapters() 
             
         if load_chapter_dates:
@@ -109,11 +157,170 @@ class Work:
         """
         
         self._session = session 
+        
+    def get_sync_state(self):
+        """Returns a record of this work's chapters, to be passed to Work.sync later.
+        It only holds strings, numbers and lists, so it can be stored with the rest of a work's data (e.g. as json).
+        Fingerprints are only included for chapters whose text has been loaded.
+
+        Raises:
+            utils.UnloadedError: Raised if the work isn't loaded
+
+        Returns:
+            dict: "date_edited" (str), "nchapters" (int) and "chapters" (list of [chapter id, date, fingerprint])
+        """
+        
+        if not self.loaded:
+            raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
+        try:
+            date_edited = str(self.date_edited)
+        except (AttributeError, TypeError, ValueError):
+            date_edited = None
+            
+        chapters = []
+        dates = self.chapter_dates if self.nchapters > 1 else [self.date_published]
+        for chapter, date in zip(self.chapters, dates):
+            if "fingerprint" in chapter.__dict__ or chapter.loaded:
+                fingerprint = chapter.fingerprint
+            else:
+                fingerprint = None
+            chapters.append([chapter.id, None if date is None else str(date), fingerprint])
+        return {"date_edited": date_edited, "nchapters": self.nchapters, "chapters": chapters}
+    
+    @threadable.threadable
+    def sync(self, state=None, check_edits=False):
+        """Refreshes this work, requesting only the chapters that were added or changed since the last load.
+        The work's page and its chapter index are requested, and a chapter's page is only requested if the chapter
+        is new or its date changed; the fingerprints of those chapters tell whether their text was actually edited.
+        Afterwards, Work.chapters is an AO3.chapters.LazyChapterList (see Work.reload), and unchanged chapters that
+        were already in memory are kept.
+        This function is threadable.
+
+        Args:
+            state (dict, optional): Record from Work.get_sync_state. Defaults to None (the current state of this work).
+            check_edits (bool, optional): If the work was edited, also request the full work once and compare the
+            fingerprints of every other chapter. Defaults to False.
+
+        Returns:
+            dict: "new" and "edited" (lists of chapters), and "removed" (list of chapter ids).
+            Chapters that were compared against a record without a fingerprint count as edited.
+        """
+        
+        if state is None:
+            if not self.loaded:
+                self.reload(True)
+                return {"new": list(self.chapters), "edited": [], "removed": []}
+            state = self.get_sync_state()
+        previous_chapters = self._chapters
+        previous = {chapter.id: chapter for chapter in previous_chapters if chapter.loaded}
+        old = {id_: (date, fingerprint) for id_, date, fingerprint in state["chapters"]}
+        
+        self.reload(metadata_only=True)
+        try:
+            date_edited = str(self.date_edited)
+        except (AttributeError, TypeError, ValueError):
+            date_edited = None
+        edited = state["date_edited"] is None or date_edited != state["date_edited"]
+        if self.nchapters <= 1:
+            # The work's page holds the whole work
+            self.load_chapters()
+            changes = {"new": [], "edited": [], "removed": [id_ for id_ in old if id_ is not None]}
+            for chapter in self.chapters:
+                if None not in old:
+                    changes["new"].append(chapter)
+                elif old[None][1] != chapter.fingerprint:
+                    changes["edited"].append(chapter)
+            return changes
+        
+        if not edited and not check_edits and self.nchapters == state["nchapters"] and isinstance(previous_chapters, LazyChapterList):
+            self.chapters = previous_chapters
+            return {"new": [], "edited": [], "removed": []}
+        
+        self._load_chapter_index()
+        changes = {"new": [], "edited": [], "removed": []}
+        unchanged = []
+        for chapter, date in zip(self.chapters, self.chapters.dates):
+            date = None if date is None else str(date)
+            if chapter.id not in old:
+                changes["new"].append(chapter)
+            elif date != old[chapter.id][0]:
+                changes["edited"].append(chapter)
+            else:
+                if chapter.id in previous:
+                    self.chapters.set_page(chapter, previous[chapter.id]._soup)
+                    if "fingerprint" in previous[chapter.id].__dict__:
+                        chapter.fingerprint = previous[chapter.id].fingerprint
+                unchanged.append(chapter)
+        ids = set(chapter.id for chapter in self.chapters)
+        changes["removed"] = [id_ for id_ in old if id_ not in ids]
+        
+        for chapter in changes["edited"]:
+            self.chapters.load(chapter)
+        changes["edited"] = [chapter for chapter in changes["edited"] if chapter.fingerprint != old[chapter.id][1]]
+        for chapter in changes["new"]:
+            self.chapters.load(chapter)
+            
+        if check_edits and edited:
+            self._load_full_work()
+            for chapter in unchanged:
+                page = self._soup.find("div", {"id": f"chapter-{chapter.number}"})
+                if page is None:
+                    continue
+                chapter._unload()
+                if "fingerprint" in chapter.__dict__:
+                    del chapter.fingerprint
+                self.chapters.set_page(chapter, page)
+                if chapter.fingerprint != old[chapter.id][1]:
+                    changes["edited"].append(chapter)
+        return changes
+
+    def _load_full_work(self):
+        """Replaces the page of a metadata-only load with the full work and loads its chapters, unless they are lazy"""
+        
+        if not self._metadata_only:
+            return
+        self._soup = self.request(f"https://archiveofourown.org/works/{self.id}?view_adult=true&view_full_work=true")
+        self._metadata_only = False
+        if "end_notes" in self.__dict__:
+            del self.end_notes
+        if not isinstance(self._chapters, LazyChapterList):
+            self.load_chapters()
+            
+    def _load_chapter_index(self):
+        """Replaces the chapters with a LazyChapterList, reusing the first chapter from the current page"""
+        
+        self.chapters = LazyChapterList(self, self.MAX_LOADED_CHAPTERS)
+        chapters_div = self._soup.find(attrs={"id": "chapters"})
+        if chapters_div is not None and len(self.chapters) > 0:
+            chapter = chapters_div.find("div", {"class": "chapter"})
+            self.chapters.set_page(self.chapters[0], chapters_div if chapter is None else chapter)
+            
+    def _ensure_chapters(self):
+        if self._metadata_only and not isinstance(self._chapters, LazyChapterList):
+            self._load_full_work()
+            
+    @property
+    def chapters(self):
+        """This work's chapters. After a metadata-only load (see Work.reload), the full work is requested the first time
+        they're accessed, unless the work was loaded with load_chapters=False"""
+        
+        if self._metadata_only and self._deferred_chapters and not isinstance(self._chapters, LazyChapterList):
+            self._load_full_work()
+        return self._chapters
+    
+    @chapters.setter
+    def chapters(self, value):
+        self._chapters = value
 
     def load_chapters(self):
         """Loads chapter objects for each one of this work's chapters
         """
         
+        if self._metadata_only:
+            self._chapters = []
+            self._load_full_work()
+            return
+        
         self.chapters = []
         chapters_div = self._soup.find(attrs={"id": "chapters"})
         if chapters_div is None:
@@ -155,6 +362,7 @@ class Work:
         if not self.loaded:
             raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
         
+        self._ensure_chapters()
         chapters = {}
         for chapter in self.chapters:
             images = chapter.get_images()
@@ -177,36 +385,118 @@ class Work:
             bytes: File content
         """
         
-        if not self.loaded:
-            raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
-        download_btn = self._soup.find("li", {"class": "download"})
-        for download_type in download_btn.findAll("li"):
-            if download_type.a.getText() == filetype.upper():
-                url = f"https://archiveofourown.org/{download_type.a.attrs['href']}"
-                req = self.get(url)
-                if req.status_code == 429:
-                    raise utils.HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
-                if not req.ok:
-                    raise utils.DownloadError("An error occurred while downloading the work")
-                return req.content
-        raise utils.UnexpectedResponseError(f"Filetype '{filetype}' is not available for download")
+        req = self.get(self._download_url(filetype))
+        if not req.ok:
+            raise utils.DownloadError("An error occurred while downloading the work")
+        return req.content
     
     @threadable.threadable
-    def download_to_file(self, filename, filetype="PDF"):
+    def download_to_file(self, filename, filetype="PDF", chunk_size=65536, resume=True):
         """Downloads this work and saves it in the specified file.
+        The file is written in chunks as they arrive, into 'filename.part', which is renamed to 'filename' once
+        its size has been checked. If a previous download was interrupted, it is resumed from where it stopped,
+        as long as the export hasn't changed since (checked with its ETag or Last-Modified date).
         This function is threadable.
 
         Args:
             filename (str): Name of the resulting file
             filetype (str, optional): Desired filetype. Defaults to "PDF".
             Known filetypes are: AZW3, EPUB, HTML, MOBI, PDF.
+            chunk_size (int, optional): Number of bytes written at a time. Defaults to 65536.
+            resume (bool, optional): Continue an interrupted download instead of starting over. Defaults to True.
 
         Raises:
-            utils.DownloadError: Raised if there was an error with the download
+            utils.DownloadError: Raised if there was an error with the download, or the file is incomplete
             utils.UnexpectedResponseError: Raised if the filetype is not available for download
+
+        Returns:
+            int: Size of the file, in bytes
         """
-        with open(filename, "wb") as file:
-            file.write(self.download(filetype))
+        
+        url = self._download_url(filetype)
+        partname = f"{filename}.part"
+        # ETag or Last-Modified of the export the part file was taken from
+        validatorname = f"{partname}.validator"
+        offset = os.path.getsize(partname) if resume and os.path.exists(partname) else 0
+        validator = None
+        if offset > 0 and os.path.exists(validatorname):
+            with open(validatorname, encoding="utf-8") as file:
+                validator = file.read().strip() or None
+        if validator is None:
+            # Without a validator there's no way of knowing if the export changed since, so start over
+            offset = 0
+        
+        # Compressed transfers would make Content-Length useless for checking the size
+        headers = {"Accept-Encoding": "identity"}
+        if offset > 0:
+            # If the export changed, the server ignores the range and sends the whole new file
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        req = self.get(url, headers=headers, stream=True)
+        try:
+            if req.status_code == 416:
+                # The part file already holds the whole export
+                size = req.headers.get("Content-Range", "").rpartition("/")[2]
+                if not size.isdigit() or int(size) != offset:
+                    raise utils.DownloadError("An error occurred while downloading the work")
+                expected = offset
+            elif not req.ok:
+                raise utils.DownloadError("An error occurred while downloading the work")
+            else:
+                if req.status_code != 206:
+                    offset = 0
+                    self._save_validator(req, validatorname)
+                length = req.headers.get("Content-Length")
+                expected = offset + int(length) if length is not None and length.isdigit() else None
+                with open(partname, "ab" if offset > 0 else "wb") as file:
+                    for chunk in req.iter_content(chunk_size):
+                        file.write(chunk)
+        finally:
+            req.close()
+            
+        size = os.path.getsize(partname)
+        if expected is not None and size != expected:
+            raise utils.DownloadError(f"Incomplete download ({size} of {expected} bytes)")
+        os.replace(partname, filename)
+        if os.path.exists(validatorname):
+            os.remove(validatorname)
+        return size
+    
+    @staticmethod
+    def _save_validator(req, validatorname):
+        # Weak ETags can't be used in If-Range, so Last-Modified is used instead
+        etag = req.headers.get("ETag")
+        validator = etag if etag and not etag.startswith("W/") else req.headers.get("Last-Modified")
+        if validator:
+            with open(validatorname, "w", encoding="utf-8") as file:
+                file.write(validator)
+        elif os.path.exists(validatorname):
+            os.remove(validatorname)
+    
+    def _download_url(self, filetype):
+        if not self.loaded:
+            raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
+        url = self.download_links.get(filetype.upper())
+        if url is None:
+            raise utils.UnexpectedResponseError(f"Filetype '{filetype}' is not available for download")
+        return url
+    
+    @cached_property
+    def download_links(self):
+        """Download URLs of this work
+        
+        Returns:
+            dict: key = filetype (e.g. "PDF"); value = url
+        """
+        
+        links = {}
+        download_btn = self._soup.find("li", {"class": "download"})
+        if download_btn is None:
+            return links
+        for download_type in download_btn.findAll("li"):
+            if download_type.a is not None:
+                links[download_type.a.getText()] = f"https://archiveofourown.org/{download_type.a.attrs['href']}"
+        return links
             
     @property
     def metadata(self):
@@ -262,73 +552,52 @@ class Work:
         except AttributeError:
             pass
         try:
+            self._ensure_chapters()
             metadata["chapter_titles"] = list(map(lambda chapter: chapter.title, self.chapters))
         except AttributeError:
             pass
 
         return metadata
     
-    def get_comments(self, maximum=None):
+    def get_comments(self, maximum=None, max_workers=4):
         """Returns a list of all threads of comments in the work. This operation can take a very long time.
         Because of that, it is recomended that you set a maximum number of comments. 
-        Duration: ~ (0.13 * n_comments) seconds or 2.9 seconds per comment page
+        Comment pages after the first one are fetched concurrently, so the duration scales with the
+        request rate allowed by the rate limiter rather than with the ~2.9 seconds per comment page.
 
         Args:
             maximum (int, optional): Maximum number of comments to be returned. None -> No maximum
+            max_workers (int, optional): Maximum number of comment pages being fetched at once. Defaults to 4.
 
         Raises:
-            ValueError: Invalid chapter number
-            IndexError: Invalid chapter number
             utils.UnloadedError: Work isn't loaded
 
         Returns:
             list: List of comments
         """
         
+        return list(self.iter_comments(maximum, max_workers))
+    
+    def iter_comments(self, maximum=None, max_workers=4):
+        """Returns a generator that yields the comment threads of this work as their pages arrive.
+        Stops requesting pages once 'maximum' comments have been yielded.
+
+        Args:
+            maximum (int, optional): Maximum number of comments to be returned. None -> No maximum
+            max_workers (int, optional): Maximum number of comment pages being fetched at once. Defaults to 4.
+
+        Raises:
+            utils.UnloadedError: Work isn't loaded
+
+        Returns:
+            generator: The generator object
+        """
+        
         if not self.loaded:
             raise utils.UnloadedError("Work isn't loaded. Have you tried calling Work.reload()?")
             
         url = f"https://archiveofourown.org/works/{self.id}?page=%d&show_comments=true&view_adult=true&view_full_work=true"
-        soup = self.request(url%1)
-        
-        pages = 0
-        div = soup.find("div", {"id": "comments_placeholder"})
-        ol = div.find("ol", {"class": "pagination actions"})
-        if ol is None:
-            pages = 1
-        else:
-            for li in ol.findAll("li"):
-                if li.getText().isdigit():
-                    pages = int(li.getText())   
-        
-        comments = []
-        for page in range(pages):
-            if page != 0:
-                soup = self.request(url%(page+1))
-            ol = soup.find("ol", {"class": "thread"})
-            for li in ol.findAll("li", {"role": "article"}, recursive=False):
-                if maximum is not None and len(comments) >= maximum:
-                    return comments
-                id_ = int(li.attrs["id"][8:])
-                
-                header = li.find("h4", {"class": ("heading", "byline")})
-                if header is None or header.a is None:
-                    author = None
-                else:
-                    author = User(str(header.a.text), self._session, False)
-                    
-                if li.blockquote is not None:
-                    text = li.blockquote.getText()
-                else:
-                    text = ""                  
-                
-                comment = Comment(id_, self, session=self._session, load=False)           
-                setattr(comment, "authenticity_token", self.authenticity_token)
-                setattr(comment, "author", author)
-                setattr(comment, "text", text)
-                comment._thread = None
-                comments.append(comment)
-        return comments
+        return iter_comments(self, url, maximum, max_workers)
     
     @threadable.threadable
     def subscribe(self):
@@ -364,11 +633,31 @@ class Work:
     def text(self):
         """This work's text"""
         
-        text = ""
+        return self._text_layout[0]
+    
+    @cached_property
+    def text_offsets(self):
+        """Where each chapter's text is in Work.text
+        
+        Returns:
+            list: (start, end) tuples, one per chapter, such that Work.text[start:end] == chapter.text
+        """
+        
+        return self._text_layout[1]
+    
+    @cached_property
+    def _text_layout(self):
+        self._ensure_chapters()
+        fragments = []
+        offsets = []
+        position = 0
         for chapter in self.chapters:
-            text += chapter.text
-            text += "\n"
-        return text
+            text = chapter.text
+            offsets.append((position, position + len(text)))
+            fragments.append(text)
+            fragments.append("\n")
+            position += len(text) + 1
+        return "".join(fragments), offsets
         
     @cached_property
     def authenticity_token(self):
@@ -907,6 +1196,7 @@ class Work:
     @cached_property
     def end_notes(self):
         """Text from this work's end notes"""
+        self._load_full_work()
         notes = self._soup.find("div", {"id": "work_endnotes"})
         if notes is None:
             return ""
@@ -960,6 +1250,8 @@ class Work:
         else:
             req = requester.request("get", *args, **kwargs, session=self._session.session)
         if req.status_code == 429:
+            # Streamed responses hold on to their pooled connection until they're closed
+            req.close()
             raise utils.HTTPError("We are being rate-limited. Try again in a while or reduce the number of requests")
         return req
 
@@ -1045,8 +1337,10 @@ class Work:
     
     @cached_property
     def chapter_dates(self):
+        if isinstance(self.chapters, LazyChapterList):
+            return list(self.chapters.dates)
         temp_soup = self.request(f"https://archiveofourown.org/works/{self.id}/navigate?view_adult=true&view_full_work=true")
-        if "Error 404" in self._soup.find("h2", {"class", "heading"}).text:
+        if "Error 404" in temp_soup.find("h2", {"class", "heading"}).text:
             raise utils.InvalidIdError("Cannot find work")
-        dts = self._soup.find("ol", {"class":"chapter index group"}).find_all("span",{"class":"datetime"})
+        dts = temp_soup.find("ol", {"class":"chapter index group"}).find_all("span",{"class":"datetime"})
         return [datetime(*list(map(int, dp.text[1:-1].split("-")))) for dp in dts]
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Measures how long 'import AO3' takes for a few common entry points, each in a fresh interpreter.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--max-ms MS]
+
+For every scenario it prints the best wall time over N runs and whether any heavy dependency
+(bs4, lxml, requests, ratelimit, backoff) got imported. With --max-ms, it exits with status 1
+if the plain 'import AO3' scenario is slower than that or imports a heavy dependency.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HEAVY = ("bs4", "lxml", "requests", "ratelimit", "backoff")
+
+SCENARIOS = {
+    "import AO3": "import AO3",
+    "AO3.utils.workid_from_url": "import AO3; AO3.utils.workid_from_url('https://archiveofourown.org/works/1')",
+    "AO3.serialization": "import AO3; AO3.serialization.VERSION",
+    "AO3.Work": "import AO3; AO3.Work",
+}
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure(code, runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get("PYTHONPATH")))))
+    best = None
+    heavy = ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(code=code, heavy=HEAVY)],
+            check=True, capture_output=True, text=True, env=env).stdout.split()
+        elapsed = float(output[0])
+        heavy = output[1] if len(output) > 1 else ""
+        best = elapsed if best is None else min(best, elapsed)
+    return best, heavy
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="runs per scenario (the best one is reported)")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if 'import AO3' takes longer than this")
+    args = parser.parse_args()
+
+    failed = False
+    for name, code in SCENARIOS.items():
+        best, heavy = measure(code, args.runs)
+        print(f"{name:<30} {best*1000:8.2f} ms   heavy imports: {heavy or '-'}")
+        if name == "import AO3" and args.max_ms is not None and (best*1000 > args.max_ms or heavy):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())